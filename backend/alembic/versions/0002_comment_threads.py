@@ -0,0 +1,61 @@
+"""comment threads
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Every existing comment is top-level, so its path is just its own id,
+# zero-padded to the 10 digits models.comment_path_segment() uses
+BACKFILL_PATHS = {
+    "sqlite": "UPDATE comments SET path = printf('%010d', id) WHERE path IS NULL",
+    "postgresql": "UPDATE comments SET path = lpad(CAST(id AS TEXT), 10, '0') WHERE path IS NULL",
+}
+
+def _parent_fk_name() -> str:
+    # Matches what 0008 expects: batch mode's naming convention on SQLite,
+    # PostgreSQL's default name elsewhere
+    if op.get_context().dialect.name == "sqlite":
+        return "fk_comments_parent_id_comments"
+    return "comments_parent_id_fkey"
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('path', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('depth', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(_parent_fk_name(), 'comments', ['parent_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_comments_parent_id'), ['parent_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_comments_path'), ['path'], unique=False)
+        batch_op.create_index('ix_comments_piece_parent_created', ['piece_id', 'parent_id', 'created_at'], unique=False)
+
+    backfill = BACKFILL_PATHS.get(op.get_context().dialect.name)
+    if backfill:
+        op.execute(backfill)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_piece_parent_created')
+        batch_op.drop_index(batch_op.f('ix_comments_path'))
+        batch_op.drop_index(batch_op.f('ix_comments_parent_id'))
+        batch_op.drop_constraint(_parent_fk_name(), type_='foreignkey')
+        batch_op.drop_column('parent_id')
+        batch_op.drop_column('reply_count')
+        batch_op.drop_column('depth')
+        batch_op.drop_column('path')
@@ -0,0 +1,42 @@
+"""piece coordinates
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 09:13:02.640127
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from app import geo
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('pieces', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.create_index('ix_pieces_lat_lng', ['latitude', 'longitude'], unique=False)
+
+    # R-tree (SQLite) or PostGIS GiST index for map queries
+    if context.is_offline_mode():
+        for statement in geo.spatial_index_ddl(op.get_context().dialect.name):
+            op.execute(statement)
+    else:
+        geo.create_spatial_index(op.get_bind())
+
+
+def downgrade() -> None:
+    geo.drop_spatial_index(op.get_bind())
+
+    with op.batch_alter_table('pieces', schema=None) as batch_op:
+        batch_op.drop_index('ix_pieces_lat_lng')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,45 @@
+"""image hashes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 09:13:21.905512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing pieces keep a NULL hash and are left out of duplicate checks
+    with op.batch_alter_table('pieces', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_hash', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('hash_chunk_0', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('hash_chunk_1', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('hash_chunk_2', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('hash_chunk_3', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_pieces_hash_chunk_0'), ['hash_chunk_0'], unique=False)
+        batch_op.create_index(batch_op.f('ix_pieces_hash_chunk_1'), ['hash_chunk_1'], unique=False)
+        batch_op.create_index(batch_op.f('ix_pieces_hash_chunk_2'), ['hash_chunk_2'], unique=False)
+        batch_op.create_index(batch_op.f('ix_pieces_hash_chunk_3'), ['hash_chunk_3'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('pieces', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pieces_hash_chunk_3'))
+        batch_op.drop_index(batch_op.f('ix_pieces_hash_chunk_2'))
+        batch_op.drop_index(batch_op.f('ix_pieces_hash_chunk_1'))
+        batch_op.drop_index(batch_op.f('ix_pieces_hash_chunk_0'))
+        batch_op.drop_column('hash_chunk_3')
+        batch_op.drop_column('hash_chunk_2')
+        batch_op.drop_column('hash_chunk_1')
+        batch_op.drop_column('hash_chunk_0')
+        batch_op.drop_column('image_hash')
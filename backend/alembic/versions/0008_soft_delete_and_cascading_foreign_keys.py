@@ -0,0 +1,101 @@
+"""soft delete and cascading foreign keys
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 23:40:48.107981
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from app import geo
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Foreign keys that move to ON DELETE CASCADE: table -> [(column, referred table)]
+CASCADING_FKS = {
+    "activity_events": [("recipient_id", "users"), ("actor_id", "users"), ("piece_id", "pieces"), ("comment_id", "comments")],
+    "comments": [("author_id", "users"), ("piece_id", "pieces"), ("parent_id", "comments")],
+    "competition_entries": [("piece_id", "pieces")],
+    "likes": [("user_id", "users"), ("piece_id", "pieces")],
+    "piece_tags": [("piece_id", "pieces")],
+    "pieces": [("artist_id", "users")],
+}
+
+# SQLite foreign keys are unnamed; batch mode names them with this convention
+SQLITE_NAMING = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+def _restore_spatial_index() -> None:
+    """SQLite batch mode rebuilds the pieces table, which drops the R-tree triggers"""
+    if context.is_offline_mode():
+        for statement in geo.spatial_index_ddl(op.get_context().dialect.name):
+            op.execute(statement)
+    else:
+        geo.create_spatial_index(op.get_bind())
+
+def _set_fk_ondelete(ondelete) -> None:
+    """Recreate every foreign key in CASCADING_FKS with the given ON DELETE"""
+    sqlite = op.get_context().dialect.name == "sqlite"
+    for table, fks in CASCADING_FKS.items():
+        if sqlite:
+            with op.batch_alter_table(table, naming_convention=SQLITE_NAMING) as batch_op:
+                for column, referred in fks:
+                    name = f"fk_{table}_{column}_{referred}"
+                    batch_op.drop_constraint(name, type_="foreignkey")
+                    batch_op.create_foreign_key(name, referred, [column], ["id"], ondelete=ondelete)
+        else:
+            for column, referred in fks:
+                name = f"{table}_{column}_fkey"  # PostgreSQL's default name
+                op.drop_constraint(name, table, type_="foreignkey")
+                op.create_foreign_key(name, table, referred, [column], ["id"], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.create_index(batch_op.f('ix_users_deleted_at'), ['deleted_at'], unique=False)
+
+    with op.batch_alter_table('pieces', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.create_index(batch_op.f('ix_pieces_deleted_at'), ['deleted_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_pieces_artist_id'), ['artist_id'], unique=False)
+
+    # Indexes for the batched cleanup deletes
+    op.create_index(op.f('ix_activity_events_actor_id'), 'activity_events', ['actor_id'], unique=False)
+    op.create_index(op.f('ix_activity_events_piece_id'), 'activity_events', ['piece_id'], unique=False)
+    op.create_index(op.f('ix_comments_author_id'), 'comments', ['author_id'], unique=False)
+    op.create_index(op.f('ix_competition_entries_piece_id'), 'competition_entries', ['piece_id'], unique=False)
+    op.create_index(op.f('ix_likes_piece_id'), 'likes', ['piece_id'], unique=False)
+    op.create_index(op.f('ix_likes_user_id'), 'likes', ['user_id'], unique=False)
+
+    _set_fk_ondelete("CASCADE")
+    _restore_spatial_index()
+
+
+def downgrade() -> None:
+    _set_fk_ondelete(None)
+
+    op.drop_index(op.f('ix_likes_user_id'), table_name='likes')
+    op.drop_index(op.f('ix_likes_piece_id'), table_name='likes')
+    op.drop_index(op.f('ix_competition_entries_piece_id'), table_name='competition_entries')
+    op.drop_index(op.f('ix_comments_author_id'), table_name='comments')
+    op.drop_index(op.f('ix_activity_events_piece_id'), table_name='activity_events')
+    op.drop_index(op.f('ix_activity_events_actor_id'), table_name='activity_events')
+
+    with op.batch_alter_table('pieces', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pieces_artist_id'))
+        batch_op.drop_index(batch_op.f('ix_pieces_deleted_at'))
+        batch_op.drop_column('deleted_at')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_deleted_at'))
+        batch_op.drop_column('deleted_at')
+
+    _restore_spatial_index()
@@ -0,0 +1,41 @@
+"""keep comments of purged accounts as placeholders
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 09:12:40.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Named by 0008 (SQLite batch convention) or PostgreSQL's default
+SQLITE_FK = "fk_comments_author_id_users"
+POSTGRES_FK = "comments_author_id_fkey"
+
+def _set_author_fk(nullable: bool, ondelete: str) -> None:
+    sqlite = op.get_context().dialect.name == "sqlite"
+    name = SQLITE_FK if sqlite else POSTGRES_FK
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_constraint(name, type_="foreignkey")
+        batch_op.alter_column('author_id', existing_type=sa.Integer(), nullable=nullable)
+        batch_op.create_foreign_key(name, 'users', ['author_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    _set_author_fk(nullable=True, ondelete="SET NULL")
+
+
+def downgrade() -> None:
+    # Placeholders have no author to give back
+    op.execute("DELETE FROM comments WHERE author_id IS NULL")
+    _set_author_fk(nullable=False, ondelete="CASCADE")
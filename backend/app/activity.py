@@ -0,0 +1,111 @@
+"""
+Activity feed writes.
+
+Routes call record() after committing a like or comment. Events are
+buffered in memory and appended to activity_events in batches by a
+background thread, together with one unread-counter bump per recipient,
+so a burst of likes costs a couple of statements instead of one
+transaction each.
+"""
+import logging
+import threading
+from collections import Counter
+from typing import Optional
+from sqlalchemy import insert, update
+from .config import settings
+from . import models
+
+logger = logging.getLogger(__name__)
+
+class ActivityWriter:
+    """Buffers activity events and flushes them in batches"""
+
+    def __init__(self, engine, batch_size: int, flush_interval: float):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background flusher (called from the app lifespan)"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def add(self, event: dict):
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.batch_size
+
+        if self._thread is None:
+            self.flush()  # No flusher running (scripts, tests) - write straight away
+        elif full:
+            self._wake.set()
+
+    def flush(self):
+        """Append buffered events and bump each recipient's unread counter once"""
+        with self._lock:
+            events, self._buffer = self._buffer, []
+        if not events:
+            return
+
+        per_recipient = Counter(event["recipient_id"] for event in events)
+        users = models.User.__table__
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(models.ActivityEvent.__table__), events)
+                for recipient_id, count in per_recipient.items():
+                    conn.execute(
+                        update(users)
+                        .where(users.c.id == recipient_id)
+                        .values(unread_notifications=users.c.unread_notifications + count)
+                    )
+        except Exception:
+            # Notifications are best effort; never take a request down with them
+            logger.exception("Dropped %d activity events", len(events))
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+_writer: Optional[ActivityWriter] = None
+
+def get_writer() -> ActivityWriter:
+    global _writer
+    if _writer is None:
+        from .database import engine
+        _writer = ActivityWriter(engine, settings.activity_batch_size, settings.activity_flush_interval_seconds)
+    return _writer
+
+def record(
+    verb: models.ActivityVerb,
+    recipient_id: int,
+    actor_id: int,
+    piece_id: int,
+    comment_id: Optional[int] = None
+):
+    """Queue an activity event for recipient (ignored for your own actions)"""
+    if recipient_id == actor_id:
+        return
+    get_writer().add({
+        "verb": verb,
+        "recipient_id": recipient_id,
+        "actor_id": actor_id,
+        "piece_id": piece_id,
+        "comment_id": comment_id,
+    })
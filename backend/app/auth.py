@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -7,13 +8,14 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from .config import settings
 from .database import get_db
-from . import models, schemas
+from . import models, schemas, revocation
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # OAuth2 setup
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -30,14 +32,35 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
-    to_encode.update({"exp": expire})
+    # jti lets a single token be revoked (see revocation.py)
+    to_encode.update({"exp": expire, "jti": str(uuid.uuid4()), "type": "access"})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
+def create_refresh_token(username: str):
+    """Create a long-lived, single-use token for /api/auth/refresh"""
+    expire = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
+    to_encode = {"sub": username, "exp": expire, "jti": str(uuid.uuid4()), "type": "refresh"}
+    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    """
+    Check signature, expiry, type and revocation. Raises JWTError if any fail.
+    Access tokens are checked against the in-memory denylist only, so this
+    never touches the database.
+    """
+    payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    # Tokens issued before refresh tokens existed have no type and are access tokens
+    if payload.get("type", "access") != token_type:
+        raise JWTError("Wrong token type")
+    if token_type == "access" and revocation.is_revoked(payload.get("jti")):
+        raise JWTError("Token has been revoked")
+    return payload
+
 def verify_token(token: str, credentials_exception):
     """Verify a JWT token"""
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -69,18 +92,18 @@ def get_current_active_user(current_user: models.User = Depends(get_current_user
 def authenticate_user(db: Session, username: str, password: str):
     """Authenticate a user"""
     user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
+    if not user or user.deleted_at is not None:
         return False
     if not verify_password(password, user.hashed_password):
         return False
     return user
 
-def get_current_user_optional(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user_optional(token: Optional[str] = Depends(oauth2_scheme_optional), db: Session = Depends(get_db)):
     """Get the current user if authenticated, otherwise return None"""
     try:
         if not token:
             return None
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             return None
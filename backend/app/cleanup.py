@@ -0,0 +1,211 @@
+"""
+Background purge of soft-deleted pieces and accounts.
+
+Deleting a piece or an account only stamps deleted_at, so the request
+returns straight away and the rows drop out of every listing. This worker
+later removes what hangs off them - likes, comments, activity events,
+competition entries, tags - in small batches so no single statement holds
+locks for long, then deletes the row itself and the uploaded image.
+
+The foreign keys are also ON DELETE CASCADE, so the final delete is safe
+even if something was missed; the batching is what keeps it cheap.
+
+Run it once from cron instead of in-process with:
+
+    python -m app.cleanup
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, func, select, update, or_
+from .config import settings
+from . import models, revocation, storage
+
+logger = logging.getLogger(__name__)
+
+def _delete_in_batches(conn, table, condition, batch_size: int, order_by=None) -> int:
+    """DELETE ... WHERE id IN (first batch_size matching ids), until none are left"""
+    removed = 0
+    while True:
+        batch = select(table.c.id).where(condition)
+        if order_by is not None:
+            batch = batch.order_by(order_by)
+        batch = batch.limit(batch_size).scalar_subquery()
+        result = conn.execute(delete(table).where(table.c.id.in_(batch)))
+        removed += result.rowcount
+        if result.rowcount < batch_size:
+            return removed
+
+def _delete_events(conn, condition, batch_size: int):
+    """Delete activity events, first taking the unread ones off their recipients' badge counts"""
+    events = models.ActivityEvent.__table__
+    users = models.User.__table__
+    unread = select(func.count(events.c.id))\
+        .where(condition, events.c.recipient_id == users.c.id, events.c.id > users.c.last_read_activity_id)\
+        .scalar_subquery()
+    conn.execute(
+        update(users)
+        .where(users.c.id.in_(select(events.c.recipient_id).where(condition)))
+        .values(unread_notifications=users.c.unread_notifications - unread)
+    )
+    _delete_in_batches(conn, events, condition, batch_size)
+
+def _remove_upload(image_url: str):
+    key = storage.key_from_url(image_url)
+    try:
+        storage.get_storage().delete(key)
+    except Exception:
+        logger.warning("Could not remove upload %s", key)
+
+def purge_piece(engine, piece_id: int, image_url: str, batch_size: int):
+    """Remove a soft-deleted piece and everything attached to it"""
+    likes = models.Like.__table__
+    comments = models.Comment.__table__
+    events = models.ActivityEvent.__table__
+    entries = models.CompetitionEntry.__table__
+    piece_tags = models.piece_tags
+    neighbors = models.PieceNeighbor.__table__
+    pieces = models.Piece.__table__
+
+    with engine.begin() as conn:
+        _delete_in_batches(conn, likes, likes.c.piece_id == piece_id, batch_size)
+    with engine.begin() as conn:
+        _delete_events(conn, events.c.piece_id == piece_id, batch_size)
+    with engine.begin() as conn:
+        # Deepest replies first, so a batch never cascades into a whole thread
+        _delete_in_batches(
+            conn, comments, comments.c.piece_id == piece_id, batch_size,
+            order_by=comments.c.depth.desc(),
+        )
+    with engine.begin() as conn:
+        _delete_in_batches(conn, entries, entries.c.piece_id == piece_id, batch_size)
+        conn.execute(delete(piece_tags).where(piece_tags.c.piece_id == piece_id))
+        conn.execute(delete(neighbors).where(
+            or_(neighbors.c.piece_id == piece_id, neighbors.c.neighbor_id == piece_id)
+        ))
+        conn.execute(delete(pieces).where(pieces.c.id == piece_id))
+
+    _remove_upload(image_url)
+
+def purge_user(engine, user_id: int, batch_size: int):
+    """
+    Remove a soft-deleted account. Their pieces must already be purged;
+    what is left is their likes, comments and notifications on other
+    people's pieces. Comments that others replied to stay behind as
+    placeholders (author_id NULL) so the replies keep their thread; reply
+    counts were already corrected when the account was deleted.
+    """
+    likes = models.Like.__table__
+    comments = models.Comment.__table__
+    events = models.ActivityEvent.__table__
+    users = models.User.__table__
+
+    with engine.begin() as conn:
+        _delete_in_batches(conn, likes, likes.c.user_id == user_id, batch_size)
+    with engine.begin() as conn:
+        _delete_events(conn, or_(events.c.recipient_id == user_id, events.c.actor_id == user_id), batch_size)
+
+    # Leaves first, so a chain of their own replies goes away bottom up;
+    # ON DELETE CASCADE on parent_id never reaches anyone else's reply
+    replies = comments.alias("replies")
+    has_replies = select(replies.c.id).where(replies.c.parent_id == comments.c.id).exists()
+    while True:
+        with engine.begin() as conn:
+            removed = _delete_in_batches(
+                conn, comments, (comments.c.author_id == user_id) & ~has_replies, batch_size
+            )
+        if not removed:
+            break
+    with engine.begin() as conn:
+        # Placeholders; ON DELETE SET NULL would clear author_id too, but not the text
+        conn.execute(update(comments).where(comments.c.author_id == user_id).values(author_id=None, content=""))
+        conn.execute(delete(users).where(users.c.id == user_id))
+
+def run_once(engine=None, batch_size: Optional[int] = None) -> int:
+    """
+    Purge everything soft-deleted before the grace period, plus expired
+    revoked_tokens rows. Returns how many pieces and users were purged.
+    """
+    if engine is None:
+        from .database import engine
+    batch_size = batch_size or settings.cleanup_batch_size
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.cleanup_grace_seconds)
+    pieces = models.Piece.__table__
+    users = models.User.__table__
+
+    with engine.connect() as conn:
+        deleted_pieces = conn.execute(
+            select(pieces.c.id, pieces.c.image_url).where(pieces.c.deleted_at < cutoff)
+        ).all()
+        deleted_users = conn.execute(
+            select(users.c.id).where(users.c.deleted_at < cutoff)
+        ).scalars().all()
+
+    purged = 0
+    for piece_id, image_url in deleted_pieces:
+        try:
+            purge_piece(engine, piece_id, image_url, batch_size)
+            purged += 1
+        except Exception:
+            logger.exception("Could not purge piece %d", piece_id)
+
+    for user_id in deleted_users:
+        with engine.connect() as conn:
+            pieces_left = conn.execute(
+                select(pieces.c.id).where(pieces.c.artist_id == user_id).limit(1)
+            ).first()
+        if pieces_left:
+            continue  # A piece purge failed above; try again next round
+        try:
+            purge_user(engine, user_id, batch_size)
+            purged += 1
+        except Exception:
+            logger.exception("Could not purge user %d", user_id)
+
+    revocation.purge_expired(engine)
+    return purged
+
+class CleanupWorker:
+    """Runs run_once() every interval in the background"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background purge (called from the app lifespan)"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="cleanup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            if self._stopping:
+                break
+            try:
+                run_once()
+            except Exception:
+                logger.exception("Cleanup run failed")
+
+_worker: Optional[CleanupWorker] = None
+
+def get_worker() -> CleanupWorker:
+    global _worker
+    if _worker is None:
+        _worker = CleanupWorker(settings.cleanup_interval_seconds)
+    return _worker
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Purged %d soft-deleted rows", run_once())
@@ -12,16 +12,98 @@ class Settings(BaseSettings):
     
     # Database settings (we'll use these later)
     database_url: Optional[str] = "sqlite:///./graffiti_app.db"  # SQLite for development
+    run_migrations_on_startup: bool = False  # Otherwise run `alembic upgrade head` before deploying
+    
+    # Read replica (optional) - GET routes read from here when it is healthy
+    database_replica_url: Optional[str] = None
+    replica_max_lag_seconds: float = 5.0  # Fall back to the primary above this
+    replica_check_interval_seconds: float = 2.0  # Heartbeat interval; lag is measured to within this
+    read_your_writes_seconds: int = 10  # Clients read from the primary this long after a write
     
     # Security settings
     secret_key: str = "your-secret-key-change-this-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 30
+    revocation_sync_seconds: float = 5.0  # How often workers pick up each other's revoked tokens
     
     # File upload settings
     max_upload_size: int = 5 * 1024 * 1024  # 5MB
     allowed_extensions: set = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
     
+    # Image storage (see storage.py)
+    storage_backend: str = "local"  # "local", "s3" or "module:Class"
+    upload_dir: str = "uploads"  # Local backend; relative to the backend directory
+    upload_url_prefix: str = "/uploads"
+    s3_bucket: str = "graffiti-uploads"
+    s3_endpoint_url: Optional[str] = None  # e.g. http://localhost:9000 for MinIO
+    s3_region: Optional[str] = None
+    s3_access_key_id: Optional[str] = None
+    s3_secret_access_key: Optional[str] = None
+    s3_public_url: Optional[str] = None  # Where browsers fetch images (bucket URL or CDN)
+    s3_multipart_threshold_mb: int = 8
+    direct_upload_expires_seconds: int = 600  # Lifetime of a presigned upload
+    
+    # Near-duplicate detection (Hamming distance between 64-bit image hashes)
+    duplicate_max_distance: int = 4  # Flag uploads this close as possible duplicates
+    similar_max_distance: int = 7  # Upper bound for the "similar pieces" lookup
+    
+    # Feed filters
+    facet_tag_limit: int = 50  # Tags shown in the filter sidebar
+    
+    # Deleted content cleanup (rows are soft-deleted first, then purged in batches)
+    cleanup_interval_seconds: float = 60.0
+    cleanup_batch_size: int = 500  # Rows per delete statement
+    cleanup_grace_seconds: int = 30  # Keep deleted rows this long (lets queued activity writes land first)
+    
+    # "More like this" recommendations from co-likes (see recommend.py)
+    recommend_neighbors: int = 20  # Neighbours stored per piece
+    recommend_min_co_likes: int = 2  # Ignore pairs fewer users liked together
+    recommend_update_interval_seconds: float = 30.0  # How often likes since the last run are applied
+    recommend_fanout: int = 100  # Most rows refreshed per liker (their recent likes) and per unliked piece (its closest co-likes)
+    
+    # Activity feed
+    activity_batch_size: int = 100  # Flush buffered events once this many are queued
+    activity_flush_interval_seconds: float = 1.0
+    activity_feed_days: int = 30  # How far back the feed collapses events
+    
+    # Live updates (server-sent events)
+    live_backend: str = "local"  # "local", "redis" or "module:Class"
+    live_redis_url: str = "redis://localhost:6379/0"
+    live_queue_size: int = 100  # Per-connection backlog before the client is told to resync
+    live_heartbeat_seconds: float = 15.0
+    live_retry_ms: int = 3000  # Browser reconnect delay
+    live_max_pieces: int = 100  # Pieces one stream can watch
+    
+    # Request profiling (see profiling.py) - not installed unless a token is set
+    profiling_token: Optional[str] = None  # Send as the X-Profile header to profile a request
+    profiling_sample_rate: float = 0.0  # Fraction of requests profiled at random (needs the token)
+    profiling_interval_ms: float = 1.0  # Stack sampling interval
+    profiling_dir: str = "profiles"  # Relative to the backend directory
+    profiling_keep: int = 200  # Newest profiles kept on disk
+    
+    # Map settings
+    map_cluster_max_zoom: int = 16  # From this zoom in, return individual pieces
+    map_cluster_cells_per_tile: int = 4  # Cluster grid resolution per map tile
+    map_max_markers: int = 500
+    
+    # Rate limiting - budgets are "<requests>/<second|minute|hour|day>" per user or IP
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"  # "memory", "redis" or "module:Class"
+    rate_limit_redis_url: str = "redis://localhost:6379/0"
+    rate_limits: dict = {
+        "login": "10/minute",
+        "refresh": "30/minute",
+        "register": "5/hour",
+        "create_piece": "20/hour",
+        "direct_upload": "30/hour",
+        "like": "60/minute",
+        "comment": "30/minute",
+    }
+    
+    # Admission control - keep at or below the DB pool size + overflow (5 + 10 by default)
+    max_concurrent_requests: int = 15
+    
     # Frontend URL (for CORS)
     frontend_url: str = "http://localhost:3000"
     
@@ -1,19 +1,119 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select, update, insert
+from sqlalchemy.pool import NullPool
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, Session
+from starlette.requests import Request
 from .config import settings
-from .models import Base
+from . import models
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked to
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def _create_engine(url: str):
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {}
+    )
+    if url.startswith("sqlite"):
+        event.listen(new_engine, "connect", _enable_sqlite_foreign_keys)
+    return new_engine
 
 # Create database engine
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
-)
+engine = _create_engine(settings.database_url)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+# Optional read replica for GET traffic (see get_read_db)
+replica_engine = _create_engine(settings.database_replica_url) if settings.database_replica_url else None
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+def run_migrations():
+    """Upgrade the database to the latest Alembic revision"""
+    # Imported here so normal startup doesn't pay for loading Alembic
+    from alembic import command
+    from alembic.config import Config
+    
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "alembic"))
+    config.set_main_option("sqlalchemy.url", settings.database_url)
+    config.attributes["configure_logger"] = False
+    
+    # Separate engine without the foreign_keys pragma: SQLite batch migrations
+    # rebuild tables, and dropping the old copy would otherwise cascade
+    migration_engine = create_engine(settings.database_url, poolclass=NullPool)
+    try:
+        with migration_engine.begin() as connection:
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+    finally:
+        migration_engine.dispose()
+
+def _upsert_insert(db):
+    """The dialect's INSERT with ON CONFLICT support, or None if it has none"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+def add_to_counters(db, table, key: dict, deltas: dict, initial: Optional[dict] = None):
+    """
+    Add deltas to the counter columns of the row identified by key,
+    inserting it (with the deltas plus initial) if it doesn't exist.
+    A single INSERT ... ON CONFLICT DO UPDATE on SQLite and PostgreSQL, so
+    two requests creating the same row at once don't collide.
+    """
+    values = {**key, **deltas, **(initial or {})}
+    dialect_insert = _upsert_insert(db)
+    if dialect_insert is not None:
+        statement = dialect_insert(table).values(**values)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: table.c[column] + statement.excluded[column] for column in deltas},
+        ))
+        return
+
+    where = [table.c[column] == value for column, value in key.items()]
+    updated = db.execute(
+        update(table).where(*where).values({column: table.c[column] + delta for column, delta in deltas.items()})
+    )
+    if updated.rowcount == 0:
+        db.execute(insert(table).values(**values))
+
+def insert_missing(db, table, rows: list, index_elements: list):
+    """
+    Insert rows, skipping any whose unique index_elements already exist -
+    including ones another request inserts at the same moment.
+    """
+    if not rows:
+        return
+    dialect_insert = _upsert_insert(db)
+    if dialect_insert is not None:
+        db.execute(dialect_insert(table).values(rows).on_conflict_do_nothing(index_elements=index_elements))
+        return
+
+    for row in rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(table).values(**row))
+        except IntegrityError:
+            pass  # Someone else got there first
 
 # Dependency to get database session
 def get_db():
@@ -25,4 +125,126 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Read replica routing
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+PRIMARY_PIN_COOKIE = "db_primary_until"
+PRIMARY_PIN_HEADER = "X-DB-Primary-Until"
+
+class ReplicaMonitor:
+    """
+    Estimates replica lag from a heartbeat row. A background thread stamps
+    the current time on the primary every interval and compares the stamp
+    the primary has with the one the replica has seen, so the lag is known
+    to within one interval and requests only read self.lag. Works with any
+    replication setup, including a copied SQLite file.
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = None  # Seconds, None = unknown/unreachable
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Start the heartbeat (called from the app lifespan when there is a replica)"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="replica-heartbeat", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def healthy(self) -> bool:
+        return self.lag is not None and self.lag <= settings.replica_max_lag_seconds
+    
+    def check(self):
+        """Measure the lag, then stamp a new heartbeat for the next check"""
+        heartbeat = models.ReplicationHeartbeat.__table__
+        current = select(heartbeat.c.beat_at).where(heartbeat.c.id == 1)
+        try:
+            with engine.begin() as conn:
+                primary_beat = conn.execute(current).scalar()
+                with replica_engine.connect() as replica_conn:
+                    replica_beat = replica_conn.execute(current).scalar()
+                
+                now = time.time()
+                stamped = conn.execute(update(heartbeat).where(heartbeat.c.id == 1).values(beat_at=now))
+                if stamped.rowcount == 0:
+                    conn.execute(insert(heartbeat).values(id=1, beat_at=now))
+        except SQLAlchemyError:
+            logger.warning("Replica lag check failed, reading from primary", exc_info=True)
+            self.lag = None
+            return
+        
+        if primary_beat is None or replica_beat is None:
+            self.lag = None  # No heartbeat has reached the replica yet
+        else:
+            # The replica is behind by however many stamps it hasn't seen
+            self.lag = max(0.0, primary_beat - replica_beat)
+    
+    def _run(self):
+        while not self._stopping:
+            self.check()
+            self._wake.wait(self.interval)
+
+replica_monitor = ReplicaMonitor(settings.replica_check_interval_seconds)
+
+def is_pinned_to_primary(request: Request) -> bool:
+    """True if this client wrote recently and must read its own writes"""
+    pinned_until = request.cookies.get(PRIMARY_PIN_COOKIE) or request.headers.get(PRIMARY_PIN_HEADER)
+    try:
+        return pinned_until is not None and float(pinned_until) > time.time()
+    except ValueError:
+        return False
+
+def get_read_db(request: Request):
+    """
+    Session for read-only routes. Uses the replica when one is configured,
+    the request is a read, the client hasn't written in the last few
+    seconds and the replica isn't lagging; otherwise the primary.
+    """
+    use_replica = (
+        ReplicaSessionLocal is not None
+        and request.method in READ_METHODS
+        and not is_pinned_to_primary(request)
+        and replica_monitor.healthy()
+    )
+    db = ReplicaSessionLocal() if use_replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+class ReadYourWritesMiddleware:
+    """
+    After a successful write, pin the client to the primary for a short
+    window by setting a cookie and a response header it can echo back.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in READ_METHODS or replica_engine is None:
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                window = settings.read_your_writes_seconds
+                pinned_until = f"{time.time() + window:.3f}"
+                cookie = f"{PRIMARY_PIN_COOKIE}={pinned_until}; Max-Age={window}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"set-cookie", cookie.encode()),
+                    (PRIMARY_PIN_HEADER.lower().encode(), pinned_until.encode()),
+                ]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_pin)
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""
+Spatial indexing and queries for geotagged pieces.
+
+SQLite gets an R-tree virtual table kept in sync by triggers, PostgreSQL
+gets a GiST index on a PostGIS point expression. Both are created by the
+migrations; at startup detect_spatial_backend() only checks which one is
+there. Anything else falls back to the plain (latitude, longitude) B-tree
+index on the pieces table.
+
+Zoomed-out map views don't touch the pieces table at all: they read
+per-zoom cluster counts from map_cells (see add_to_map_cells()).
+"""
+import math
+from typing import Dict
+from sqlalchemy import Table, Column, Integer, Float, MetaData, func, select, text, or_, update, insert, delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import add_to_counters
+from . import models
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+# Kept out of models.Base.metadata so create_all never tries to build it
+rtree_metadata = MetaData()
+pieces_rtree = Table(
+    "pieces_rtree", rtree_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("min_lat", Float),
+    Column("max_lat", Float),
+    Column("min_lng", Float),
+    Column("max_lng", Float),
+)
+
+# Set by detect_spatial_backend() once we know what the database has
+_backend = "btree"
+
+SQLITE_RTREE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS pieces_rtree
+       USING rtree(id, min_lat, max_lat, min_lng, max_lng)""",
+    """CREATE TRIGGER IF NOT EXISTS pieces_rtree_insert AFTER INSERT ON pieces
+       WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+       BEGIN
+           INSERT INTO pieces_rtree VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS pieces_rtree_update AFTER UPDATE OF latitude, longitude ON pieces
+       BEGIN
+           DELETE FROM pieces_rtree WHERE id = OLD.id;
+           INSERT INTO pieces_rtree
+               SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+               WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS pieces_rtree_delete AFTER DELETE ON pieces
+       BEGIN
+           DELETE FROM pieces_rtree WHERE id = OLD.id;
+       END""",
+    # Backfill rows written before the index existed
+    """INSERT OR IGNORE INTO pieces_rtree
+       SELECT id, latitude, latitude, longitude, longitude FROM pieces
+       WHERE latitude IS NOT NULL AND longitude IS NOT NULL""",
+]
+
+POSTGIS_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    """CREATE INDEX IF NOT EXISTS ix_pieces_geo_gist ON pieces
+       USING GIST (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))""",
+]
+
+def spatial_index_ddl(dialect_name: str):
+    """DDL statements creating the spatial index for a dialect (may be empty)"""
+    if dialect_name == "sqlite":
+        return SQLITE_RTREE_DDL
+    if dialect_name == "postgresql":
+        return POSTGIS_DDL
+    return []
+
+def create_spatial_index(connection):
+    """
+    Create the spatial index for the connected database, if it supports one.
+    Run from the Alembic migrations; safe to repeat.
+    """
+    ddl = spatial_index_ddl(connection.dialect.name)
+    if not ddl:
+        return
+
+    try:
+        # Savepoint so a missing R-tree module / PostGIS doesn't abort the migration
+        with connection.begin_nested():
+            for statement in ddl:
+                connection.execute(text(statement))
+    except DBAPIError:
+        pass  # Queries fall back to the B-tree index
+
+def drop_spatial_index(connection):
+    """Undo create_spatial_index()"""
+    if connection.dialect.name == "sqlite":
+        for trigger in ("pieces_rtree_insert", "pieces_rtree_update", "pieces_rtree_delete"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        connection.execute(text("DROP TABLE IF EXISTS pieces_rtree"))
+    elif connection.dialect.name == "postgresql":
+        connection.execute(text("DROP INDEX IF EXISTS ix_pieces_geo_gist"))
+
+def detect_spatial_backend(engine: Engine):
+    """Check (without any DDL) which spatial index the database has"""
+    global _backend
+
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        probe, backend = "SELECT 1 FROM sqlite_master WHERE name = 'pieces_rtree'", "rtree"
+    elif dialect == "postgresql":
+        probe, backend = "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_pieces_geo_gist'", "postgis"
+    else:
+        _backend = "btree"
+        return _backend
+
+    with engine.connect() as conn:
+        _backend = backend if conn.execute(text(probe)).first() else "btree"
+    return _backend
+
+def _piece_point():
+    return func.ST_SetSRID(func.ST_MakePoint(models.Piece.longitude, models.Piece.latitude), 4326)
+
+def bbox_filter(min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    """Filter matching pieces inside a bounding box, using the spatial index"""
+    if _backend == "rtree":
+        # Overlap test: the R-tree stores 32-bit boxes rounded outwards
+        inside = select(pieces_rtree.c.id).where(
+            pieces_rtree.c.max_lat >= min_lat,
+            pieces_rtree.c.min_lat <= max_lat,
+            pieces_rtree.c.max_lng >= min_lng,
+            pieces_rtree.c.min_lng <= max_lng,
+        )
+        return models.Piece.id.in_(inside)
+
+    if _backend == "postgis":
+        envelope = func.ST_MakeEnvelope(min_lng, min_lat, max_lng, max_lat, 4326)
+        return _piece_point().op("&&")(envelope)
+
+    return (
+        models.Piece.latitude.between(min_lat, max_lat) &
+        models.Piece.longitude.between(min_lng, max_lng)
+    )
+
+def radius_bbox(lat: float, lng: float, radius_km: float):
+    """Bounding box (min_lat, min_lng, max_lat, max_lng) enclosing a circle"""
+    d_lat = radius_km / KM_PER_DEGREE
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    d_lng = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    return (
+        max(lat - d_lat, -90.0), max(lng - d_lng, -180.0),
+        min(lat + d_lat, 90.0), min(lng + d_lng, 180.0),
+    )
+
+def approx_distance_order(lat: float, lng: float):
+    """
+    Cheap equirectangular distance expression for ORDER BY.
+    Sorts the same as great-circle distance at "near me" radii.
+    """
+    cos_lat = math.cos(math.radians(lat))
+    d_lat = models.Piece.latitude - lat
+    d_lng = (models.Piece.longitude - lng) * cos_lat
+    return d_lat * d_lat + d_lng * d_lng
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def viewport_filter(min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    """bbox_filter() for a map viewport, which may cross the antimeridian (min_lng > max_lng)"""
+    if min_lng <= max_lng:
+        return bbox_filter(min_lat, min_lng, max_lat, max_lng)
+    return or_(
+        bbox_filter(min_lat, min_lng, max_lat, 180.0),
+        bbox_filter(min_lat, -180.0, max_lat, max_lng),
+    )
+
+# Server-side clustering: for every zoom below map_cluster_max_zoom the
+# world is cut into a grid, and map_cells holds the number of pieces (and
+# their summed coordinates) per grid cell. Cells are updated whenever a
+# public geotagged piece appears or disappears, so a zoomed-out map view
+# reads the cells in view rather than grouping every piece inside it.
+
+def cluster_cell_size(zoom: int) -> float:
+    """Grid cell size in degrees for a web-map zoom level"""
+    return 360.0 / (2 ** zoom) / settings.map_cluster_cells_per_tile
+
+def map_cell(latitude: float, longitude: float, zoom: int):
+    """(lat_cell, lng_cell) of a point; coordinates are shifted to be non-negative"""
+    cell_size = cluster_cell_size(zoom)
+    return int((latitude + 90.0) // cell_size), int((longitude + 180.0) // cell_size)
+
+def _on_map(piece_filter):
+    return [
+        models.Piece.is_public == True,
+        models.Piece.deleted_at.is_(None),
+        models.Piece.latitude.isnot(None),
+        models.Piece.longitude.isnot(None),
+        piece_filter,
+    ]
+
+def _cell_totals(points) -> Dict[tuple, list]:
+    """(zoom, lat_cell, lng_cell) -> [count, lat_sum, lng_sum, piece_id] for (id, lat, lng) points"""
+    totals = {}
+    for piece_id, latitude, longitude in points:
+        for zoom in range(settings.map_cluster_max_zoom):
+            cell = (zoom, *map_cell(latitude, longitude, zoom))
+            total = totals.setdefault(cell, [0, 0.0, 0.0, piece_id])
+            total[0] += 1
+            total[1] += latitude
+            total[2] += longitude
+    return totals
+
+def add_to_map_cells(db: Session, piece: models.Piece):
+    """
+    Count a new piece in its cells. Call after the piece has an id, in the
+    same transaction that creates it.
+    """
+    if not piece.is_public or piece.latitude is None or piece.longitude is None:
+        return
+
+    cells = models.MapCell.__table__
+    for (zoom, lat_cell, lng_cell), (count, lat_sum, lng_sum, piece_id) in _cell_totals(
+        [(piece.id, piece.latitude, piece.longitude)]
+    ).items():
+        add_to_counters(
+            db, cells,
+            key={"zoom": zoom, "lat_cell": lat_cell, "lng_cell": lng_cell},
+            deltas={"count": count, "lat_sum": lat_sum, "lng_sum": lng_sum},
+            initial={"piece_id": piece_id},
+        )
+
+def remove_pieces_from_map_cells(db: Session, piece_filter):
+    """
+    Take every visible piece matching piece_filter out of the map cells.
+    Call before the change that hides them, in the same transaction.
+    """
+    points = db.query(models.Piece.id, models.Piece.latitude, models.Piece.longitude)\
+        .filter(*_on_map(piece_filter))\
+        .all()
+    if not points:
+        return
+
+    cells = models.MapCell.__table__
+    for (zoom, lat_cell, lng_cell), (count, lat_sum, lng_sum, _) in _cell_totals(points).items():
+        db.execute(
+            update(cells)
+            .where(cells.c.zoom == zoom, cells.c.lat_cell == lat_cell, cells.c.lng_cell == lng_cell)
+            .values(count=cells.c.count - count, lat_sum=cells.c.lat_sum - lat_sum, lng_sum=cells.c.lng_sum - lng_sum)
+        )
+
+    # Cells whose linked piece is going away: drop them if empty, otherwise
+    # link another piece that stays
+    removed_ids = [piece_id for piece_id, _, _ in points]
+    for start in range(0, len(removed_ids), 500):
+        orphaned = db.query(models.MapCell)\
+            .filter(models.MapCell.piece_id.in_(removed_ids[start:start + 500]))\
+            .all()
+        for cell in orphaned:
+            if cell.count <= 0:
+                db.delete(cell)
+                continue
+            cell_size = cluster_cell_size(cell.zoom)
+            min_lat = cell.lat_cell * cell_size - 90.0
+            min_lng = cell.lng_cell * cell_size - 180.0
+            cell.piece_id = db.query(models.Piece.id)\
+                .filter(
+                    *_on_map(~piece_filter),
+                    models.Piece.latitude >= min_lat,
+                    models.Piece.latitude < min_lat + cell_size,
+                    models.Piece.longitude >= min_lng,
+                    models.Piece.longitude < min_lng + cell_size,
+                )\
+                .limit(1)\
+                .scalar()
+    db.flush()
+
+def map_cells_in_view(db: Session, zoom: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float, limit: int):
+    """The biggest non-empty cells of the zoom level's grid that overlap a viewport"""
+    min_lat_cell, min_lng_cell = map_cell(min_lat, min_lng, zoom)
+    max_lat_cell, max_lng_cell = map_cell(max_lat, max_lng, zoom)
+    if min_lng_cell <= max_lng_cell:
+        lng_in_view = models.MapCell.lng_cell.between(min_lng_cell, max_lng_cell)
+    else:
+        # Viewport crosses the antimeridian
+        lng_in_view = or_(models.MapCell.lng_cell >= min_lng_cell, models.MapCell.lng_cell <= max_lng_cell)
+
+    return db.query(models.MapCell)\
+        .filter(
+            models.MapCell.zoom == zoom,
+            models.MapCell.lat_cell.between(min_lat_cell, max_lat_cell),
+            lng_in_view,
+            models.MapCell.count > 0,
+        )\
+        .order_by(models.MapCell.count.desc())\
+        .limit(limit)\
+        .all()
+
+def rebuild_map_cells(connection):
+    """Recount every map cell from the pieces table (used by the migration)"""
+    pieces = models.Piece.__table__
+    cells = models.MapCell.__table__
+    points = connection.execute(
+        select(pieces.c.id, pieces.c.latitude, pieces.c.longitude).where(
+            pieces.c.is_public == True,
+            pieces.c.deleted_at.is_(None),
+            pieces.c.latitude.isnot(None),
+            pieces.c.longitude.isnot(None),
+        )
+    ).all()
+
+    connection.execute(delete(cells))
+    rows = [
+        {"zoom": zoom, "lat_cell": lat_cell, "lng_cell": lng_cell,
+         "count": count, "lat_sum": lat_sum, "lng_sum": lng_sum, "piece_id": piece_id}
+        for (zoom, lat_cell, lng_cell), (count, lat_sum, lng_sum, piece_id) in _cell_totals(points).items()
+    ]
+    if rows:
+        connection.execute(insert(cells), rows)
@@ -0,0 +1,163 @@
+"""
+Live like/comment updates pushed to browsers over server-sent events.
+
+Routes publish small deltas per piece; each SSE connection subscribes to
+the pieces it has on screen. Within a worker the LiveHub fans messages out
+to subscriber queues. Between workers a LiveBackend carries them: the
+LocalBackend just hands them straight to this worker's hub (single process
+or development), the RedisBackend goes through Redis pub/sub.
+
+Queues are bounded. A subscriber that falls behind loses its backlog and
+gets a single "resync" message telling the client to refetch, so one slow
+connection never holds up publishers or other clients.
+"""
+import asyncio
+import importlib
+import json
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Set
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {"type": "resync"}
+
+class Subscription:
+    """One SSE connection's view of the hub"""
+
+    def __init__(self, piece_ids: Set[int], max_queue: int):
+        self.piece_ids = piece_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+
+    def offer(self, message: dict):
+        """Queue a message without ever blocking the publisher"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop the backlog, ask the client to refetch
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+class LiveHub:
+    """In-process fan-out from piece ids to subscribers"""
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Remember the event loop the SSE connections live on"""
+        self._loop = loop
+
+    def subscribe(self, piece_ids: Iterable[int]) -> Subscription:
+        subscription = Subscription(set(piece_ids), settings.live_queue_size)
+        for piece_id in subscription.piece_ids:
+            self._subscriptions.setdefault(piece_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for piece_id in subscription.piece_ids:
+            subscribers = self._subscriptions.get(piece_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[piece_id]
+
+    def deliver(self, message: dict):
+        """Hand a message to local subscribers. Safe to call from any thread."""
+        if self._loop is None or message.get("piece_id") not in self._subscriptions:
+            return
+        self._loop.call_soon_threadsafe(self._fan_out, message)
+
+    def _fan_out(self, message: dict):
+        for subscription in list(self._subscriptions.get(message["piece_id"], ())):
+            subscription.offer(message)
+
+hub = LiveHub()
+
+class LiveBackend:
+    """Carries published messages to every worker's hub"""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, message: dict):
+        raise NotImplementedError
+
+class LocalBackend(LiveBackend):
+    """Single-process stand-in: publishing delivers straight to this hub"""
+
+    def publish(self, message: dict):
+        hub.deliver(message)
+
+class RedisBackend(LiveBackend):
+    """Cross-worker delivery through Redis pub/sub (needs the redis package)"""
+
+    CHANNEL = "graffiti:live"
+
+    def __init__(self, url: str):
+        import redis  # Optional dependency, only needed for this backend
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.CHANNEL: self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+    def publish(self, message: dict):
+        self._client.publish(self.CHANNEL, json.dumps(message, default=str))
+
+    def _on_message(self, raw):
+        hub.deliver(json.loads(raw["data"]))
+
+def create_backend() -> LiveBackend:
+    """Build the backend named in settings ("local", "redis" or "module:Class")"""
+    name = settings.live_backend
+    if name == "local":
+        return LocalBackend()
+    if name == "redis":
+        return RedisBackend(settings.live_redis_url)
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+_backend: Optional[LiveBackend] = None
+
+def get_backend() -> LiveBackend:
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+def publish(message: dict):
+    """Broadcast a piece update to every worker (best effort)"""
+    try:
+        get_backend().publish(message)
+    except Exception:
+        logger.exception("Could not publish live update")
+
+def publish_like(piece_id: int, delta: int):
+    publish({"type": "like", "piece_id": piece_id, "delta": delta})
+
+def publish_comment(piece_id: int, comment: dict):
+    publish({"type": "comment", "piece_id": piece_id, "comment": comment})
+
+def publish_comment_deleted(piece_id: int, comment_id: int, removed: int):
+    publish({"type": "comment_deleted", "piece_id": piece_id, "comment_id": comment_id, "removed": removed})
+
+def format_event(message: dict) -> str:
+    """Encode a message as a server-sent event"""
+    return f"event: {message['type']}\ndata: {json.dumps(message, default=str)}\n\n"
@@ -1,28 +1,87 @@
+import time
+
+# Measured from here so the startup log covers our own import cost
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from .config import settings
-from .database import engine, get_db
-from . import models
+from .database import engine, replica_engine, replica_monitor, get_db, run_migrations, ReadYourWritesMiddleware
+from . import models, geo, activity, live, cleanup, revocation, profiling, recommend, storage
+from .ratelimit import AdmissionControlMiddleware
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown work, kept out of module import"""
+    started = time.perf_counter()
+    
+    if settings.run_migrations_on_startup:
+        run_migrations()
+    geo.detect_spatial_backend(engine)
+    storage.get_storage().prepare()
+    activity.get_writer().start()
+    cleanup.get_worker().start()
+    recommend.get_updater().start()
+    revocation.get_denylist().start()
+    if replica_engine is not None:
+        replica_monitor.start()
+    live.hub.bind(asyncio.get_running_loop())
+    live.get_backend().start()
+    
+    app.state.startup_timings = {
+        "import_ms": round((started - _import_started) * 1000, 1),
+        "startup_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info("Startup complete: %s", app.state.startup_timings)
+    
+    yield
+    
+    live.get_backend().stop()
+    activity.get_writer().stop()
+    cleanup.get_worker().stop()
+    recommend.get_updater().stop()
+    revocation.get_denylist().stop()
+    if replica_engine is not None:
+        replica_monitor.stop()
+    engine.dispose()
+    if replica_engine is not None:
+        replica_engine.dispose()
 
 # Create FastAPI instance
 app = FastAPI(
     title=settings.app_name,
     description="Backend API for the Graffiti Artists Platform",
     version="0.1.0",
-    debug=settings.debug
+    debug=settings.debug,
+    lifespan=lifespan
 )
 
-# Configure CORS (allows your frontend to talk to backend)
+# Send clients that just wrote something to the primary for their next reads
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Shed load with a 503 before requests start queueing on the database pool
+app.add_middleware(
+    AdmissionControlMiddleware,
+    max_concurrent=settings.max_concurrent_requests,
+    exempt_paths=["/health", "/api/live"],  # Long-lived streams don't hold a DB connection
+)
+
+# Configure CORS (allows your frontend to talk to backend). Added last so it
+# wraps everything above and their error responses carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # React app URL from config
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Primary-Until"],
 )
 
 # Root endpoint
@@ -42,17 +101,24 @@ def health_check():
     return {"status": "healthy"}
 
 # Include routers
-from .routers import auth, users, pieces, comments
+from .routers import auth, users, pieces, comments, notifications, live as live_router
 
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(pieces.router)
 app.include_router(comments.router)
+app.include_router(notifications.router)
+app.include_router(live_router.router)
 
-# Serve uploaded files (in production, use a proper file server)
-from fastapi.staticfiles import StaticFiles
-import os
+# Request profiling; left out entirely unless configured
+if profiling.enabled():
+    profiling.install(app, [engine, replica_engine])
 
-uploads_path = os.path.join(os.path.dirname(__file__), "..", "uploads")
-if os.path.exists(uploads_path):
-    app.mount("/uploads", StaticFiles(directory=uploads_path), name="uploads")
\ No newline at end of file
+# Serve uploaded files when they are stored locally (in production, use a proper file server)
+if settings.storage_backend == "local":
+    local_storage = storage.get_storage()
+    app.mount(
+        local_storage.url_prefix,
+        StaticFiles(directory=local_storage.root, check_dir=False),
+        name="uploads"
+    )
@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, Index, Float, Table
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, select
+from collections import Counter
 from datetime import datetime
+from typing import Dict
 import enum
 
 # This creates the base class for all our database models
@@ -35,7 +38,23 @@ class Surface(str, enum.Enum):
     POSTER = "poster"
     OTHER = "other"
 
+class ActivityVerb(str, enum.Enum):
+    """Things that show up in an artist's activity feed"""
+    LIKE = "like"
+    COMMENT = "comment"
+    REPLY = "reply"
+
 # Database Models
+
+# Inverted index from tags to pieces. The primary key is (tag_id, piece_id)
+# so each tag's pieces are one index range; ix_piece_tags_piece_id covers
+# the other direction.
+piece_tags = Table(
+    "piece_tags", Base.metadata,
+    Column("tag_id", Integer, ForeignKey("tags.id"), primary_key=True),
+    Column("piece_id", Integer, ForeignKey("pieces.id", ondelete="CASCADE"), primary_key=True, index=True),
+)
+
 class User(Base):
     """User model - represents a graffiti artist"""
     __tablename__ = "users"
@@ -54,13 +73,18 @@ class User(Base):
     # Account status
     is_active = Column(Boolean, default=True)
     is_premium = Column(Boolean, default=False)
+    deleted_at = Column(DateTime(timezone=True), index=True)  # Soft delete, see cleanup.py
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Activity feed - maintained by activity.py so the badge never needs a COUNT
+    unread_notifications = Column(Integer, default=0, server_default="0", nullable=False)
+    last_read_activity_id = Column(Integer, default=0, server_default="0", nullable=False)
+    
     # Relationships
-    pieces = relationship("Piece", back_populates="artist", cascade="all, delete-orphan")
-    comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
-    likes = relationship("Like", back_populates="user", cascade="all, delete-orphan")
+    pieces = relationship("Piece", back_populates="artist", cascade="all, delete-orphan", passive_deletes=True)
+    comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan", passive_deletes=True)
+    likes = relationship("Like", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 class Piece(Base):
     """Piece model - represents a graffiti artwork"""
@@ -80,17 +104,50 @@ class Piece(Base):
     
     # Metadata
     is_public = Column(Boolean, default=True)
+    deleted_at = Column(DateTime(timezone=True), index=True)  # Soft delete, see cleanup.py
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     location = Column(String(200))  # Optional location info
     
+    # Optional coordinates for map browsing (spatial index lives in geo.py)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    
+    # Perceptual hash for near-duplicate detection (see similarity.py)
+    image_hash = Column(String(16))  # 64-bit dHash as hex
+    hash_chunk_0 = Column(Integer, index=True)
+    hash_chunk_1 = Column(Integer, index=True)
+    hash_chunk_2 = Column(Integer, index=True)
+    hash_chunk_3 = Column(Integer, index=True)
+    
     # Foreign keys
-    artist_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    artist_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # Relationships
     artist = relationship("User", back_populates="pieces")
-    comments = relationship("Comment", back_populates="piece", cascade="all, delete-orphan")
-    likes = relationship("Like", back_populates="piece", cascade="all, delete-orphan")
-    competition_entries = relationship("CompetitionEntry", back_populates="piece")
+    comments = relationship("Comment", back_populates="piece", cascade="all, delete-orphan", passive_deletes=True)
+    likes = relationship("Like", back_populates="piece", cascade="all, delete-orphan", passive_deletes=True)
+    competition_entries = relationship("CompetitionEntry", back_populates="piece", cascade="all, delete", passive_deletes=True)
+    tags = relationship("Tag", secondary=piece_tags, back_populates="pieces")
+    tag_names = association_proxy("tags", "name")
+    
+    __table_args__ = (
+        # Fallback for databases without a spatial index
+        Index("ix_pieces_lat_lng", "latitude", "longitude"),
+    )
+
+# Comment threads use a materialised path: each comment stores the ids of
+# its ancestors plus its own, zero-padded so the strings sort like the tree
+# (e.g. "0000000012/0000000034"). A whole subtree is then a single range scan
+# on the indexed path column - see comment_subtree_filter().
+COMMENT_PATH_SEPARATOR = "/"
+COMMENT_PATH_WIDTH = 10
+# Deepest reply level; replies below it join their parent's level instead.
+# Keeps paths within the 255 characters of the path column.
+COMMENT_MAX_DEPTH = 20
+
+def comment_path_segment(comment_id: int) -> str:
+    """Encode a comment id as a fixed-width path segment"""
+    return str(comment_id).zfill(COMMENT_PATH_WIDTH)
 
 class Comment(Base):
     """Comment model - for piece feedback"""
@@ -100,13 +157,60 @@ class Comment(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Threading
+    path = Column(String(255), index=True)  # Materialised path, includes own id
+    depth = Column(Integer, default=0, nullable=False)  # 0 = top-level comment
+    reply_count = Column(Integer, default=0, nullable=False)  # All replies below this comment
+    
     # Foreign keys
-    author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    piece_id = Column(Integer, ForeignKey("pieces.id"), nullable=False)
+    # NULL once the author's account is purged; the comment stays as a placeholder for its replies
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True)
+    piece_id = Column(Integer, ForeignKey("pieces.id", ondelete="CASCADE"), nullable=False)
+    parent_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), index=True)
     
     # Relationships
     author = relationship("User", back_populates="comments")
     piece = relationship("Piece", back_populates="comments")
+    
+    __table_args__ = (
+        # Top-level comments for a piece, newest first
+        Index("ix_comments_piece_parent_created", "piece_id", "parent_id", "created_at"),
+    )
+    
+    @property
+    def ancestor_ids(self):
+        """Ids of every comment above this one, root first"""
+        if not self.path:
+            return []
+        return [int(segment) for segment in self.path.split(COMMENT_PATH_SEPARATOR)[:-1]]
+
+def comment_subtree_filter(path: str):
+    """
+    Filter matching every descendant of the comment at `path`.
+    Descendant paths start with "<path>/" and "0" is the character right
+    after "/", so this is a plain index range rather than a LIKE scan.
+    """
+    return (Comment.path > path + COMMENT_PATH_SEPARATOR) & (Comment.path < path + "0")
+
+def live_user_ids():
+    """Subquery of users whose accounts haven't been deleted"""
+    return select(User.id).where(User.deleted_at.is_(None))
+
+def visible_comment_filter():
+    """
+    Comments to show: those by live accounts, plus placeholders for deleted
+    accounts' comments that still have replies under them. reply_count
+    only counts visible replies (see comments_removed_from_counts).
+    """
+    return Comment.author_id.in_(live_user_ids()) | (Comment.reply_count > 0)
+
+def comments_removed_from_counts(paths) -> Dict[int, int]:
+    """How many of the replies at these paths each ancestor comment loses"""
+    removed = Counter()
+    for path in paths:
+        if path:
+            removed.update(int(segment) for segment in path.split(COMMENT_PATH_SEPARATOR)[:-1])
+    return removed
 
 class Like(Base):
     """Like model - for piece appreciation"""
@@ -116,8 +220,8 @@ class Like(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Foreign keys
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    piece_id = Column(Integer, ForeignKey("pieces.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    piece_id = Column(Integer, ForeignKey("pieces.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # Relationships
     user = relationship("User", back_populates="likes")
@@ -154,8 +258,105 @@ class CompetitionEntry(Base):
     
     # Foreign keys
     competition_id = Column(Integer, ForeignKey("competitions.id"), nullable=False)
-    piece_id = Column(Integer, ForeignKey("pieces.id"), nullable=False)
+    piece_id = Column(Integer, ForeignKey("pieces.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # Relationships
     competition = relationship("Competition", back_populates="entries")
-    piece = relationship("Piece", back_populates="competition_entries")
\ No newline at end of file
+    piece = relationship("Piece", back_populates="competition_entries")
+
+class Tag(Base):
+    """Tag model - free-form labels on pieces (letters, colours, cities...)"""
+    __tablename__ = "tags"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(30), unique=True, index=True, nullable=False)
+    
+    # Relationships
+    pieces = relationship("Piece", secondary=piece_tags, back_populates="tags")
+
+class FacetCount(Base):
+    """
+    Facet count model - number of public pieces per piece type, surface and
+    tag. Maintained by tags.adjust_facet_counts() so the filter sidebar never
+    has to GROUP BY over all pieces.
+    """
+    __tablename__ = "facet_counts"
+    
+    facet = Column(String(20), primary_key=True)  # "piece_type", "surface" or "tag"
+    value = Column(String(50), primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        # Top values of a facet
+        Index("ix_facet_counts_facet_count", "facet", "count"),
+    )
+
+class MapCell(Base):
+    """
+    Map cell model - public geotagged pieces per clustering grid cell, one
+    grid per zoom level. Maintained by geo.add_to_map_cells() and
+    geo.remove_pieces_from_map_cells() so zoomed-out map views read a
+    handful of cells instead of grouping every piece in the viewport.
+    """
+    __tablename__ = "map_cells"
+    
+    zoom = Column(Integer, primary_key=True)
+    lat_cell = Column(Integer, primary_key=True)
+    lng_cell = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+    lat_sum = Column(Float, default=0, nullable=False)  # Marker goes at the average position
+    lng_sum = Column(Float, default=0, nullable=False)
+    piece_id = Column(Integer)  # A piece in the cell; the marker links to it when count == 1
+
+class ActivityEvent(Base):
+    """Activity event model - append-only, written in batches by activity.py"""
+    __tablename__ = "activity_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    verb = Column(Enum(ActivityVerb), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Foreign keys
+    recipient_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    actor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    piece_id = Column(Integer, ForeignKey("pieces.id", ondelete="CASCADE"), nullable=False, index=True)
+    comment_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"))
+    
+    # Relationships
+    actor = relationship("User", foreign_keys=[actor_id])
+    
+    __table_args__ = (
+        # A user's feed, newest first
+        Index("ix_activity_events_recipient_id_id", "recipient_id", "id"),
+    )
+
+class PieceNeighbor(Base):
+    """Top co-liked pieces per piece, written by recommend.py"""
+    __tablename__ = "piece_neighbors"
+    
+    piece_id = Column(Integer, ForeignKey("pieces.id", ondelete="CASCADE"), primary_key=True)
+    neighbor_id = Column(Integer, ForeignKey("pieces.id", ondelete="CASCADE"), primary_key=True, index=True)
+    score = Column(Float, nullable=False)  # Cosine similarity of the two pieces' likers
+    co_likes = Column(Integer, nullable=False)  # Users who liked both
+    
+    __table_args__ = (
+        # "More like this" for a piece, best first
+        Index("ix_piece_neighbors_piece_score", "piece_id", "score"),
+    )
+
+class ReplicationHeartbeat(Base):
+    """Single-row timestamp used to measure read replica lag"""
+    __tablename__ = "replication_heartbeat"
+    
+    id = Column(Integer, primary_key=True)
+    beat_at = Column(Float, nullable=False)  # Unix time of the last stamp on the primary
+
+class RevokedToken(Base):
+    """Backing table for the in-memory token denylist (see revocation.py)"""
+    __tablename__ = "revoked_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(36), unique=True, nullable=False)
+    token_type = Column(String(10), nullable=False)  # "access" or "refresh"
+    expires_at = Column(DateTime, nullable=False, index=True)  # Row can go once the token would be rejected anyway
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,305 @@
+"""
+On-demand request profiling.
+
+Off by default and not even installed unless profiling_token is set, so
+normal requests pay nothing. When on, a request is profiled if it carries
+the header
+
+    X-Profile: <profiling_token>
+
+or is picked at random at profiling_sample_rate (which needs the token
+too, since that is what the download endpoints check). For a profiled
+request we record:
+
+- a CPU/wall-clock profile: a sampler thread grabs the endpoint's stack
+  every profiling_interval_ms. Sync endpoints run in the threadpool, where
+  a cProfile started by the middleware can't see them, so we sample the
+  thread the endpoint actually runs on instead. Async endpoints share the
+  event-loop thread with every other request, so a sample only counts
+  while this endpoint's own frame is on the stack: the time it spends
+  awaiting is not in the profile (the SQL trace below still is). Samples
+  are written as folded stacks ("a;b;c 12"), which flamegraph.pl,
+  speedscope and inferno all read directly.
+- every SQL statement the request ran, with parameters and timings.
+
+Both are saved under profiling_dir and listed at /api/debug/profiles
+(same token required). The response carries X-Profile-Id so you know which
+one to download.
+"""
+import asyncio
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from .config import settings
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_current: ContextVar[Optional["ProfileCapture"]] = ContextVar("profile_capture", default=None)
+
+def enabled() -> bool:
+    if settings.profiling_sample_rate > 0 and not settings.profiling_token:
+        raise RuntimeError("PROFILING_SAMPLE_RATE needs PROFILING_TOKEN, or the profiles can't be downloaded")
+    return bool(settings.profiling_token)
+
+class ProfileCapture:
+    """Stack samples and SQL statements for one request"""
+
+    def __init__(self, method: str, path: str, query_string: str):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.status = None
+        self.stacks = Counter()
+        self.sql = []
+        self._threads = {}  # thread ident -> the endpoint's frame, where stacks are cut
+        self._lock = threading.Lock()
+
+    def watch_thread(self, root_frame):
+        with self._lock:
+            self._threads[threading.get_ident()] = root_frame
+
+    def unwatch_thread(self):
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            watched = list(self._threads.items())
+        for ident, root_frame in watched:
+            frame = frames.get(ident)
+            stack = _fold(frame, root_frame) if frame is not None else None
+            if stack is not None:
+                self.stacks[stack] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query_string": self.query_string,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 2),
+            "samples": sum(self.stacks.values()),
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(statement["duration_ms"] for statement in self.sql), 2),
+        }
+
+def _fold(frame, root_frame) -> Optional[str]:
+    """
+    Leaf frame -> "root;...;leaf", cut at the endpoint so server internals
+    don't show. None if the endpoint isn't on the stack (an async endpoint
+    that is awaiting while the loop runs something else).
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        if frame is root_frame:
+            return ";".join(reversed(names))
+        frame = frame.f_back
+    return None
+
+class _Sampler(threading.Thread):
+    def __init__(self, capture: ProfileCapture, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.capture = capture
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.capture.sample()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+class ProfilingMiddleware:
+    """Decides which requests to profile and saves their captures"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        if settings.profiling_token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.lower().encode():
+                    return hmac.compare_digest(value.decode("latin-1"), settings.profiling_token)
+        return random.random() < settings.profiling_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/api/debug/") or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        capture = ProfileCapture(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"))
+        token = _current.set(capture)
+        sampler = _Sampler(capture, settings.profiling_interval_ms / 1000)
+        sampler.start()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                capture.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), capture.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            capture.duration_ms = (time.perf_counter() - capture.started) * 1000
+            _current.reset(token)
+            await run_in_threadpool(save, capture)
+
+def _profile_endpoint(call):
+    """Wrap an endpoint so a profiled request samples the thread it runs on"""
+    if getattr(call, "_profiled", False):
+        return call
+
+    if asyncio.iscoroutinefunction(call):
+        @wraps(call)
+        async def wrapper(*args, **kwargs):
+            capture = _current.get()
+            if capture is None:
+                return await call(*args, **kwargs)
+            capture.watch_thread(sys._getframe())
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                capture.unwatch_thread()
+    else:
+        @wraps(call)
+        def wrapper(*args, **kwargs):
+            capture = _current.get()
+            if capture is None:
+                return call(*args, **kwargs)
+            capture.watch_thread(sys._getframe())
+            try:
+                return call(*args, **kwargs)
+            finally:
+                capture.unwatch_thread()
+
+    wrapper._profiled = True
+    return wrapper
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    capture = _current.get()
+    if capture is None or not conn.info.get("profile_query_start"):
+        return
+    started = conn.info["profile_query_start"].pop()
+    capture.sql.append({
+        "statement": statement,
+        "parameters": repr(parameters),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "database": conn.engine.url.database,
+    })
+
+def install(app, engines):
+    """Hook profiling into the app (call once, after every router is included)"""
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            route.dependant.call = _profile_endpoint(route.dependant.call)
+    for engine in engines:
+        if engine is not None:
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    app.include_router(router)
+    app.add_middleware(ProfilingMiddleware)
+
+def profile_dir() -> str:
+    """profiling_dir, with relative paths taken from the backend directory (not the CWD)"""
+    return os.path.abspath(os.path.join(BACKEND_DIR, settings.profiling_dir))
+
+def save(capture: ProfileCapture):
+    """Write <id>.folded and <id>.json, keeping only the newest profiling_keep"""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, capture.id)
+    with open(base + ".folded", "w") as f:
+        f.write(capture.folded())
+    with open(base + ".json", "w") as f:
+        json.dump({**capture.summary(), "sql": capture.sql}, f, indent=1)
+
+    summaries = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    for name in summaries[:-settings.profiling_keep]:
+        for extension in (".json", ".folded"):
+            try:
+                os.remove(os.path.join(directory, name[:-5] + extension))
+            except FileNotFoundError:
+                pass
+
+# Download endpoints, guarded by the same token
+router = APIRouter(prefix="/api/debug/profiles", tags=["debug"])
+
+def _check_token(x_profile: Optional[str]):
+    if not settings.profiling_token or not x_profile or not hmac.compare_digest(x_profile, settings.profiling_token):
+        raise HTTPException(status_code=404, detail="Not found")
+
+def _profile_path(profile_id: str, extension: str) -> str:
+    if not all(ch.isalnum() or ch == "-" for ch in profile_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = os.path.join(profile_dir(), profile_id + extension)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+@router.get("/")
+def list_profiles(x_profile: Optional[str] = Header(None)):
+    """Saved profiles, newest first"""
+    _check_token(x_profile)
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((name for name in os.listdir(directory) if name.endswith(".json")), reverse=True)
+    profiles = []
+    for name in names:
+        with open(os.path.join(directory, name)) as f:
+            data = json.load(f)
+        data.pop("sql", None)
+        profiles.append(data)
+    return profiles
+
+@router.get("/{profile_id}")
+def read_profile(profile_id: str, x_profile: Optional[str] = Header(None)):
+    """Summary plus the full SQL trace"""
+    _check_token(x_profile)
+    with open(_profile_path(profile_id, ".json")) as f:
+        return json.load(f)
+
+@router.get("/{profile_id}/folded", response_class=PlainTextResponse)
+def read_profile_stacks(profile_id: str, x_profile: Optional[str] = Header(None)):
+    """Folded stacks, e.g. `flamegraph.pl stacks.folded > flame.svg` or open in speedscope"""
+    _check_token(x_profile)
+    with open(_profile_path(profile_id, ".folded")) as f:
+        return PlainTextResponse(f.read(), headers={
+            "Content-Disposition": f'attachment; filename="{profile_id}.folded"',
+        })
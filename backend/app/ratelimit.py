@@ -0,0 +1,192 @@
+"""
+Rate limiting and admission control.
+
+Per-route token buckets keyed by user (or client IP when anonymous), with
+budgets configured in Settings.rate_limits, plus a global cap on in-flight
+requests that sheds load with a 503 before the database pool runs dry.
+"""
+import importlib
+import threading
+import time
+from typing import Optional, Tuple
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+from .config import settings
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_budget(budget: str) -> Tuple[int, float]:
+    """Parse "10/minute" into (capacity, tokens refilled per second)"""
+    count, _, period = budget.partition("/")
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip()]
+
+class RateLimitBackend:
+    """Token bucket store. Subclass this to share buckets between workers."""
+
+    def acquire(self, key: str, capacity: int, refill_rate: float) -> Tuple[bool, float]:
+        """Take one token. Returns (allowed, seconds until a token is available)."""
+        raise NotImplementedError
+
+class InMemoryBackend(RateLimitBackend):
+    """Buckets held in this process - fine for a single worker or local dev"""
+
+    SWEEP_SIZE = 10000
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated, seconds until full again)
+        self._sweep_at = self.SWEEP_SIZE
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, capacity: int, refill_rate: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, 0.0))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                allowed, retry_after = True, 0.0
+            else:
+                allowed, retry_after = False, (1 - tokens) / refill_rate
+            self._buckets[key] = (tokens, now, (capacity - tokens) / refill_rate)
+
+            if len(self._buckets) > self._sweep_at:
+                self._sweep(now)
+        return allowed, retry_after
+
+    def _sweep(self, now: float):
+        """Forget buckets that would be full again anyway (each by its own budget)"""
+        self._buckets = {
+            key: value for key, value in self._buckets.items()
+            if now - value[1] < value[2]
+        }
+        # If most buckets are still in use, don't sweep again on the very next call
+        self._sweep_at = max(self.SWEEP_SIZE, 2 * len(self._buckets))
+
+class RedisBackend(RateLimitBackend):
+    """Buckets shared between workers through Redis (needs the redis package)"""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate))
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str):
+        import redis  # Optional dependency, only needed for this backend
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def acquire(self, key: str, capacity: int, refill_rate: float) -> Tuple[bool, float]:
+        allowed, tokens = self._script(keys=[f"ratelimit:{key}"], args=[capacity, refill_rate, time.time()])
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / refill_rate
+
+def create_backend() -> RateLimitBackend:
+    """Build the backend named in settings ("memory", "redis" or "module:Class")"""
+    name = settings.rate_limit_backend
+    if name == "memory":
+        return InMemoryBackend()
+    if name == "redis":
+        return RedisBackend(settings.rate_limit_redis_url)
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+_backend: Optional[RateLimitBackend] = None
+
+def get_backend() -> RateLimitBackend:
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+def client_key(request: Request) -> str:
+    """
+    Identify the caller: the username from a bearer token if there is one,
+    otherwise the client IP. The token is only decoded here, never looked
+    up, so limiting costs no database round trip.
+    """
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+            if payload.get("sub"):
+                return f"user:{payload['sub']}"
+        except JWTError:
+            pass
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+class RateLimit:
+    """
+    Route dependency enforcing the budget named `name` in settings.rate_limits.
+
+        @router.post("/login", dependencies=[Depends(RateLimit("login"))])
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __call__(self, request: Request):
+        budget = settings.rate_limits.get(self.name)
+        if not settings.rate_limit_enabled or not budget:
+            return
+
+        capacity, refill_rate = parse_budget(budget)
+        allowed, retry_after = get_backend().acquire(
+            f"{self.name}:{client_key(request)}", capacity, refill_rate
+        )
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+
+class AdmissionControlMiddleware:
+    """
+    Caps the number of requests being processed at once. Past the cap new
+    requests get an immediate 503 instead of queueing on the database pool.
+    """
+
+    def __init__(self, app, max_concurrent: int, exempt_paths=()):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.exempt_paths = tuple(exempt_paths)
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        if self.in_flight >= self.max_concurrent:
+            response = JSONResponse(
+                {"detail": "Server busy, please retry"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
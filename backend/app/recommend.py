@@ -0,0 +1,286 @@
+"""
+"More like this" recommendations from co-likes.
+
+Two pieces are similar when the same people like them: the score is the
+cosine similarity of their liker sets,
+
+    users who liked both / sqrt(likes of A * likes of B)
+
+The top recommend_neighbors for each piece are stored in piece_neighbors,
+so serving them is one index range scan (see /api/pieces/{id}/related).
+
+The neighbours are computed with sparse matrices. Likes form a users x
+pieces 0/1 matrix X, and X.T @ X holds the co-like counts of every pair.
+rebuild() does this for all likes, a block of pieces at a time, and is
+meant to run nightly:
+
+    python -m app.recommend
+
+Between rebuilds, RecommendationUpdater keeps things fresh. A like or unlike
+changes the co-like counts between the piece and the liker's other likes,
+and the piece's like count, which moves its score in every row that lists
+it. An unliked piece can even climb into rows that didn't list it before.
+So every so often the updater recomputes the rows of the liked pieces, the
+liker's recent other likes, the pieces listing a changed piece and, for
+unlikes, the pieces most often co-liked with it - using the same code on
+the sub-matrix of users who liked them. Both lists stop at
+recommend_fanout pieces; within that this matches a full rebuild, and the
+nightly rebuild picks up the rest.
+
+numpy and scipy are imported lazily so they don't add to app start-up.
+"""
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import select, delete, insert, func
+from .config import settings
+from . import models
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BLOCK_SIZE = 2000  # Pieces per X.T @ X block in a full rebuild
+
+def _visible_likes():
+    """(user_id, piece_id) for likes on public, not deleted pieces"""
+    likes = models.Like.__table__
+    pieces = models.Piece.__table__
+    return select(likes.c.user_id, likes.c.piece_id)\
+        .join(pieces, pieces.c.id == likes.c.piece_id)\
+        .where(pieces.c.is_public == True, pieces.c.deleted_at.is_(None))
+
+def top_neighbours(
+    pairs,
+    row_piece_ids: Iterable[int],
+    like_counts: Optional[Dict[int, int]] = None,
+    k: Optional[int] = None,
+    min_co_likes: Optional[int] = None,
+    block_size: int = REBUILD_BLOCK_SIZE
+) -> List[dict]:
+    """
+    Top-k co-liked neighbours for each piece in row_piece_ids.
+
+    pairs must hold every like by every user who liked one of those pieces
+    (so each of them appears in pairs).
+    like_counts gives each piece's total likes; if None they are counted
+    from pairs (correct when pairs is the whole likes table).
+    """
+    import numpy as np
+    from scipy import sparse
+
+    if k is None:
+        k = settings.recommend_neighbors
+    if min_co_likes is None:
+        min_co_likes = settings.recommend_min_co_likes
+
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if not len(pairs):
+        return []
+    user_ids, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    piece_ids, piece_index = np.unique(pairs[:, 1], return_inverse=True)
+
+    # users x pieces, 1 where liked (duplicate likes count once)
+    X = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_index, piece_index)),
+        shape=(len(user_ids), len(piece_ids)),
+    )
+    X.data[:] = 1
+    Xt = X.T.tocsr()
+
+    if like_counts is None:
+        totals = np.asarray(X.sum(axis=0)).ravel()
+    else:
+        totals = np.array([like_counts.get(int(piece_id), 0) for piece_id in piece_ids], dtype=np.float32)
+    norms = np.sqrt(np.maximum(totals, 1))
+
+    rows = np.searchsorted(piece_ids, np.fromiter(row_piece_ids, dtype=np.int64))
+
+    neighbours = []
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        co = (Xt[block] @ X).tocoo()  # co-like counts, one row per piece in the block
+
+        row_index = block[co.row]
+        keep = (co.data >= min_co_likes) & (co.col != row_index)
+        row_index, col, counts = row_index[keep], co.col[keep], co.data[keep]
+        scores = counts / (norms[row_index] * norms[col])
+
+        # Best k per row, without a Python loop: sort by (row, -score, piece
+        # id, so ties break the same way whatever the sub-matrix) and keep
+        # the first k of each run of equal rows
+        order = np.lexsort((col, -scores, row_index))
+        row_index, col, counts, scores = row_index[order], col[order], counts[order], scores[order]
+        run_starts = np.flatnonzero(np.r_[True, row_index[1:] != row_index[:-1]])
+        run_lengths = np.diff(np.r_[run_starts, len(row_index)])
+        rank = np.arange(len(row_index)) - np.repeat(run_starts, run_lengths)
+        top = rank < k
+
+        for piece, neighbour, score, co_likes in zip(
+            piece_ids[row_index[top]], piece_ids[col[top]], scores[top], counts[top]
+        ):
+            neighbours.append({
+                "piece_id": int(piece),
+                "neighbor_id": int(neighbour),
+                "score": float(score),
+                "co_likes": int(co_likes),
+            })
+    return neighbours
+
+def rebuild(engine=None) -> int:
+    """Recompute every piece's neighbours from the whole likes table"""
+    if engine is None:
+        from .database import engine
+
+    with engine.connect() as conn:
+        pairs = conn.execute(_visible_likes()).all()
+    piece_ids = sorted({piece_id for _, piece_id in pairs})
+    neighbours = top_neighbours(pairs, piece_ids)
+
+    table = models.PieceNeighbor.__table__
+    with engine.begin() as conn:
+        conn.execute(delete(table))
+        if neighbours:
+            conn.execute(insert(table), neighbours)
+    return len(neighbours)
+
+def refresh(engine, piece_ids: Set[int]):
+    """Recompute the neighbours of just these pieces"""
+    if not piece_ids:
+        return
+    likes = models.Like.__table__
+    table = models.PieceNeighbor.__table__
+
+    with engine.connect() as conn:
+        likers = select(likes.c.user_id).where(likes.c.piece_id.in_(piece_ids))
+        pairs = conn.execute(_visible_likes().where(likes.c.user_id.in_(likers))).all()
+        candidates = {piece_id for _, piece_id in pairs}
+        like_counts = dict(conn.execute(
+            select(likes.c.piece_id, func.count())
+            .where(likes.c.piece_id.in_(candidates))
+            .group_by(likes.c.piece_id)
+        ).all()) if candidates else {}
+
+    neighbours = top_neighbours(pairs, sorted(piece_ids & candidates), like_counts)
+
+    with engine.begin() as conn:
+        conn.execute(delete(table).where(table.c.piece_id.in_(piece_ids)))
+        if neighbours:
+            conn.execute(insert(table), neighbours)
+
+class RecommendationUpdater:
+    """Collects likes/unlikes and periodically refreshes the pieces they touch"""
+
+    def __init__(self, engine, interval: float, fanout: int):
+        self.engine = engine
+        self.interval = interval
+        self.fanout = fanout
+        self._changes = set()  # (user_id, piece_id)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background updater (called from the app lifespan)"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="recommend-updater", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add(self, user_id: int, piece_id: int):
+        with self._lock:
+            self._changes.add((user_id, piece_id))
+
+    def flush(self):
+        """Refresh every row the likes and unlikes since the last flush can have changed"""
+        with self._lock:
+            changes, self._changes = self._changes, set()
+        if not changes:
+            return
+
+        likes = models.Like.__table__
+        neighbors = models.PieceNeighbor.__table__
+        users = {user_id for user_id, _ in changes}
+        changed = {piece_id for _, piece_id in changes}
+        dirty = set(changed)
+        recent = select(
+            likes.c.piece_id,
+            func.row_number().over(
+                partition_by=likes.c.user_id, order_by=likes.c.id.desc()
+            ).label("position"),
+        ).where(likes.c.user_id.in_(users)).subquery()
+        try:
+            with self.engine.connect() as conn:
+                # Co-like counts with the liker's other likes changed
+                dirty.update(conn.execute(
+                    select(recent.c.piece_id).where(recent.c.position <= self.fanout)
+                ).scalars())
+                # Like counts changed, so the score in every row listing the piece did too
+                dirty.update(conn.execute(
+                    select(neighbors.c.piece_id).where(neighbors.c.neighbor_id.in_(changed))
+                ).scalars())
+                # An unliked piece scores higher with everything else its likers like
+                still_liked = {tuple(row) for row in conn.execute(
+                    select(likes.c.user_id, likes.c.piece_id)
+                    .where(likes.c.user_id.in_(users), likes.c.piece_id.in_(changed))
+                )}
+                for piece_id in {piece_id for _, piece_id in changes - still_liked}:
+                    dirty.update(conn.execute(self._closest_co_liked(piece_id)).scalars())
+            refresh(self.engine, dirty)
+        except Exception:
+            # Recommendations are best effort; the nightly rebuild catches up
+            logger.exception("Could not refresh neighbours for %d pieces", len(dirty))
+
+    def _closest_co_liked(self, piece_id: int):
+        """
+        The fanout pieces most often co-liked with piece_id. Fewer than
+        min_co_likes can't list it at all, and the rest of a popular piece's
+        co-likes are left to the nightly rebuild.
+        """
+        likes = models.Like.__table__
+        likers = select(likes.c.user_id).where(likes.c.piece_id == piece_id)
+        co_likes = func.count()
+        return select(likes.c.piece_id)\
+            .where(likes.c.user_id.in_(likers), likes.c.piece_id != piece_id)\
+            .group_by(likes.c.piece_id)\
+            .having(co_likes >= settings.recommend_min_co_likes)\
+            .order_by(co_likes.desc(), likes.c.piece_id)\
+            .limit(self.fanout)
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self.flush()
+
+_updater: Optional[RecommendationUpdater] = None
+
+def get_updater() -> RecommendationUpdater:
+    global _updater
+    if _updater is None:
+        from .database import engine
+        _updater = RecommendationUpdater(
+            engine, settings.recommend_update_interval_seconds, settings.recommend_fanout
+        )
+    return _updater
+
+def related_pieces(db, piece_id: int, limit: int):
+    """Stored neighbours of a piece that are still visible, best first"""
+    return db.query(models.Piece, models.PieceNeighbor.score)\
+        .join(models.PieceNeighbor, models.PieceNeighbor.neighbor_id == models.Piece.id)\
+        .filter(
+            models.PieceNeighbor.piece_id == piece_id,
+            models.Piece.is_public == True,
+            models.Piece.deleted_at.is_(None),
+        )\
+        .order_by(models.PieceNeighbor.score.desc())\
+        .limit(limit)\
+        .all()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Stored %d piece neighbours", rebuild())
@@ -0,0 +1,127 @@
+"""
+Revoked token denylist.
+
+Access tokens are checked on every request, so the check has to be cheap:
+each worker keeps the jti of every revoked, not-yet-expired access token in
+an in-memory set and never asks the database. Revocations are written to
+the revoked_tokens table; every revocation_sync_seconds a background
+thread re-reads all unexpired access-token rows, merging in what other
+workers added, and forgets entries once the token they name has expired.
+Reading the whole set rather than rows past a watermark means a revocation
+whose transaction commits late is still picked up. Access tokens are
+short-lived, so the set stays small.
+
+Refresh tokens are only used on /api/auth/refresh, which can afford a
+database round trip: inserting the jti is what makes each refresh token
+single use, since a second insert hits the unique constraint.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import insert, select, delete
+from sqlalchemy.exc import IntegrityError
+from .config import settings
+from . import models
+
+logger = logging.getLogger(__name__)
+
+class TokenDenylist:
+    """Expiring set of revoked access-token ids, synced from revoked_tokens"""
+
+    def __init__(self, engine, sync_interval: float):
+        self.engine = engine
+        self.sync_interval = sync_interval
+        self._expires: Dict[str, float] = {}  # jti -> unix time the token expires
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._expires
+
+    def add(self, jti: str, expires_at: float):
+        with self._lock:
+            self._expires[jti] = expires_at
+
+    def start(self):
+        """Load current revocations and keep syncing (called from the app lifespan)"""
+        self.sync()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="token-denylist", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sync(self):
+        """Merge in every unexpired revocation and drop expired entries"""
+        revoked = models.RevokedToken.__table__
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(revoked.c.jti, revoked.c.expires_at)
+                .where(revoked.c.token_type == "access", revoked.c.expires_at > datetime.utcnow())
+            ).all()
+
+        # Merge rather than replace: this worker's own revocations may not be committed yet
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                self._expires[row.jti] = _timestamp(row.expires_at)
+            self._expires = {jti: exp for jti, exp in self._expires.items() if exp > now}
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.sync_interval)
+            if self._stopping:
+                break
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Could not sync revoked tokens")
+
+def _timestamp(naive_utc: datetime) -> float:
+    return (naive_utc - datetime(1970, 1, 1)).total_seconds()
+
+_denylist: Optional[TokenDenylist] = None
+
+def get_denylist() -> TokenDenylist:
+    global _denylist
+    if _denylist is None:
+        from .database import engine
+        _denylist = TokenDenylist(engine, settings.revocation_sync_seconds)
+    return _denylist
+
+def is_revoked(jti: Optional[str]) -> bool:
+    """In-memory check used on every authenticated request"""
+    return jti is not None and jti in get_denylist()
+
+def revoke(db, jti: str, token_type: str, expires_at: float) -> bool:
+    """
+    Record a revocation in the current transaction. Returns False if the
+    token was already revoked (for refresh tokens: already used).
+    """
+    try:
+        with db.begin_nested():
+            db.execute(insert(models.RevokedToken.__table__).values(
+                jti=jti,
+                token_type=token_type,
+                expires_at=datetime.utcfromtimestamp(expires_at),
+            ))
+    except IntegrityError:
+        return False
+    if token_type == "access":
+        get_denylist().add(jti, expires_at)
+    return True
+
+def purge_expired(engine):
+    """Drop rows for tokens that have expired anyway (run by the cleanup worker)"""
+    revoked = models.RevokedToken.__table__
+    with engine.begin() as conn:
+        conn.execute(delete(revoked).where(revoked.c.expires_at < datetime.utcnow()))
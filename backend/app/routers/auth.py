@@ -1,17 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError
+from typing import Optional
 from sqlalchemy.orm import Session
-from datetime import timedelta
-from .. import models, schemas, auth
+from datetime import datetime, timedelta
+from .. import models, schemas, auth, revocation, geo, tags as tag_index
 from ..database import get_db
 from ..config import settings
+from ..ratelimit import RateLimit
 
 router = APIRouter(
     prefix="/api/auth",
     tags=["authentication"]
 )
 
-@router.post("/register", response_model=schemas.User)
+@router.post("/register", response_model=schemas.User, dependencies=[Depends(RateLimit("register"))])
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
     # Check if username exists
@@ -46,7 +49,7 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
-@router.post("/login", response_model=schemas.Token)
+@router.post("/login", response_model=schemas.Token, dependencies=[Depends(RateLimit("login"))])
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Login with username and password"""
     user = auth.authenticate_user(db, form_data.username, form_data.password)
@@ -56,11 +59,72 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return issue_tokens(user.username)
+
+def issue_tokens(username: str) -> dict:
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = auth.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": username}, expires_delta=access_token_expires
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": auth.create_refresh_token(username),
+    }
+
+@router.post("/refresh", response_model=schemas.Token, dependencies=[Depends(RateLimit("refresh"))])
+def refresh(body: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """Swap a refresh token for a new access token and refresh token"""
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    try:
+        payload = auth.decode_token(body.refresh_token, "refresh")
+    except JWTError:
+        raise invalid
+    
+    # Rotation: each refresh token works once, a replayed one is rejected
+    if not revocation.revoke(db, payload["jti"], "refresh", payload["exp"]):
+        raise invalid
+    
+    user = db.query(models.User).filter(models.User.username == payload["sub"]).first()
+    if user is None or not user.is_active or user.deleted_at is not None:
+        raise invalid
+    
+    db.commit()
+    return issue_tokens(user.username)
+
+@router.post("/logout", response_model=schemas.MessageResponse)
+def logout(
+    body: Optional[schemas.LogoutRequest] = None,
+    token: str = Depends(auth.oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    """Revoke the current access token (and the refresh token, if sent)"""
+    try:
+        payload = auth.decode_token(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    if payload.get("jti"):
+        revocation.revoke(db, payload["jti"], "access", payload["exp"])
+    
+    if body and body.refresh_token:
+        try:
+            refresh_payload = auth.decode_token(body.refresh_token, "refresh")
+        except JWTError:
+            refresh_payload = None  # Expired or already revoked - nothing to do
+        if refresh_payload and refresh_payload["sub"] == payload["sub"]:
+            revocation.revoke(db, refresh_payload["jti"], "refresh", refresh_payload["exp"])
+    
+    db.commit()
+    return {"message": "Logged out"}
 
 @router.get("/me", response_model=schemas.User)
 def read_users_me(current_user: models.User = Depends(auth.get_current_active_user)):
@@ -79,4 +143,34 @@ def update_user(
     
     db.commit()
     db.refresh(current_user)
-    return current_user
\ No newline at end of file
+    return current_user
+
+@router.delete("/me", response_model=schemas.MessageResponse)
+def delete_account(
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Delete your account and all your pieces"""
+    now = datetime.utcnow()
+    own_pieces = (models.Piece.artist_id == current_user.id) & models.Piece.deleted_at.is_(None)
+
+    # Soft delete only; the cleanup worker removes the rows later
+    tag_index.remove_pieces_from_facets(db, own_pieces)
+    geo.remove_pieces_from_map_cells(db, own_pieces)
+    db.query(models.Piece).filter(own_pieces).update({"deleted_at": now}, synchronize_session=False)
+    
+    # Their replies drop out of threads now, so drop them from the reply counts above them
+    paths = db.query(models.Comment.path).filter(models.Comment.author_id == current_user.id, models.Comment.depth > 0)
+    by_amount = {}
+    for comment_id, amount in models.comments_removed_from_counts(path for (path,) in paths).items():
+        by_amount.setdefault(amount, []).append(comment_id)
+    for amount, comment_ids in by_amount.items():
+        db.query(models.Comment)\
+            .filter(models.Comment.id.in_(comment_ids))\
+            .update({models.Comment.reply_count: models.Comment.reply_count - amount}, synchronize_session=False)
+    
+    current_user.deleted_at = now
+    current_user.is_active = False
+    db.commit()
+
+    return {"message": "Account deleted successfully"}
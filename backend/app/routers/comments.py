@@ -1,23 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select
 from typing import List
-from .. import models, schemas, auth
-from ..database import get_db
+from .. import models, schemas, auth, activity, live, serialization
+from ..database import get_db, get_read_db
+from ..ratelimit import RateLimit
 
 router = APIRouter(
     prefix="/api/comments",
     tags=["comments"]
 )
 
-@router.post("/", response_model=schemas.Comment)
+@router.post("/", response_model=schemas.Comment, dependencies=[Depends(RateLimit("comment"))])
 def create_comment(
     comment: schemas.CommentCreate,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    """Add a comment to a piece"""
+    """Add a comment to a piece, or a reply to another comment"""
     # Check if piece exists
-    piece = db.query(models.Piece).filter(models.Piece.id == comment.piece_id).first()
+    piece = db.query(models.Piece).filter(models.Piece.id == comment.piece_id, models.Piece.deleted_at.is_(None)).first()
     if not piece:
         raise HTTPException(status_code=404, detail="Piece not found")
     
@@ -25,28 +27,69 @@ def create_comment(
     if not piece.is_public and piece.artist_id != current_user.id:
         raise HTTPException(status_code=403, detail="Cannot comment on private piece")
     
+    # Replies must point at a visible comment on the same piece
+    parent = None
+    attach_to = None
+    if comment.parent_id is not None:
+        parent = db.query(models.Comment)\
+            .filter(models.Comment.id == comment.parent_id, models.visible_comment_filter())\
+            .first()
+        if not parent or parent.piece_id != comment.piece_id:
+            raise HTTPException(status_code=404, detail="Parent comment not found")
+        if not parent.path:
+            # Written before threading existed, so always a top-level comment
+            parent.path = models.comment_path_segment(parent.id)
+        attach_to = parent
+        if parent.depth >= models.COMMENT_MAX_DEPTH:
+            # Thread is as deep as it goes; reply alongside the parent instead
+            attach_to = db.query(models.Comment).filter(models.Comment.id == parent.parent_id).first()
+    
     # Create comment
     db_comment = models.Comment(
         content=comment.content,
         piece_id=comment.piece_id,
-        author_id=current_user.id
+        author_id=current_user.id,
+        parent_id=attach_to.id if attach_to else None,
+        depth=attach_to.depth + 1 if attach_to else 0
     )
     
     db.add(db_comment)
+    db.flush()  # Assigns the id we need for the path
+    
+    segment = models.comment_path_segment(db_comment.id)
+    if attach_to:
+        db_comment.path = f"{attach_to.path}{models.COMMENT_PATH_SEPARATOR}{segment}"
+        # Bump the reply count of every ancestor in one statement
+        db.query(models.Comment)\
+            .filter(models.Comment.id.in_(db_comment.ancestor_ids))\
+            .update({models.Comment.reply_count: models.Comment.reply_count + 1}, synchronize_session=False)
+    else:
+        db_comment.path = segment
+    
     db.commit()
     db.refresh(db_comment)
+    
+    # Let the artist (and whoever was replied to, even when the reply was
+    # attached further up the thread) know
+    activity.record(models.ActivityVerb.COMMENT, piece.artist_id, current_user.id, piece.id, db_comment.id)
+    if parent and serialization.is_live(parent.author) and parent.author_id != piece.artist_id:
+        activity.record(models.ActivityVerb.REPLY, parent.author_id, current_user.id, piece.id, db_comment.id)
+    
+    live.publish_comment(piece.id, schemas.Comment.model_validate(db_comment).model_dump(mode="json"))
+    
     return db_comment
 
-@router.get("/piece/{piece_id}", response_model=List[schemas.Comment])
+@router.get("/piece/{piece_id}", response_model=List[schemas.CommentThread])
 def get_piece_comments(
     piece_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    replies_limit: int = Query(3, ge=0, le=20),
+    db: Session = Depends(get_read_db)
 ):
-    """Get all comments for a piece"""
+    """Get top-level comments for a piece, each with its first few replies"""
     # Check if piece exists and is public
-    piece = db.query(models.Piece).filter(models.Piece.id == piece_id).first()
+    piece = db.query(models.Piece).filter(models.Piece.id == piece_id, models.Piece.deleted_at.is_(None)).first()
     if not piece:
         raise HTTPException(status_code=404, detail="Piece not found")
     
@@ -54,13 +97,80 @@ def get_piece_comments(
         raise HTTPException(status_code=403, detail="Cannot view comments on private piece")
     
     comments = db.query(models.Comment)\
-        .filter(models.Comment.piece_id == piece_id)\
+        .options(joinedload(models.Comment.author))\
+        .filter(
+            models.Comment.piece_id == piece_id,
+            models.Comment.parent_id.is_(None),
+            models.visible_comment_filter()
+        )\
         .order_by(models.Comment.created_at.desc())\
         .offset(skip)\
         .limit(limit)\
         .all()
     
-    return comments
+    # Fetch the first N direct replies of every comment on the page in a
+    # single query, ranking replies per parent with a window function
+    replies_by_parent = {}
+    if comments and replies_limit:
+        ranked = select(
+            models.Comment.id,
+            func.row_number().over(
+                partition_by=models.Comment.parent_id,
+                order_by=(models.Comment.created_at, models.Comment.id)
+            ).label("position")
+        ).where(
+            models.Comment.parent_id.in_([c.id for c in comments]),
+            models.visible_comment_filter()
+        ).subquery()
+        
+        replies = db.query(models.Comment)\
+            .options(joinedload(models.Comment.author))\
+            .join(ranked, ranked.c.id == models.Comment.id)\
+            .filter(ranked.c.position <= replies_limit)\
+            .order_by(models.Comment.created_at, models.Comment.id)\
+            .all()
+        
+        for reply in replies:
+            replies_by_parent.setdefault(reply.parent_id, []).append(reply)
+    
+    threads = [
+        serialization.comment_thread(comment, replies_by_parent.get(comment.id, []))
+        for comment in comments
+    ]
+    return serialization.json_response(List[schemas.CommentThread], threads)
+
+@router.get("/{comment_id}/thread", response_model=List[schemas.Comment])
+def get_comment_thread(
+    comment_id: int,
+    db: Session = Depends(get_read_db)
+):
+    """Get a comment and every reply below it, in thread order"""
+    comment = db.query(models.Comment)\
+        .filter(models.Comment.id == comment_id, models.visible_comment_filter())\
+        .first()
+    if not comment:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    
+    piece = db.query(models.Piece).filter(models.Piece.id == comment.piece_id, models.Piece.deleted_at.is_(None)).first()
+    if not piece:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    if not piece.is_public:
+        raise HTTPException(status_code=403, detail="Cannot view comments on private piece")
+    
+    if not comment.path:
+        return serialization.json_response(List[schemas.Comment], [serialization.comment_out(comment)])
+    
+    # One range scan on the path index; ordering by path gives depth-first order
+    descendants = db.query(models.Comment)\
+        .options(joinedload(models.Comment.author))\
+        .filter(models.comment_subtree_filter(comment.path), models.visible_comment_filter())\
+        .order_by(models.Comment.path)\
+        .all()
+    
+    return serialization.json_response(
+        List[schemas.Comment],
+        [serialization.comment_out(c) for c in [comment] + descendants]
+    )
 
 @router.delete("/{comment_id}")
 def delete_comment(
@@ -68,18 +178,34 @@ def delete_comment(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    """Delete a comment (only by author or piece owner)"""
+    """Delete a comment and its replies (only by author or piece owner)"""
     comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
     
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
     # Check if user is comment author or piece owner
-    piece = db.query(models.Piece).filter(models.Piece.id == comment.piece_id).first()
+    piece = db.query(models.Piece).filter(models.Piece.id == comment.piece_id, models.Piece.deleted_at.is_(None)).first()
+    if not piece:
+        raise HTTPException(status_code=404, detail="Comment not found")
     if comment.author_id != current_user.id and piece.artist_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
     
+    # A deleted account's comment was already taken off its ancestors' counts
+    removed = comment.reply_count + (1 if serialization.is_live(comment.author) else 0)
+    if comment.path:
+        # Remove the whole subtree and take it off the ancestors' counts
+        db.query(models.Comment)\
+            .filter(models.comment_subtree_filter(comment.path))\
+            .delete(synchronize_session=False)
+        if comment.ancestor_ids:
+            db.query(models.Comment)\
+                .filter(models.Comment.id.in_(comment.ancestor_ids))\
+                .update({models.Comment.reply_count: models.Comment.reply_count - removed}, synchronize_session=False)
+    
     db.delete(comment)
     db.commit()
     
-    return {"message": "Comment deleted successfully"}
\ No newline at end of file
+    live.publish_comment_deleted(piece.id, comment_id, removed)
+    
+    return {"message": "Comment deleted successfully"}
@@ -0,0 +1,72 @@
+import asyncio
+from starlette.concurrency import run_in_threadpool
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from .. import models, live
+from ..config import settings
+from ..database import SessionLocal
+
+router = APIRouter(
+    prefix="/api/live",
+    tags=["live"]
+)
+
+def parse_piece_ids(ids: str):
+    """Parse "1,2,3" into a set of ints"""
+    try:
+        piece_ids = {int(value) for value in ids.split(",") if value.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    
+    if not piece_ids:
+        raise HTTPException(status_code=400, detail="No piece ids given")
+    if len(piece_ids) > settings.live_max_pieces:
+        raise HTTPException(status_code=400, detail=f"At most {settings.live_max_pieces} pieces per stream")
+    return piece_ids
+
+def visible_piece_ids(piece_ids):
+    """The public, undeleted ones among piece_ids"""
+    # Short-lived session so the stream doesn't hold a connection
+    with SessionLocal() as db:
+        return {
+            piece_id for (piece_id,) in db.query(models.Piece.id)
+                .filter(models.Piece.id.in_(piece_ids), models.Piece.is_public == True, models.Piece.deleted_at.is_(None))
+        }
+
+@router.get("/pieces")
+async def stream_piece_updates(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated ids of the pieces on screen")
+):
+    """
+    Server-sent events with like and comment deltas for the given pieces.
+    Events: "like" (delta), "comment" (new comment), "comment_deleted" and
+    "resync" (the client fell behind and should refetch).
+    """
+    piece_ids = parse_piece_ids(ids)
+    
+    # Blocking query, so off the event loop like the rest of the sync I/O
+    public_ids = await run_in_threadpool(visible_piece_ids, piece_ids)
+    
+    subscription = live.hub.subscribe(public_ids)
+    
+    async def events():
+        try:
+            yield f"retry: {settings.live_retry_ms}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), settings.live_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"  # Keeps proxies from closing an idle stream
+                    continue
+                yield live.format_event(message)
+        finally:
+            live.hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,136 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from datetime import datetime, timedelta
+from typing import List, Optional
+from .. import models, schemas, auth
+from ..config import settings
+from ..database import get_db, get_read_db
+
+router = APIRouter(
+    prefix="/api/notifications",
+    tags=["notifications"]
+)
+
+ACTORS_PER_GROUP = 3
+
+@router.get("/", response_model=List[schemas.NotificationGroup])
+def read_notifications(
+    limit: int = Query(20, ge=1, le=100),
+    before_id: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Get the activity feed, with events on the same piece collapsed into groups"""
+    Event = models.ActivityEvent
+    since = datetime.utcnow() - timedelta(days=settings.activity_feed_days)
+    
+    # One row per (verb, piece): how many people and the newest event
+    latest_id = func.max(Event.id).label("latest_id")
+    groups_query = db.query(
+            Event.verb,
+            Event.piece_id,
+            func.count(Event.actor_id.distinct()).label("count"),
+            latest_id,
+            func.max(Event.created_at).label("latest_at"),
+        )\
+        .filter(Event.recipient_id == current_user.id, Event.created_at >= since)\
+        .group_by(Event.verb, Event.piece_id)
+    if before_id:
+        groups_query = groups_query.having(func.max(Event.id) < before_id)
+    groups = groups_query.order_by(latest_id.desc()).limit(limit).all()
+    
+    if not groups:
+        return []
+    
+    # Most recent few actors of every group in one windowed query; someone
+    # who commented three times is still listed once
+    piece_ids = {group.piece_id for group in groups}
+    per_actor = select(
+        Event.verb,
+        Event.piece_id,
+        Event.actor_id,
+        func.max(Event.id).label("latest_id")
+    ).where(
+        Event.recipient_id == current_user.id,
+        Event.created_at >= since,
+        Event.piece_id.in_(piece_ids)
+    ).group_by(Event.verb, Event.piece_id, Event.actor_id).subquery()
+    ranked = select(
+        per_actor.c.verb,
+        per_actor.c.piece_id,
+        per_actor.c.actor_id,
+        func.row_number().over(
+            partition_by=(per_actor.c.verb, per_actor.c.piece_id),
+            order_by=per_actor.c.latest_id.desc()
+        ).label("position")
+    ).subquery()
+    
+    actor_rows = db.query(ranked.c.verb, ranked.c.piece_id, models.User)\
+        .join(models.User, models.User.id == ranked.c.actor_id)\
+        .filter(ranked.c.position <= ACTORS_PER_GROUP)\
+        .order_by(ranked.c.position)\
+        .all()
+    actors = {}
+    for verb, piece_id, user in actor_rows:
+        actors.setdefault((verb, piece_id), []).append(schemas.ActivityActor.model_validate(user))
+    
+    titles = dict(
+        db.query(models.Piece.id, models.Piece.title).filter(models.Piece.id.in_(piece_ids)).all()
+    )
+    
+    return [
+        schemas.NotificationGroup(
+            verb=group.verb,
+            piece_id=group.piece_id,
+            piece_title=titles.get(group.piece_id),
+            count=group.count,
+            actors=actors.get((group.verb, group.piece_id), []),
+            latest_id=group.latest_id,
+            latest_at=group.latest_at,
+            unread=group.latest_id > current_user.last_read_activity_id
+        )
+        for group in groups
+    ]
+
+@router.get("/unread-count", response_model=schemas.UnreadCount)
+def read_unread_count(
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Unread badge count - read straight off the user row"""
+    return {"unread": current_user.unread_notifications}
+
+@router.post("/read", response_model=schemas.MessageResponse)
+def mark_notifications_read(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Mark everything in the feed as read"""
+    newest = db.query(func.max(models.ActivityEvent.id))\
+        .filter(models.ActivityEvent.recipient_id == current_user.id)\
+        .scalar()
+    
+    if newest is None:
+        return {"message": "Notifications marked as read"}
+    
+    # Subtract only the events being marked read, in the UPDATE itself, so
+    # a batch the activity writer commits meanwhile still counts as unread
+    users = models.User.__table__
+    seen = select(func.count(models.ActivityEvent.id))\
+        .where(
+            models.ActivityEvent.recipient_id == users.c.id,
+            models.ActivityEvent.id > users.c.last_read_activity_id,
+            models.ActivityEvent.id <= newest
+        )\
+        .scalar_subquery()
+    db.execute(
+        update(users)
+        .where(users.c.id == current_user.id, users.c.last_read_activity_id < newest)
+        .values(
+            unread_notifications=users.c.unread_notifications - seen,
+            last_read_activity_id=newest
+        )
+    )
+    db.commit()
+    
+    return {"message": "Notifications marked as read"}
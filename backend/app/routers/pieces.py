@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, File, UploadFile, Form
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func
 from typing import List, Optional
+import asyncio
 import os
-import uuid
 from datetime import datetime
-from .. import models, schemas, auth
-from ..database import get_db
+from .. import models, schemas, auth, geo, similarity, activity, live, recommend, serialization, storage, tags as tag_index
+from ..database import get_db, get_read_db
 from ..config import settings
+from ..ratelimit import RateLimit
 from ..models import PieceType, Surface
 
 # Create optional OAuth2 scheme
@@ -19,53 +21,128 @@ router = APIRouter(
     tags=["pieces"]
 )
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = "uploads"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
-
-def save_upload_file(upload_file: UploadFile) -> str:
-    """Save uploaded file and return the URL"""
-    # Generate unique filename
-    file_extension = os.path.splitext(upload_file.filename)[1]
-    if file_extension.lower() not in settings.allowed_extensions:
+def check_extension(filename: str) -> str:
+    """Return the file's extension if it's an allowed image type"""
+    file_extension = os.path.splitext(filename or "")[1].lower()
+    if file_extension not in settings.allowed_extensions:
         raise HTTPException(status_code=400, detail=f"File type {file_extension} not allowed")
+    return file_extension
+
+async def save_upload_file(upload_file: UploadFile, user_id: int):
+    """Store a multipart upload; returns (storage key, image hash)"""
+    image_key = storage.new_key(user_id, check_extension(upload_file.filename))
     
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
+    # Check file size
+    contents = await upload_file.read(settings.max_upload_size + 1)
+    if len(contents) > settings.max_upload_size:
+        raise HTTPException(status_code=400, detail="File too large")
+    await upload_file.seek(0)
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        buffer.write(upload_file.file.read())
+    # Hash (CPU) and store (I/O) at the same time, both off the event loop
+    image_hash, _ = await asyncio.gather(
+        run_in_threadpool(similarity.compute_dhash, contents),
+        storage.get_storage().asave(image_key, upload_file.file),
+    )
+    return image_key, image_hash
+
+async def claim_direct_upload(db: Session, image_key: str, user_id: int):
+    """Check an image the browser uploaded straight to storage; returns (key, image hash)"""
+    file_storage = storage.get_storage()
+    if not image_key.startswith(f"{user_id}-") or "/" in image_key:
+        raise HTTPException(status_code=400, detail="Unknown upload")
+    check_extension(image_key)
+    
+    if db.query(models.Piece.id).filter(
+        models.Piece.artist_id == user_id, models.Piece.image_url == file_storage.url(image_key)
+    ).first():
+        raise HTTPException(status_code=400, detail="Upload already used")
+    
+    size = await file_storage.asize(image_key)
+    if size is None:
+        raise HTTPException(status_code=400, detail="Upload not found")
+    if size > settings.max_upload_size:
+        await file_storage.adelete(image_key)
+        raise HTTPException(status_code=400, detail="File too large")
     
-    # Return relative URL (in production, this would be a full URL)
-    return f"/uploads/{unique_filename}"
+    contents = await file_storage.aread(image_key, settings.max_upload_size)
+    image_hash = await run_in_threadpool(similarity.compute_dhash, contents)
+    return image_key, image_hash
+
+def similar_piece_summaries(matches) -> List[schemas.SimilarPiece]:
+    """Turn (piece, distance) matches into response items"""
+    return [
+        schemas.SimilarPiece(
+            id=piece.id,
+            title=piece.title,
+            image_url=piece.image_url,
+            artist_id=piece.artist_id,
+            distance=distance
+        )
+        for piece, distance in matches
+    ]
 
-@router.post("/", response_model=schemas.Piece)
+def piece_stats(db: Session, piece_ids: List[int], viewer_id: Optional[int] = None):
+    """Likes and comments per piece, and which of them the viewer liked - one query each"""
+    if not piece_ids:
+        return {}, {}, set()
+    
+    # Deleted accounts' likes and comments stop counting straight away,
+    # not only once the cleanup worker purges them
+    likes_counts = dict(
+        db.query(models.Like.piece_id, func.count(models.Like.id))
+        .filter(models.Like.piece_id.in_(piece_ids), models.Like.user_id.in_(models.live_user_ids()))
+        .group_by(models.Like.piece_id)
+        .all()
+    )
+    comments_counts = dict(
+        db.query(models.Comment.piece_id, func.count(models.Comment.id))
+        .filter(models.Comment.piece_id.in_(piece_ids), models.Comment.author_id.in_(models.live_user_ids()))
+        .group_by(models.Comment.piece_id)
+        .all()
+    )
+    liked = set()
+    if viewer_id is not None:
+        liked = {
+            piece_id for (piece_id,) in db.query(models.Like.piece_id)
+            .filter(models.Like.piece_id.in_(piece_ids), models.Like.user_id == viewer_id)
+        }
+    return likes_counts, comments_counts, liked
+
+@router.post("/", response_model=schemas.PieceUploadResult, dependencies=[Depends(RateLimit("create_piece"))])
 async def create_piece(
     title: str = Form(...),
     description: Optional[str] = Form(None),
     piece_type: PieceType = Form(...),
     surface: Surface = Form(...),
     location: Optional[str] = Form(None),
+    latitude: Optional[float] = Form(None, ge=-90, le=90),
+    longitude: Optional[float] = Form(None, ge=-180, le=180),
+    tags: Optional[str] = Form(None, description="Comma or space separated tags"),
     is_public: bool = Form(True),
-    image: UploadFile = File(...),
+    image: Optional[UploadFile] = File(None),
+    image_key: Optional[str] = Form(None, description="Key from POST /api/pieces/uploads, instead of image"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Upload a new piece"""
-    # Check file size
-    contents = await image.read()
-    await image.seek(0)  # Reset file pointer
-    
-    if len(contents) > settings.max_upload_size:
-        raise HTTPException(status_code=400, detail="File too large")
-    
-    # Save image
-    try:
-        image_url = save_upload_file(image)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Could not save file")
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(status_code=400, detail="Latitude and longitude must be given together")
+    if (image is None) == (image_key is None):
+        raise HTTPException(status_code=400, detail="Send either an image or an image_key")
+    
+    tag_names = tag_index.parse_tags(tags)
+    
+    # Store the image (or find the one uploaded directly) and hash it for duplicate detection
+    if image is not None:
+        try:
+            image_key, image_hash = await save_upload_file(image, current_user.id)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Could not save file")
+    else:
+        image_key, image_hash = await claim_direct_upload(db, image_key, current_user.id)
+    image_url = storage.get_storage().url(image_key)
     
     # Create piece in database
     db_piece = models.Piece(
@@ -74,15 +151,58 @@ async def create_piece(
         piece_type=piece_type,
         surface=surface,
         location=location,
+        latitude=latitude,
+        longitude=longitude,
         is_public=is_public,
         image_url=image_url,
         artist_id=current_user.id
     )
+    db_piece.tags = tag_index.get_or_create_tags(db, tag_names)
+    
+    similar = []
+    if image_hash is not None:
+        similarity.apply_hash(db_piece, image_hash)
+        similar = similarity.find_similar(
+            db, image_hash, settings.duplicate_max_distance, viewer_id=current_user.id, limit=5
+        )
     
     db.add(db_piece)
+    tag_index.adjust_facet_counts(db, db_piece, 1)
+    db.flush()
+    geo.add_to_map_cells(db, db_piece)
     db.commit()
     db.refresh(db_piece)
-    return db_piece
+    
+    result = schemas.PieceUploadResult.model_validate(db_piece)
+    result.similar_pieces = similar_piece_summaries(similar)
+    result.possible_duplicate = bool(similar)
+    return result
+
+def require_direct_upload():
+    """501 before anything else (rate limit included) when the storage can't take direct uploads"""
+    if not storage.get_storage().supports_direct_upload:
+        raise HTTPException(status_code=501, detail="Direct uploads are not available; post the image to /api/pieces/")
+
+@router.post(
+    "/uploads",
+    response_model=schemas.DirectUpload,
+    dependencies=[Depends(require_direct_upload), Depends(RateLimit("direct_upload"))]
+)
+def create_direct_upload(
+    upload: schemas.DirectUploadRequest,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Presigned upload so the browser can send the image straight to storage"""
+    image_key = storage.new_key(current_user.id, check_extension(upload.filename))
+    presigned = storage.get_storage().presigned_upload(
+        image_key, settings.max_upload_size, settings.direct_upload_expires_seconds
+    )
+    return schemas.DirectUpload(
+        key=image_key,
+        url=presigned["url"],
+        fields=presigned["fields"],
+        expires_in=settings.direct_upload_expires_seconds
+    )
 
 @router.get("/", response_model=List[schemas.PieceWithStats])
 def read_pieces(
@@ -91,11 +211,15 @@ def read_pieces(
     piece_type: Optional[PieceType] = None,
     surface: Optional[Surface] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    tags: Optional[str] = Query(None, description="Comma separated tags"),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
+    db: Session = Depends(get_read_db)
 ):
     """Get list of public pieces with optional filters"""
     # No authentication required - public endpoint
-    query = db.query(models.Piece).filter(models.Piece.is_public == True)
+    query = db.query(models.Piece)\
+        .options(selectinload(models.Piece.tags))\
+        .filter(models.Piece.is_public == True, models.Piece.deleted_at.is_(None))
     
     if piece_type:
         query = query.filter(models.Piece.piece_type == piece_type)
@@ -103,39 +227,9 @@ def read_pieces(
     if surface:
         query = query.filter(models.Piece.surface == surface)
     
-    if search:
-        query = query.join(models.User).filter(
-            (models.Piece.title.contains(search)) |
-            (models.Piece.description.contains(search)) |
-            (models.User.username.contains(search)) |
-            (models.User.tag_name.contains(search))
-        )
-    
-    pieces = query.order_by(models.Piece.created_at.desc()).offset(skip).limit(limit).all()
-    
-    # Add stats to each piece
-    pieces_with_stats = []
-    for piece in pieces:
-        likes_count = db.query(models.Like).filter(models.Like.piece_id == piece.id).count()
-        comments_count = db.query(models.Comment).filter(models.Comment.piece_id == piece.id).count()
-        
-        piece_dict = piece.__dict__.copy()
-        piece_dict['likes_count'] = likes_count
-        piece_dict['comments_count'] = comments_count
-        piece_dict['is_liked_by_user'] = False  # Always false for unauthenticated users
-        piece_dict['artist'] = piece.artist
-        
-        pieces_with_stats.append(schemas.PieceWithStats(**piece_dict))
-    
-    return pieces_with_stats
-    """Get list of public pieces with optional filters"""
-    query = db.query(models.Piece).filter(models.Piece.is_public == True)
-    
-    if piece_type:
-        query = query.filter(models.Piece.piece_type == piece_type)
-    
-    if surface:
-        query = query.filter(models.Piece.surface == surface)
+    tag_names = tag_index.parse_tags(tags)
+    if tag_names:
+        query = query.filter(tag_index.tag_filter(db, tag_names, match_all=tag_mode == "all"))
     
     if search:
         query = query.join(models.User).filter(
@@ -145,39 +239,119 @@ def read_pieces(
             (models.User.tag_name.contains(search))
         )
     
-    pieces = query.order_by(models.Piece.created_at.desc()).offset(skip).limit(limit).all()
+    pieces = query.options(selectinload(models.Piece.artist))\
+        .order_by(models.Piece.created_at.desc())\
+        .offset(skip)\
+        .limit(limit)\
+        .all()
     
-    # Add stats to each piece
+    # Stats for the whole page in one query each, then build the response
+    # without re-validating our own rows (see serialization.py)
+    likes_counts, comments_counts, _ = piece_stats(db, [piece.id for piece in pieces])
+    artists = {}
     pieces_with_stats = []
     for piece in pieces:
-        likes_count = db.query(models.Like).filter(models.Like.piece_id == piece.id).count()
-        comments_count = db.query(models.Comment).filter(models.Comment.piece_id == piece.id).count()
-        is_liked_by_user = False
-        
-        if current_user:
-            is_liked_by_user = db.query(models.Like).filter(
-                models.Like.piece_id == piece.id,
-                models.Like.user_id == current_user.id
-            ).first() is not None
-        
-        piece_dict = piece.__dict__.copy()
-        piece_dict['likes_count'] = likes_count
-        piece_dict['comments_count'] = comments_count
-        piece_dict['is_liked_by_user'] = is_liked_by_user
-        piece_dict['artist'] = piece.artist
-        
-        pieces_with_stats.append(schemas.PieceWithStats(**piece_dict))
-    
-    return pieces_with_stats
+        if piece.artist_id not in artists:
+            artists[piece.artist_id] = serialization.user_summary(piece.artist)
+        pieces_with_stats.append(serialization.piece_with_stats(
+            piece,
+            likes_count=likes_counts.get(piece.id, 0),
+            comments_count=comments_counts.get(piece.id, 0),
+            is_liked_by_user=False,  # Always false for unauthenticated users
+            artist=artists[piece.artist_id]
+        ))
+    
+    return serialization.json_response(List[schemas.PieceWithStats], pieces_with_stats)
+
+@router.get("/facets", response_model=schemas.Facets)
+def read_facets(db: Session = Depends(get_read_db)):
+    """Public piece counts per piece type, surface and (top) tag"""
+    return tag_index.read_facets(db, settings.facet_tag_limit)
+
+@router.get("/near", response_model=List[schemas.PieceNearby])
+def read_pieces_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=50),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db)
+):
+    """Get public pieces closest to a point ("pieces near me")"""
+    min_lat, min_lng, max_lat, max_lng = geo.radius_bbox(lat, lng, radius_km)
+    
+    # The bounding box hits the spatial index, then we sort what's inside it
+    pieces = db.query(models.Piece)\
+        .options(selectinload(models.Piece.artist), selectinload(models.Piece.tags))\
+        .filter(models.Piece.is_public == True, models.Piece.deleted_at.is_(None))\
+        .filter(geo.bbox_filter(min_lat, min_lng, max_lat, max_lng))\
+        .order_by(geo.approx_distance_order(lat, lng))\
+        .limit(limit)\
+        .all()
+    
+    artists = {}
+    nearby = []
+    for piece in pieces:
+        distance = geo.haversine_km(lat, lng, piece.latitude, piece.longitude)
+        if distance > radius_km:
+            continue  # In the box corner but outside the circle
+        if piece.artist_id not in artists:
+            artists[piece.artist_id] = serialization.user_summary(piece.artist)
+        nearby.append(serialization.piece_nearby(piece, round(distance, 3), artist=artists[piece.artist_id]))
+    
+    return serialization.json_response(List[schemas.PieceNearby], nearby)
+
+@router.get("/map", response_model=schemas.MapResponse)
+def read_pieces_map(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get map markers for a bounding box, clustered on a grid when zoomed out.
+    A box with min_lng > max_lng crosses the antimeridian.
+    """
+    if min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    
+    if zoom >= settings.map_cluster_max_zoom:
+        rows = db.query(models.Piece.id, models.Piece.latitude, models.Piece.longitude)\
+            .filter(
+                models.Piece.is_public == True,
+                models.Piece.deleted_at.is_(None),
+                geo.viewport_filter(min_lat, min_lng, max_lat, max_lng),
+            )\
+            .limit(settings.map_max_markers)\
+            .all()
+        markers = [
+            schemas.MapCluster(latitude=row.latitude, longitude=row.longitude, count=1, piece_id=row.id)
+            for row in rows
+        ]
+        return schemas.MapResponse(clustered=False, markers=markers)
+    
+    # Zoomed out: read the precomputed grid cells; each cell becomes one marker
+    cells = geo.map_cells_in_view(db, zoom, min_lat, min_lng, max_lat, max_lng, settings.map_max_markers)
+    markers = [
+        schemas.MapCluster(
+            latitude=cell.lat_sum / cell.count,
+            longitude=cell.lng_sum / cell.count,
+            count=cell.count,
+            piece_id=cell.piece_id if cell.count == 1 else None
+        )
+        for cell in cells
+    ]
+    return schemas.MapResponse(clustered=True, markers=markers)
 
 @router.get("/{piece_id}", response_model=schemas.PieceWithStats)
 def read_piece(
     piece_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: Optional[models.User] = Depends(auth.get_current_user)
 ):
     """Get a specific piece by ID"""
-    piece = db.query(models.Piece).filter(models.Piece.id == piece_id).first()
+    piece = db.query(models.Piece).filter(models.Piece.id == piece_id, models.Piece.deleted_at.is_(None)).first()
     
     if piece is None:
         raise HTTPException(status_code=404, detail="Piece not found")
@@ -187,23 +361,66 @@ def read_piece(
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Add stats
-    likes_count = db.query(models.Like).filter(models.Like.piece_id == piece.id).count()
-    comments_count = db.query(models.Comment).filter(models.Comment.piece_id == piece.id).count()
-    is_liked_by_user = False
-    
-    if current_user:
-        is_liked_by_user = db.query(models.Like).filter(
-            models.Like.piece_id == piece.id,
-            models.Like.user_id == current_user.id
-        ).first() is not None
-    
-    piece_dict = piece.__dict__.copy()
-    piece_dict['likes_count'] = likes_count
-    piece_dict['comments_count'] = comments_count
-    piece_dict['is_liked_by_user'] = is_liked_by_user
-    piece_dict['artist'] = piece.artist
-    
-    return schemas.PieceWithStats(**piece_dict)
+    likes_counts, comments_counts, liked = piece_stats(
+        db, [piece.id], current_user.id if current_user else None
+    )
+    
+    return serialization.json_response(schemas.PieceWithStats, serialization.piece_with_stats(
+        piece,
+        likes_count=likes_counts.get(piece.id, 0),
+        comments_count=comments_counts.get(piece.id, 0),
+        is_liked_by_user=piece.id in liked
+    ))
+
+@router.get("/{piece_id}/similar", response_model=List[schemas.SimilarPiece])
+def read_similar_pieces(
+    piece_id: int,
+    max_distance: int = Query(None, ge=0, le=similarity.MAX_SEARCH_DISTANCE),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+    current_user: Optional[models.User] = Depends(auth.get_current_user_optional)
+):
+    """Get pieces that look visually similar to this one"""
+    piece = db.query(models.Piece).filter(models.Piece.id == piece_id, models.Piece.deleted_at.is_(None)).first()
+    
+    if piece is None:
+        raise HTTPException(status_code=404, detail="Piece not found")
+    
+    viewer_id = current_user.id if current_user else None
+    if not piece.is_public and viewer_id != piece.artist_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if piece.image_hash is None:
+        return []
+    
+    matches = similarity.find_similar(
+        db,
+        similarity.hash_from_hex(piece.image_hash),
+        max_distance if max_distance is not None else settings.similar_max_distance,
+        exclude_piece_id=piece.id,
+        viewer_id=viewer_id,
+        limit=limit
+    )
+    return similar_piece_summaries(matches)
+
+@router.get("/{piece_id}/related", response_model=List[schemas.RelatedPiece])
+def read_related_pieces(
+    piece_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    """More like this: pieces liked by the same people"""
+    related = recommend.related_pieces(db, piece_id, min(limit, settings.recommend_neighbors))
+    return [
+        schemas.RelatedPiece(
+            id=piece.id,
+            title=piece.title,
+            image_url=piece.image_url,
+            artist_id=piece.artist_id,
+            score=score
+        )
+        for piece, score in related
+    ]
 
 @router.delete("/{piece_id}")
 def delete_piece(
@@ -212,7 +429,7 @@ def delete_piece(
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Delete a piece (only by owner)"""
-    piece = db.query(models.Piece).filter(models.Piece.id == piece_id).first()
+    piece = db.query(models.Piece).filter(models.Piece.id == piece_id, models.Piece.deleted_at.is_(None)).first()
     
     if piece is None:
         raise HTTPException(status_code=404, detail="Piece not found")
@@ -220,26 +437,22 @@ def delete_piece(
     if piece.artist_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this piece")
     
-    # Delete the file (in production, handle this more carefully)
-    try:
-        file_path = piece.image_url.replace("/uploads/", "")
-        os.remove(os.path.join(UPLOAD_DIR, file_path))
-    except:
-        pass  # File might not exist
-    
-    db.delete(piece)
+    # Hide it now; likes, comments and the image are purged in the background
+    geo.remove_pieces_from_map_cells(db, models.Piece.id == piece.id)
+    piece.deleted_at = datetime.utcnow()
+    tag_index.adjust_facet_counts(db, piece, -1)
     db.commit()
     
     return {"message": "Piece deleted successfully"}
 
-@router.post("/{piece_id}/like", response_model=schemas.MessageResponse)
+@router.post("/{piece_id}/like", response_model=schemas.MessageResponse, dependencies=[Depends(RateLimit("like"))])
 def like_piece(
     piece_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Like a piece"""
-    piece = db.query(models.Piece).filter(models.Piece.id == piece_id).first()
+    piece = db.query(models.Piece).filter(models.Piece.id == piece_id, models.Piece.deleted_at.is_(None)).first()
     if not piece:
         raise HTTPException(status_code=404, detail="Piece not found")
     
@@ -257,9 +470,13 @@ def like_piece(
     db.add(like)
     db.commit()
     
+    activity.record(models.ActivityVerb.LIKE, piece.artist_id, current_user.id, piece_id)
+    live.publish_like(piece_id, 1)
+    recommend.get_updater().add(current_user.id, piece_id)
+    
     return {"message": "Piece liked successfully"}
 
-@router.delete("/{piece_id}/like", response_model=schemas.MessageResponse)
+@router.delete("/{piece_id}/like", response_model=schemas.MessageResponse, dependencies=[Depends(RateLimit("like"))])
 def unlike_piece(
     piece_id: int,
     db: Session = Depends(get_db),
@@ -277,4 +494,7 @@ def unlike_piece(
     db.delete(like)
     db.commit()
     
+    live.publish_like(piece_id, -1)
+    recommend.get_updater().add(current_user.id, piece_id)
+    
     return {"message": "Like removed successfully"}
\ No newline at end of file
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from .. import models, schemas, auth
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models import PieceType
 
 router = APIRouter(
@@ -15,11 +15,11 @@ def read_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Get list of users with optional search"""
-    query = db.query(models.User)
+    query = db.query(models.User).filter(models.User.deleted_at.is_(None))
     
     if search:
         query = query.filter(
@@ -34,11 +34,11 @@ def read_users(
 @router.get("/{username}", response_model=schemas.User)
 def read_user(
     username: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Get a specific user by username"""
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = db.query(models.User).filter(models.User.username == username, models.User.deleted_at.is_(None)).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -49,15 +49,15 @@ def read_user_pieces(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
     piece_type: Optional[PieceType] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Get pieces by a specific user"""
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = db.query(models.User).filter(models.User.username == username, models.User.deleted_at.is_(None)).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    query = db.query(models.Piece).filter(models.Piece.artist_id == user.id)
+    query = db.query(models.Piece).filter(models.Piece.artist_id == user.id, models.Piece.deleted_at.is_(None))
     
     # Only show public pieces unless it's the user's own profile
     if current_user.id != user.id:
@@ -1,7 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, AliasChoices
 from typing import Optional, List
 from datetime import datetime
-from .models import PieceType, Surface
+from .models import PieceType, Surface, ActivityVerb
 
 # User Schemas
 class UserBase(BaseModel):
@@ -30,6 +30,17 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserSummary(BaseModel):
+    """Public view of a user embedded in pieces and comments (no email)"""
+    id: int
+    username: str
+    tag_name: Optional[str] = None
+    crew: Optional[str] = None
+    is_premium: bool = False
+    
+    class Config:
+        from_attributes = True
+
 class UserInDB(User):
     hashed_password: str
 
@@ -37,6 +48,13 @@ class UserInDB(User):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None  # Also revoke this refresh token
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -52,6 +70,8 @@ class PieceBase(BaseModel):
     piece_type: PieceType
     surface: Surface
     location: Optional[str] = Field(None, max_length=200)
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     is_public: bool = True
 
 class PieceCreate(PieceBase):
@@ -63,7 +83,8 @@ class Piece(PieceBase):
     thumbnail_url: Optional[str]
     artist_id: int
     created_at: datetime
-    artist: User
+    artist: UserSummary
+    tags: List[str] = Field([], validation_alias=AliasChoices("tag_names", "tags"))
     
     class Config:
         from_attributes = True
@@ -73,23 +94,89 @@ class PieceWithStats(Piece):
     comments_count: int = 0
     is_liked_by_user: bool = False
 
+class SimilarPiece(BaseModel):
+    id: int
+    title: str
+    image_url: str
+    artist_id: int
+    distance: int  # Hamming distance between image hashes, 0 = identical
+
+class RelatedPiece(BaseModel):
+    id: int
+    title: str
+    image_url: str
+    artist_id: int
+    score: float  # Co-like similarity, 1 = liked by exactly the same people
+
+class DirectUploadRequest(BaseModel):
+    filename: str  # Only the extension is used; it also decides the stored Content-Type
+
+class DirectUpload(BaseModel):
+    """Where the browser should POST the file; then create the piece with image_key=key"""
+    key: str
+    url: str
+    fields: dict
+    expires_in: int
+
+class PieceUploadResult(Piece):
+    """Newly created piece plus any visually similar existing pieces"""
+    possible_duplicate: bool = False
+    similar_pieces: List[SimilarPiece] = []
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+    
+    class Config:
+        from_attributes = True
+
+class Facets(BaseModel):
+    """Public piece counts for the feed's filter sidebar"""
+    piece_type: List[FacetValue]
+    surface: List[FacetValue]
+    tag: List[FacetValue]
+
+class PieceNearby(Piece):
+    distance_km: float
+
+class MapCluster(BaseModel):
+    """A map marker: a single piece, or a cluster of pieces when zoomed out"""
+    latitude: float
+    longitude: float
+    count: int
+    piece_id: Optional[int] = None  # Only set when count == 1
+
+class MapResponse(BaseModel):
+    clustered: bool
+    markers: List[MapCluster]
+
 # Comment Schemas
 class CommentBase(BaseModel):
     content: str = Field(..., min_length=1)
 
 class CommentCreate(CommentBase):
     piece_id: int
+    parent_id: Optional[int] = None  # Set when replying to another comment
 
 class Comment(CommentBase):
+    """content is empty and author None when the author's account was deleted"""
+    content: str
     id: int
-    author_id: int
+    author_id: Optional[int] = None
     piece_id: int
+    parent_id: Optional[int] = None
+    depth: int = 0
+    reply_count: int = 0
     created_at: datetime
-    author: User
+    author: Optional[UserSummary] = None
     
     class Config:
         from_attributes = True
 
+class CommentThread(Comment):
+    """Top-level comment with the first few replies attached"""
+    replies: List[Comment] = []
+
 # Like Schemas
 class LikeCreate(BaseModel):
     piece_id: int
@@ -124,6 +211,29 @@ class Competition(CompetitionBase):
     class Config:
         from_attributes = True
 
+# Notification Schemas
+class ActivityActor(BaseModel):
+    id: int
+    username: str
+    tag_name: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class NotificationGroup(BaseModel):
+    """Events of one kind on one piece collapsed together ("57 people liked your piece")"""
+    verb: ActivityVerb
+    piece_id: int
+    piece_title: Optional[str] = None
+    count: int
+    actors: List[ActivityActor]  # The most recent few
+    latest_id: int
+    latest_at: datetime
+    unread: bool
+
+class UnreadCount(BaseModel):
+    unread: int
+
 # Response Models
 class MessageResponse(BaseModel):
     message: str
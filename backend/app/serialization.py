@@ -0,0 +1,115 @@
+"""
+Fast path for the big list responses (feed, nearby, comments).
+
+Returning Pydantic models from a route costs two full passes: building
+them validates every field, then FastAPI validates the result again
+against response_model before encoding it. For rows we just loaded from our
+own database neither pass finds anything, so these helpers skip both:
+models are built with model_construct (no validation) and written out by
+pydantic-core's JSON serializer in one go. The routes keep response_model
+so the API docs don't change.
+
+scripts/bench_serialization.py compares this with the old path per item.
+"""
+from typing import Dict, List, Optional
+from fastapi import Response
+from pydantic import TypeAdapter
+from . import models, schemas
+
+_adapters: Dict[object, TypeAdapter] = {}
+
+def json_response(schema_type, content, status_code: int = 200) -> Response:
+    """Serialize already-built models straight to JSON, skipping response_model validation"""
+    adapter = _adapters.get(schema_type)
+    if adapter is None:
+        adapter = _adapters[schema_type] = TypeAdapter(schema_type)
+    return Response(adapter.dump_json(content), status_code=status_code, media_type="application/json")
+
+def user_summary(user: models.User) -> schemas.UserSummary:
+    return schemas.UserSummary.model_construct(
+        id=user.id,
+        username=user.username,
+        tag_name=user.tag_name,
+        crew=user.crew,
+        is_premium=bool(user.is_premium),
+    )
+
+def _piece_fields(piece: models.Piece, artist: Optional[schemas.UserSummary]) -> dict:
+    return dict(
+        id=piece.id,
+        title=piece.title,
+        description=piece.description,
+        piece_type=piece.piece_type,
+        surface=piece.surface,
+        location=piece.location,
+        latitude=piece.latitude,
+        longitude=piece.longitude,
+        is_public=piece.is_public,
+        image_url=piece.image_url,
+        thumbnail_url=piece.thumbnail_url,
+        artist_id=piece.artist_id,
+        created_at=piece.created_at,
+        artist=artist or user_summary(piece.artist),
+        tags=[tag.name for tag in piece.tags],
+    )
+
+def piece_with_stats(
+    piece: models.Piece,
+    likes_count: int = 0,
+    comments_count: int = 0,
+    is_liked_by_user: bool = False,
+    artist: Optional[schemas.UserSummary] = None
+) -> schemas.PieceWithStats:
+    """PieceWithStats from a loaded piece (pass artist to share one summary per user)"""
+    return schemas.PieceWithStats.model_construct(
+        **_piece_fields(piece, artist),
+        likes_count=likes_count,
+        comments_count=comments_count,
+        is_liked_by_user=is_liked_by_user,
+    )
+
+def piece_nearby(
+    piece: models.Piece,
+    distance_km: float,
+    artist: Optional[schemas.UserSummary] = None
+) -> schemas.PieceNearby:
+    return schemas.PieceNearby.model_construct(**_piece_fields(piece, artist), distance_km=distance_km)
+
+def is_live(user: Optional[models.User]) -> bool:
+    """False for a purged or soft-deleted account"""
+    return user is not None and user.deleted_at is None
+
+def _comment_fields(comment: models.Comment) -> dict:
+    if not is_live(comment.author):
+        # Placeholder for a deleted account's comment that still has replies
+        return dict(
+            id=comment.id,
+            content="",
+            author_id=None,
+            piece_id=comment.piece_id,
+            parent_id=comment.parent_id,
+            depth=comment.depth,
+            reply_count=comment.reply_count,
+            created_at=comment.created_at,
+            author=None,
+        )
+    return dict(
+        id=comment.id,
+        content=comment.content,
+        author_id=comment.author_id,
+        piece_id=comment.piece_id,
+        parent_id=comment.parent_id,
+        depth=comment.depth,
+        reply_count=comment.reply_count,
+        created_at=comment.created_at,
+        author=user_summary(comment.author),
+    )
+
+def comment_out(comment: models.Comment) -> schemas.Comment:
+    return schemas.Comment.model_construct(**_comment_fields(comment))
+
+def comment_thread(comment: models.Comment, replies: List[models.Comment]) -> schemas.CommentThread:
+    return schemas.CommentThread.model_construct(
+        **_comment_fields(comment),
+        replies=[comment_out(reply) for reply in replies],
+    )
@@ -0,0 +1,123 @@
+"""
+Perceptual hashing for near-duplicate upload detection.
+
+Each image gets a 64-bit difference hash (dHash). Visually similar images
+have hashes a small Hamming distance apart. For fast lookups the hash is
+also stored as four indexed 16-bit chunks (multi-index hashing): if two
+hashes are at most 7 bits apart, at least one chunk differs by at most one
+bit, so probing each chunk column with its 17 one-bit neighbours finds
+every candidate through the indexes. Candidates are then checked exactly.
+"""
+import io
+import warnings
+from typing import List, Optional, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from . import models
+
+HASH_SIZE = 8  # 8x8 comparisons = 64-bit hash
+CHUNK_COUNT = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Largest distance the chunk probe is guaranteed to find (see module docstring)
+MAX_SEARCH_DISTANCE = 2 * CHUNK_COUNT - 1
+
+# Bigger images aren't decoded: a small file can declare huge dimensions
+# (a "decompression bomb") and take gigabytes of memory to decode
+MAX_HASH_PIXELS = 50_000_000
+
+def compute_dhash(image_bytes: bytes) -> Optional[int]:
+    """Compute the difference hash of an image, or None if it can't be decoded"""
+    # Pillow is only loaded on first upload, not at startup
+    from PIL import Image, UnidentifiedImageError
+    
+    try:
+        with warnings.catch_warnings():
+            # Pillow only warns below twice its own limit; treat that as an error too
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                # Opening only reads the header, so this check is cheap
+                width, height = image.size
+                if width * height > MAX_HASH_PIXELS:
+                    return None
+                # Shrink to (HASH_SIZE + 1) x HASH_SIZE greyscale and compare neighbours
+                image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))  # Cheap JPEG downscale
+                small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+                pixels = list(small.getdata())
+    except (UnidentifiedImageError, OSError, ValueError,
+            Image.DecompressionBombError, Image.DecompressionBombWarning):
+        return None
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+def hash_from_hex(hex_value: str) -> int:
+    return int(hex_value, 16)
+
+def hash_chunks(value: int) -> List[int]:
+    """Split a 64-bit hash into its 16-bit chunks, most significant first"""
+    return [
+        (value >> (CHUNK_BITS * (CHUNK_COUNT - 1 - i))) & CHUNK_MASK
+        for i in range(CHUNK_COUNT)
+    ]
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def apply_hash(piece: models.Piece, value: int):
+    """Store a hash and its index chunks on a piece"""
+    piece.image_hash = hash_to_hex(value)
+    piece.hash_chunk_0, piece.hash_chunk_1, piece.hash_chunk_2, piece.hash_chunk_3 = hash_chunks(value)
+
+def _chunk_neighbours(chunk: int) -> List[int]:
+    """A chunk plus every value one bit away from it"""
+    return [chunk] + [chunk ^ (1 << bit) for bit in range(CHUNK_BITS)]
+
+def find_similar(
+    db: Session,
+    value: int,
+    max_distance: int,
+    exclude_piece_id: Optional[int] = None,
+    viewer_id: Optional[int] = None,
+    limit: int = 20
+) -> List[Tuple[models.Piece, int]]:
+    """
+    Find pieces whose hash is within max_distance bits, closest first.
+    Only public pieces (and the viewer's own private ones) are returned.
+    """
+    max_distance = min(max_distance, MAX_SEARCH_DISTANCE)
+    chunk_columns = [
+        models.Piece.hash_chunk_0,
+        models.Piece.hash_chunk_1,
+        models.Piece.hash_chunk_2,
+        models.Piece.hash_chunk_3,
+    ]
+    probes = [
+        column.in_(_chunk_neighbours(chunk))
+        for column, chunk in zip(chunk_columns, hash_chunks(value))
+    ]
+
+    query = db.query(models.Piece).filter(or_(*probes), models.Piece.deleted_at.is_(None))
+    if viewer_id is None:
+        query = query.filter(models.Piece.is_public == True)
+    else:
+        query = query.filter(or_(models.Piece.is_public == True, models.Piece.artist_id == viewer_id))
+    if exclude_piece_id is not None:
+        query = query.filter(models.Piece.id != exclude_piece_id)
+
+    matches = []
+    for piece in query.all():
+        distance = hamming_distance(value, hash_from_hex(piece.image_hash))
+        if distance <= max_distance:
+            matches.append((piece, distance))
+
+    matches.sort(key=lambda match: (match[1], -match[0].id))
+    return matches[:limit]
@@ -0,0 +1,237 @@
+"""
+Where uploaded images are stored.
+
+Pieces keep the public URL of their image; the storage backend turns keys
+("<user id>-<random>.jpg") into URLs and bytes. Two backends:
+
+- LocalStorage writes to a directory served at /uploads. Fine for one
+  node (or several sharing a network mount) and for development.
+- S3Storage talks to any S3-compatible store (AWS, MinIO, moto in tests;
+  needs boto3). Large files go up as multipart uploads, and browsers can
+  upload straight to the bucket with a presigned POST so image bytes never
+  pass through an API worker.
+
+Backends are plain blocking code. Async routes use the a*() wrappers, which
+run them in the threadpool so several uploads and deletes can be in flight
+without holding up the event loop.
+"""
+import importlib
+import os
+import shutil
+import tempfile
+import uuid
+from typing import BinaryIO, Optional
+from starlette.concurrency import run_in_threadpool
+from .config import settings
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Content-Type stored with each object, by extension. Never taken from the
+# client: a "text/html" upload served from the bucket would be stored XSS.
+IMAGE_CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+
+def new_key(user_id: int, extension: str) -> str:
+    """Fresh object key; the user id prefix ties direct uploads to their uploader"""
+    return f"{user_id}-{uuid.uuid4().hex}{extension.lower()}"
+
+def key_from_url(url: str) -> str:
+    return url.rsplit("/", 1)[-1]
+
+def content_type_for(key: str) -> str:
+    """Content-Type for an object key, from its (already validated) extension"""
+    return IMAGE_CONTENT_TYPES.get(os.path.splitext(key)[1].lower(), "application/octet-stream")
+
+class Storage:
+    """Image store. Subclass this for other object stores."""
+
+    supports_direct_upload = False
+
+    def prepare(self):
+        """Startup work (called from the app lifespan)"""
+
+    def save(self, key: str, fileobj: BinaryIO):
+        """Store a file, streaming it from fileobj (Content-Type from content_type_for)"""
+        raise NotImplementedError
+
+    def read(self, key: str, max_bytes: int) -> bytes:
+        raise NotImplementedError
+
+    def size(self, key: str) -> Optional[int]:
+        """Size in bytes, or None if there is no such object"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Remove an object (no error if it is already gone)"""
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+    def presigned_upload(self, key: str, max_size: int, expires_in: int) -> dict:
+        """{"url": ..., "fields": {...}} for a browser form POST straight to storage"""
+        raise NotImplementedError
+
+    async def asave(self, key: str, fileobj: BinaryIO):
+        await run_in_threadpool(self.save, key, fileobj)
+
+    async def aread(self, key: str, max_bytes: int) -> bytes:
+        return await run_in_threadpool(self.read, key, max_bytes)
+
+    async def asize(self, key: str) -> Optional[int]:
+        return await run_in_threadpool(self.size, key)
+
+    async def adelete(self, key: str):
+        await run_in_threadpool(self.delete, key)
+
+class LocalStorage(Storage):
+    """Files in a directory, served by the app itself under url_prefix"""
+
+    def __init__(self, root: str, url_prefix: str):
+        # Relative paths are taken from the backend directory, not the CWD
+        self.root = os.path.abspath(os.path.join(BACKEND_DIR, root))
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def prepare(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, os.path.basename(key))
+
+    def save(self, key: str, fileobj: BinaryIO):
+        # Write to a temporary file first so readers never see half an image
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(fileobj, out, COPY_CHUNK_SIZE)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def read(self, key: str, max_bytes: int) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read(max_bytes)
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+class S3Storage(Storage):
+    """S3-compatible object storage (needs the boto3 package)"""
+
+    supports_direct_upload = True
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        public_url: Optional[str] = None,
+        multipart_threshold: int = 8 * 1024 * 1024
+    ):
+        import boto3  # Optional dependency, only needed for this backend
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+        )
+        # Files above the threshold are sent as parallel multipart chunks
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_threshold,
+        )
+        if public_url:
+            self.public_url = public_url.rstrip("/")
+        elif endpoint_url:
+            self.public_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.amazonaws.com"
+
+    def save(self, key: str, fileobj: BinaryIO):
+        self.client.upload_fileobj(
+            fileobj, self.bucket, key,
+            ExtraArgs={"ContentType": content_type_for(key)},
+            Config=self.transfer_config,
+        )
+
+    def read(self, key: str, max_bytes: int) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{max_bytes - 1}")
+        return response["Body"].read()
+
+    def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+    def presigned_upload(self, key: str, max_size: int, expires_in: int) -> dict:
+        # The size limit and content type are enforced by the store itself
+        content_type = content_type_for(key)
+        return self.client.generate_presigned_post(
+            self.bucket,
+            key,
+            Fields={"Content-Type": content_type},
+            Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_size]],
+            ExpiresIn=expires_in,
+        )
+
+def create_storage() -> Storage:
+    """Build the backend named in settings ("local", "s3" or "module:Class")"""
+    name = settings.storage_backend
+    if name == "local":
+        return LocalStorage(settings.upload_dir, settings.upload_url_prefix)
+    if name == "s3":
+        return S3Storage(
+            settings.s3_bucket,
+            endpoint_url=settings.s3_endpoint_url,
+            region=settings.s3_region,
+            access_key_id=settings.s3_access_key_id,
+            secret_access_key=settings.s3_secret_access_key,
+            public_url=settings.s3_public_url,
+            multipart_threshold=settings.s3_multipart_threshold_mb * 1024 * 1024,
+        )
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+_storage: Optional[Storage] = None
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
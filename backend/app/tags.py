@@ -0,0 +1,141 @@
+"""
+Piece tags and feed facet counts.
+
+Tags live in an inverted index (piece_tags, keyed tag first), so filtering
+by several tags is a set operation over index ranges: INTERSECT for "all
+of these", UNION for "any of these". Facet counts for the filter sidebar
+are kept in facet_counts and adjusted whenever a public piece appears or
+disappears.
+"""
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import select, intersect, union, update, func
+from sqlalchemy.orm import Session
+from . import models
+from .database import add_to_counters, insert_missing
+
+MAX_TAGS_PER_PIECE = 10
+MAX_TAG_LENGTH = 30
+
+def parse_tags(raw: Optional[str]) -> List[str]:
+    """Turn "#Wildstyle, nyc  red" into ["wildstyle", "nyc", "red"]"""
+    if not raw:
+        return []
+
+    names = []
+    for part in raw.replace(",", " ").split():
+        name = part.strip().lstrip("#").lower()
+        if not name:
+            continue
+        if len(name) > MAX_TAG_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Tags can be at most {MAX_TAG_LENGTH} characters")
+        if name not in names:
+            names.append(name)
+
+    if len(names) > MAX_TAGS_PER_PIECE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TAGS_PER_PIECE} tags per piece")
+    return names
+
+def get_or_create_tags(db: Session, names: List[str]) -> List[models.Tag]:
+    """Load tags by name, creating the ones that don't exist yet"""
+    if not names:
+        return []
+
+    existing = {tag.name: tag for tag in db.query(models.Tag).filter(models.Tag.name.in_(names))}
+    missing = [name for name in names if name not in existing]
+    if missing:
+        # Another upload may be creating the same tag right now
+        insert_missing(db, models.Tag.__table__, [{"name": name} for name in missing], ["name"])
+        existing.update((tag.name, tag) for tag in db.query(models.Tag).filter(models.Tag.name.in_(missing)))
+    return [existing[name] for name in names]
+
+def tag_filter(db: Session, names: List[str], match_all: bool):
+    """
+    Filter for pieces tagged with all (or any) of the given names.
+    Each tag is one range scan on the piece_tags primary key.
+    """
+    tag_ids = [tag_id for (tag_id,) in db.query(models.Tag.id).filter(models.Tag.name.in_(names))]
+
+    if match_all and len(tag_ids) < len(names):
+        # One of the tags doesn't exist, so nothing can have all of them
+        return models.Piece.id.in_([])
+    if not tag_ids:
+        return models.Piece.id.in_([])
+
+    per_tag = [
+        select(models.piece_tags.c.piece_id).where(models.piece_tags.c.tag_id == tag_id)
+        for tag_id in tag_ids
+    ]
+    if len(per_tag) == 1:
+        matching = per_tag[0]
+    else:
+        matching = intersect(*per_tag) if match_all else union(*per_tag)
+    return models.Piece.id.in_(matching)
+
+def _facet_values(piece: models.Piece) -> List[tuple]:
+    values = [
+        ("piece_type", piece.piece_type.value),
+        ("surface", piece.surface.value),
+    ]
+    values.extend(("tag", name) for name in piece.tag_names)
+    return values
+
+def _bump(db: Session, facet: str, value: str, delta: int):
+    facet_counts = models.FacetCount.__table__
+    if delta > 0:
+        # The first piece with a new tag may be saved twice at once
+        add_to_counters(db, facet_counts, {"facet": facet, "value": value}, {"count": delta})
+        return
+    db.execute(
+        update(facet_counts)
+        .where(facet_counts.c.facet == facet, facet_counts.c.value == value)
+        .values(count=facet_counts.c.count + delta)
+    )
+
+def adjust_facet_counts(db: Session, piece: models.Piece, delta: int):
+    """
+    Add (delta=1) or remove (delta=-1) a piece from the facet counts.
+    Only public pieces are counted; call this in the same transaction as
+    the change that makes a piece appear or disappear from the feed.
+    """
+    if not piece.is_public:
+        return
+
+    for facet, value in _facet_values(piece):
+        _bump(db, facet, value, delta)
+
+def remove_pieces_from_facets(db: Session, piece_filter):
+    """
+    Take every public piece matching piece_filter out of the facet counts
+    with one grouped count per facet, rather than one update per piece.
+    """
+    visible = [models.Piece.is_public == True, piece_filter]
+    groups = [
+        ("piece_type", db.query(models.Piece.piece_type, func.count()).filter(*visible).group_by(models.Piece.piece_type)),
+        ("surface", db.query(models.Piece.surface, func.count()).filter(*visible).group_by(models.Piece.surface)),
+        ("tag", db.query(models.Tag.name, func.count())
+            .join(models.piece_tags, models.piece_tags.c.tag_id == models.Tag.id)
+            .join(models.Piece, models.Piece.id == models.piece_tags.c.piece_id)
+            .filter(*visible)
+            .group_by(models.Tag.name)),
+    ]
+    for facet, query in groups:
+        for value, count in query.all():
+            _bump(db, facet, getattr(value, "value", value), -count)
+
+def read_facets(db: Session, tag_limit: int) -> Dict[str, List[models.FacetCount]]:
+    """Current facet counts, biggest first; only the top tag_limit tags"""
+    rows = db.query(models.FacetCount)\
+        .filter(models.FacetCount.facet.in_(["piece_type", "surface"]), models.FacetCount.count > 0)\
+        .order_by(models.FacetCount.count.desc())\
+        .all()
+    tags = db.query(models.FacetCount)\
+        .filter(models.FacetCount.facet == "tag", models.FacetCount.count > 0)\
+        .order_by(models.FacetCount.count.desc())\
+        .limit(tag_limit)\
+        .all()
+
+    facets = {"piece_type": [], "surface": [], "tag": tags}
+    for row in rows:
+        facets[row.facet].append(row)
+    return facets
@@ -0,0 +1,85 @@
+"""
+Shared fixtures. The app reads its settings at import time, so the test
+environment is set up here before anything from app is imported.
+"""
+import os
+import shutil
+import tempfile
+
+_tmp_dir = tempfile.mkdtemp(prefix="graffiti-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp_dir}/test.db",
+    RUN_MIGRATIONS_ON_STARTUP="false",
+    RATE_LIMIT_ENABLED="false",
+    UPLOAD_DIR=os.path.join(_tmp_dir, "uploads"),
+    PROFILING_DIR=os.path.join(_tmp_dir, "profiles"),
+    CLEANUP_INTERVAL_SECONDS="3600",
+    CLEANUP_GRACE_SECONDS="0",
+    RECOMMEND_UPDATE_INTERVAL_SECONDS="3600",
+)
+
+import pytest
+from fastapi.testclient import TestClient
+from app import database, models, activity
+
+# A 1x1 PNG
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c6360000000000500010d0a2db40000000049454e44ae426082"
+)
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    """Build the test database with the real migrations"""
+    database.run_migrations()
+    yield
+    database.engine.dispose()
+    shutil.rmtree(_tmp_dir, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def client(schema):
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    """Empty every table after each test"""
+    yield
+    activity.get_writer().flush()
+    with database.engine.begin() as conn:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def make_user(client):
+    """Register and log in a user; returns their Authorization header"""
+    def make(username: str) -> dict:
+        response = client.post("/api/auth/register", json={
+            "username": username, "email": f"{username}@example.com", "password": "secret1"
+        })
+        assert response.status_code == 200, response.text
+        response = client.post("/api/auth/login", data={"username": username, "password": "secret1"})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return make
+
+@pytest.fixture
+def make_piece(client):
+    """Upload a piece as the given user; returns the piece JSON"""
+    def make(headers: dict, title: str = "Piece", image: bytes = PNG, **fields) -> dict:
+        data = {"title": title, "piece_type": "tag", "surface": "wall", **fields}
+        response = client.post(
+            "/api/pieces/", data=data, files={"image": ("piece.png", image, "image/png")}, headers=headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
@@ -0,0 +1,93 @@
+from app import activity, cleanup, database, models
+
+def comment(client, headers, piece_id, content="Nice", parent_id=None):
+    response = client.post("/api/comments/", json={
+        "content": content, "piece_id": piece_id, "parent_id": parent_id
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def stats(client, headers, piece_id):
+    piece = client.get(f"/api/pieces/{piece_id}", headers=headers).json()
+    return piece["likes_count"], piece["comments_count"]
+
+def purge():
+    activity.get_writer().flush()  # Queued events for a purged user would fail their foreign keys
+    return cleanup.run_once(database.engine)
+
+def test_deleted_piece_is_hidden_then_purged(client, make_user, make_piece, db):
+    alice, bob = make_user("alice"), make_user("bobby")
+    piece = make_piece(alice)
+    client.post(f"/api/pieces/{piece['id']}/like", headers=bob)
+    comment(client, bob, piece["id"])
+
+    client.delete(f"/api/pieces/{piece['id']}", headers=alice)
+    assert client.get(f"/api/pieces/{piece['id']}", headers=alice).status_code == 404
+    assert db.query(models.Piece).count() == 1
+
+    assert purge() == 1
+    assert db.query(models.Piece).count() == 0
+    assert db.query(models.Like).count() == db.query(models.Comment).count() == 0
+
+def test_deleted_account_stops_counting_at_once(client, make_user, make_piece):
+    alice, bob, carol = make_user("alice"), make_user("bobby"), make_user("carol")
+    piece = make_piece(alice)
+    root = comment(client, carol, piece["id"], "Root")
+    comment(client, bob, piece["id"], "Bob's reply", parent_id=root["id"])
+    comment(client, bob, piece["id"], "Bob's own")
+    client.post(f"/api/pieces/{piece['id']}/like", headers=bob)
+    client.post(f"/api/pieces/{piece['id']}/like", headers=carol)
+    assert stats(client, alice, piece["id"]) == (2, 3)
+
+    client.delete("/api/auth/me", headers=bob)
+
+    assert stats(client, alice, piece["id"]) == (1, 1)
+    threads = client.get(f"/api/comments/piece/{piece['id']}").json()
+    assert [(t["content"], t["reply_count"], t["replies"]) for t in threads] == [("Root", 0, [])]
+    thread = client.get(f"/api/comments/{root['id']}/thread").json()
+    assert [c["content"] for c in thread] == ["Root"]
+
+def test_purged_account_leaves_placeholders_for_replied_comments(client, make_user, make_piece, db):
+    alice, bob, carol = make_user("alice"), make_user("bobby"), make_user("carol")
+    piece = make_piece(alice)
+    replied = comment(client, bob, piece["id"], "Replied to")
+    own_reply = comment(client, bob, piece["id"], "Talking to myself", parent_id=replied["id"])
+    carols = comment(client, carol, piece["id"], "Carol's reply", parent_id=replied["id"])
+    comment(client, bob, piece["id"], "Alone")
+
+    client.delete("/api/auth/me", headers=bob)
+    placeholder = {"content": "", "author": None, "reply_count": 1}
+
+    def thread_view():
+        threads = client.get(f"/api/comments/piece/{piece['id']}").json()
+        assert len(threads) == 1
+        thread = threads[0]
+        assert {key: thread[key] for key in placeholder} == placeholder
+        assert [reply["id"] for reply in thread["replies"]] == [carols["id"]]
+        return thread
+
+    before = thread_view()
+    assert purge() == 1
+    assert thread_view() == before
+
+    remaining = {c.id: c.author_id for c in db.query(models.Comment)}
+    assert remaining[replied["id"]] is None
+    assert own_reply["id"] not in remaining
+    assert stats(client, alice, piece["id"]) == (0, 1)
+
+    # Deleting the placeholder takes the replies with it, counted once each
+    assert client.delete(f"/api/comments/{replied['id']}", headers=alice).status_code == 200
+    assert db.query(models.Comment).count() == 0
+
+def test_reply_to_placeholder_notifies_only_the_artist(client, make_user, make_piece, db):
+    alice, bob, carol = make_user("alice"), make_user("bobby"), make_user("carol")
+    piece = make_piece(alice)
+    replied = comment(client, bob, piece["id"])
+    comment(client, carol, piece["id"], parent_id=replied["id"])
+    client.delete("/api/auth/me", headers=bob)
+    purge()
+
+    comment(client, carol, piece["id"], "Again", parent_id=replied["id"])
+    activity.get_writer().flush()
+    unread = client.get("/api/notifications/unread-count", headers=alice).json()["unread"]
+    assert unread == 2  # Both of Carol's comments, nothing for the placeholder
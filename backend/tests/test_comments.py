@@ -0,0 +1,93 @@
+from app import activity, models
+
+def comment(client, headers, piece_id, content="Nice", parent_id=None):
+    response = client.post("/api/comments/", json={
+        "content": content, "piece_id": piece_id, "parent_id": parent_id
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_replies_get_paths_and_counts(client, make_user, make_piece, db):
+    alice = make_user("alice")
+    piece = make_piece(alice)
+    root = comment(client, alice, piece["id"])
+    reply = comment(client, alice, piece["id"], parent_id=root["id"])
+    nested = comment(client, alice, piece["id"], parent_id=reply["id"])
+
+    assert (reply["depth"], nested["depth"]) == (1, 2)
+    stored = db.query(models.Comment).filter(models.Comment.id == nested["id"]).one()
+    assert stored.ancestor_ids == [root["id"], reply["id"]]
+
+    threads = client.get(f"/api/comments/piece/{piece['id']}").json()
+    assert [t["id"] for t in threads] == [root["id"]]
+    assert threads[0]["reply_count"] == 2
+    assert [r["id"] for r in threads[0]["replies"]] == [reply["id"]]
+
+    thread = client.get(f"/api/comments/{root['id']}/thread").json()
+    assert [c["id"] for c in thread] == [root["id"], reply["id"], nested["id"]]
+
+def test_deleting_a_reply_removes_its_subtree(client, make_user, make_piece):
+    alice = make_user("alice")
+    piece = make_piece(alice)
+    root = comment(client, alice, piece["id"])
+    reply = comment(client, alice, piece["id"], parent_id=root["id"])
+    comment(client, alice, piece["id"], parent_id=reply["id"])
+
+    assert client.delete(f"/api/comments/{reply['id']}", headers=alice).status_code == 200
+
+    thread = client.get(f"/api/comments/{root['id']}/thread").json()
+    assert [c["id"] for c in thread] == [root["id"]]
+    assert thread[0]["reply_count"] == 0
+
+def test_reply_to_comment_without_path(client, make_user, make_piece, db):
+    """Comments written before threading have no path"""
+    alice = make_user("alice")
+    piece = make_piece(alice)
+    old = comment(client, alice, piece["id"])
+    db.query(models.Comment).filter(models.Comment.id == old["id"]).update({models.Comment.path: None})
+    db.commit()
+
+    reply = comment(client, alice, piece["id"], parent_id=old["id"])
+
+    stored = db.query(models.Comment).filter(models.Comment.id == reply["id"]).one()
+    assert stored.path == f"{models.comment_path_segment(old['id'])}/{models.comment_path_segment(reply['id'])}"
+    thread = client.get(f"/api/comments/{old['id']}/thread").json()
+    assert [c["id"] for c in thread] == [old["id"], reply["id"]]
+    assert thread[0]["reply_count"] == 1
+
+def test_depth_is_capped(client, make_user, make_piece, db):
+    alice = make_user("alice")
+    piece = make_piece(alice)
+    parent = comment(client, alice, piece["id"])
+    for _ in range(models.COMMENT_MAX_DEPTH + 3):
+        parent = comment(client, alice, piece["id"], parent_id=parent["id"])
+
+    assert parent["depth"] == models.COMMENT_MAX_DEPTH
+    longest = max(len(c.path) for c in db.query(models.Comment).all())
+    assert longest <= models.Comment.path.type.length
+
+def test_capped_reply_notifies_the_comment_replied_to(client, make_user, make_piece):
+    alice, bob, carol = make_user("alice"), make_user("bobby"), make_user("carol")
+    piece = make_piece(alice)
+    parent = comment(client, alice, piece["id"])
+    for _ in range(models.COMMENT_MAX_DEPTH - 1):
+        parent = comment(client, alice, piece["id"], parent_id=parent["id"])
+    deepest = comment(client, bob, piece["id"], parent_id=parent["id"])
+
+    reply = comment(client, carol, piece["id"], parent_id=deepest["id"])
+    assert reply["parent_id"] == parent["id"]  # Attached alongside Bob's comment
+
+    activity.get_writer().flush()
+    groups = client.get("/api/notifications/", headers=bob).json()
+    assert [(g["verb"], [a["username"] for a in g["actors"]]) for g in groups] == [("reply", ["carol"])]
+
+def test_cannot_reply_to_a_hidden_comment(client, make_user, make_piece):
+    alice, bob = make_user("alice"), make_user("bobby")
+    piece = make_piece(alice)
+    gone = comment(client, bob, piece["id"])
+    client.delete("/api/auth/me", headers=bob)
+
+    response = client.post("/api/comments/", json={
+        "content": "Hello?", "piece_id": piece["id"], "parent_id": gone["id"]
+    }, headers=alice)
+    assert response.status_code == 404
@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import event
+from app import database, geo, models
+
+def map_markers(client, min_lat, min_lng, max_lat, max_lng, zoom):
+    response = client.get("/api/pieces/map", params={
+        "min_lat": min_lat, "min_lng": min_lng, "max_lat": max_lat, "max_lng": max_lng, "zoom": zoom
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def stored_cells(db):
+    return {
+        (cell.zoom, cell.lat_cell, cell.lng_cell): (cell.count, round(cell.lat_sum, 6), round(cell.lng_sum, 6))
+        for cell in db.query(models.MapCell).all()
+    }
+
+def test_near_me_sorts_by_distance(client, make_user, make_piece):
+    alice = make_user("alice")
+    far = make_piece(alice, "Far", latitude=40.70, longitude=-73.90)
+    near = make_piece(alice, "Near", latitude=40.6901, longitude=-73.9201)
+    make_piece(alice, "Other city", latitude=51.5, longitude=-0.12)
+
+    found = client.get("/api/pieces/near", params={"lat": 40.69, "lng": -73.92, "radius_km": 5}).json()
+    assert [p["id"] for p in found] == [near["id"], far["id"]]
+
+def test_near_me_query_count_does_not_grow_with_results(client, make_user, make_piece):
+    alice, bob = make_user("alice"), make_user("bobby")
+    for i, artist in enumerate((alice, bob, alice, bob)):
+        make_piece(artist, f"Piece {i}", tags="nyc red", latitude=40.69 + i / 1000, longitude=-73.92)
+
+    statements = []
+    count = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(database.engine, "before_cursor_execute", count)
+    try:
+        found = client.get("/api/pieces/near", params={"lat": 40.69, "lng": -73.92}).json()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", count)
+
+    assert len(found) == 4 and sorted(found[0]["tags"]) == ["nyc", "red"]
+    assert len(statements) == 3  # Pieces, then their artists and tags
+
+def test_zoomed_out_map_reads_cluster_cells(client, make_user, make_piece):
+    alice = make_user("alice")
+    make_piece(alice, "One", latitude=40.70, longitude=-73.90)
+    make_piece(alice, "Two", latitude=40.71, longitude=-73.91)
+    single = make_piece(alice, "Three", latitude=51.5, longitude=-0.12)
+    make_piece(alice, "Private", latitude=40.70, longitude=-73.90, is_public="false")
+
+    result = map_markers(client, -80, -170, 80, 170, zoom=3)
+    assert result["clustered"]
+    markers = sorted(result["markers"], key=lambda m: -m["count"])
+    assert [m["count"] for m in markers] == [2, 1]
+    assert markers[0]["piece_id"] is None
+    assert markers[0]["latitude"] == pytest.approx(40.705)
+    assert markers[1]["piece_id"] == single["id"]
+
+def test_deleting_pieces_updates_cells(client, make_user, make_piece, db):
+    alice, bob = make_user("alice"), make_user("bobby")
+    first = make_piece(alice, "Alice", latitude=40.70, longitude=-73.90)
+    second = make_piece(bob, "Bob", latitude=40.71, longitude=-73.91)
+    make_piece(bob, "Bob again", latitude=-33.9, longitude=151.2)
+
+    # The cell's linked piece goes away; it should now link the other one
+    client.delete(f"/api/pieces/{first['id']}", headers=alice)
+    markers = map_markers(client, -80, -170, 80, 170, zoom=3)["markers"]
+    new_york = [m for m in markers if m["latitude"] > 0]
+    assert [(m["count"], m["piece_id"]) for m in new_york] == [(1, second["id"])]
+
+    client.delete("/api/auth/me", headers=bob)
+    assert map_markers(client, -80, -170, 80, 170, zoom=3)["markers"] == []
+    assert db.query(models.MapCell).count() == 0
+
+def test_cells_match_a_rebuild(client, make_user, make_piece, db):
+    alice, bob = make_user("alice"), make_user("bobby")
+    for i in range(8):
+        owner = alice if i % 2 else bob
+        piece = make_piece(owner, f"Piece {i}", latitude=40 + i * 0.37, longitude=-74 + i * 0.51)
+        if i < 3:
+            client.delete(f"/api/pieces/{piece['id']}", headers=owner)
+
+    maintained = stored_cells(db)
+    with database.engine.begin() as conn:
+        geo.rebuild_map_cells(conn)
+    db.expire_all()
+    assert stored_cells(db) == maintained
+
+def test_viewport_across_the_antimeridian(client, make_user, make_piece):
+    alice = make_user("alice")
+    east = make_piece(alice, "Fiji", latitude=-17.7, longitude=178.0)
+    west = make_piece(alice, "Samoa", latitude=-13.8, longitude=-172.0)
+    make_piece(alice, "Sydney", latitude=-33.9, longitude=151.2)
+
+    close = map_markers(client, -20, 170, -10, -170, zoom=18)
+    assert not close["clustered"]
+    assert {m["piece_id"] for m in close["markers"]} == {east["id"], west["id"]}
+
+    far = map_markers(client, -20, 170, -10, -170, zoom=5)
+    assert far["clustered"]
+    assert sum(m["count"] for m in far["markers"]) == 2
+
+    assert client.get("/api/pieces/map", params={
+        "min_lat": 10, "min_lng": 0, "max_lat": -10, "max_lng": 10, "zoom": 5
+    }).status_code == 400
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+from app import live
+from app.routers import live as live_routes
+
+def test_slow_subscriber_gets_a_resync(monkeypatch):
+    monkeypatch.setattr(live.settings, "live_queue_size", 2)
+    subscription = live.LiveHub().subscribe({1})
+    for delta in (1, 1, 1):
+        subscription.offer({"type": "like", "piece_id": 1, "delta": delta})
+    assert subscription.queue.get_nowait() == live.RESYNC
+    assert subscription.queue.empty()
+
+def test_only_visible_pieces_are_watched(make_user, make_piece, client):
+    alice = make_user("alice")
+    public = make_piece(alice, "Public")
+    private = make_piece(alice, "Private", is_public="false")
+    deleted = make_piece(alice, "Deleted")
+    client.delete(f"/api/pieces/{deleted['id']}", headers=alice)
+
+    ids = {public["id"], private["id"], deleted["id"]}
+    assert live_routes.visible_piece_ids(ids) == {public["id"]}
+
+def test_piece_lookup_runs_off_the_event_loop(monkeypatch):
+    threads = []
+    def visible_piece_ids(piece_ids):
+        threads.append(threading.current_thread())
+        return piece_ids
+    monkeypatch.setattr(live_routes, "visible_piece_ids", visible_piece_ids)
+
+    async def open_stream():
+        response = await live_routes.stream_piece_updates(request=None, ids="1,2")
+        await response.body_iterator.aclose()
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(open_stream())
+    assert threads and threads[0] is not loop_thread
+
+def test_bad_ids_are_rejected(client):
+    assert client.get("/api/live/pieces", params={"ids": "1,x"}).status_code == 400
@@ -0,0 +1,53 @@
+import os
+import sqlalchemy as sa
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from app import database, models
+
+def alembic_config(url: str) -> Config:
+    config = Config(database.ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(database.ALEMBIC_INI), "alembic"))
+    config.set_main_option("sqlalchemy.url", url)
+    config.attributes["configure_logger"] = False
+    return config
+
+def skip_rtree(object, name, type_, reflected, compare_to):
+    return not (type_ == "table" and name.startswith("pieces_rtree"))
+
+def test_migrations_match_models():
+    with database.engine.connect() as conn:
+        context = MigrationContext.configure(conn, opts={"include_object": skip_rtree})
+        assert compare_metadata(context, models.Base.metadata) == []
+
+def test_upgrade_from_pre_migration_database(tmp_path):
+    """Databases from before Alembic start at 0001 and keep their rows"""
+    url = f"sqlite:///{tmp_path}/old.db"
+    config = alembic_config(url)
+    command.upgrade(config, "0001")
+
+    engine = sa.create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(sa.text(
+            "INSERT INTO users (id, username, email, hashed_password) VALUES (1, 'old', 'old@example.com', 'x')"
+        ))
+        conn.execute(sa.text(
+            "INSERT INTO pieces (id, title, piece_type, surface, image_url, artist_id) "
+            "VALUES (1, 'Old piece', 'TAG', 'WALL', '/uploads/old.png', 1)"
+        ))
+        conn.execute(sa.text("INSERT INTO comments (id, content, author_id, piece_id) VALUES (42, 'Old comment', 1, 1)"))
+
+    command.upgrade(config, "head")
+
+    with engine.connect() as conn:
+        row = conn.execute(sa.text("SELECT path, depth, reply_count FROM comments WHERE id = 42")).one()
+        assert tuple(row) == (models.comment_path_segment(42), 0, 0)
+        assert conn.execute(sa.text("SELECT latitude FROM pieces WHERE id = 1")).scalar() is None
+    engine.dispose()
+
+def test_downgrade_to_base(tmp_path):
+    config = alembic_config(f"sqlite:///{tmp_path}/roundtrip.db")
+    command.upgrade(config, "head")
+    command.downgrade(config, "base")
+    command.upgrade(config, "head")
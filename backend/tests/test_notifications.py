@@ -0,0 +1,44 @@
+from sqlalchemy import event
+from app import activity, database, models
+
+def unread(client, headers):
+    activity.get_writer().flush()
+    return client.get("/api/notifications/unread-count", headers=headers).json()["unread"]
+
+def test_groups_count_people_not_events(client, make_user, make_piece):
+    alice, bob, carol = make_user("alice"), make_user("bobby"), make_user("carol")
+    piece = make_piece(alice)
+    for content in ("One", "Two", "Three"):
+        client.post("/api/comments/", json={"content": content, "piece_id": piece["id"]}, headers=bob)
+    client.post("/api/comments/", json={"content": "Four", "piece_id": piece["id"]}, headers=carol)
+
+    activity.get_writer().flush()
+    groups = client.get("/api/notifications/", headers=alice).json()
+    assert [(g["verb"], g["count"]) for g in groups] == [("comment", 2)]
+    assert [a["username"] for a in groups[0]["actors"]] == ["carol", "bobby"]
+    assert unread(client, alice) == 4
+
+def test_mark_read_keeps_events_that_arrive_meanwhile(client, make_user, make_piece, db):
+    alice, bob = make_user("alice"), make_user("bobby")
+    piece = make_piece(alice)
+    client.post(f"/api/pieces/{piece['id']}/like", headers=bob)
+    activity.get_writer().flush()
+    alice_id = db.query(models.User.id).filter(models.User.username == "alice").scalar()
+    bob_id = db.query(models.User.id).filter(models.User.username == "bobby").scalar()
+
+    # A batch lands after the route looked up the newest event but before it updates the counter
+    landed = []
+    def late_batch(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE users") and not landed:
+            landed.append(True)
+            activity.record(models.ActivityVerb.COMMENT, alice_id, bob_id, piece["id"])
+            activity.get_writer().flush()
+    event.listen(database.engine, "before_cursor_execute", late_batch)
+    try:
+        client.post("/api/notifications/read", headers=alice)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", late_batch)
+
+    assert unread(client, alice) == 1
+    client.post("/api/notifications/read", headers=alice)
+    assert unread(client, alice) == 0
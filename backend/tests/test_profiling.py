@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from app import database, profiling
+from app.config import settings
+
+TOKEN = "let-me-see"
+
+def spin(seconds: float):
+    """Busy work on whichever thread calls it"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+@pytest.fixture
+def profiled_app(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "profiling_token", TOKEN)
+    monkeypatch.setattr(settings, "profiling_dir", str(tmp_path))
+
+    app = FastAPI()
+
+    @app.get("/sync")
+    def sync_endpoint():
+        spin(0.05)
+        with database.engine.connect() as conn:
+            return {"one": conn.execute(text("SELECT 1")).scalar()}
+
+    @app.get("/waits")
+    async def waiting_endpoint():
+        await asyncio.sleep(0.2)
+        return {}
+
+    @app.get("/busy")
+    async def busy_endpoint():
+        spin(0.15)
+        return {}
+
+    profiling.install(app, [database.engine])
+    yield app
+    event.remove(database.engine, "before_cursor_execute", profiling._before_cursor_execute)
+    event.remove(database.engine, "after_cursor_execute", profiling._after_cursor_execute)
+
+def read_capture(client, profile_id):
+    headers = {"X-Profile": TOKEN}
+    summary = client.get(f"/api/debug/profiles/{profile_id}", headers=headers).json()
+    stacks = client.get(f"/api/debug/profiles/{profile_id}/folded", headers=headers).text
+    return summary, stacks
+
+def test_sample_rate_without_token_is_refused(monkeypatch):
+    monkeypatch.setattr(settings, "profiling_token", None)
+    monkeypatch.setattr(settings, "profiling_sample_rate", 0.1)
+    with pytest.raises(RuntimeError):
+        profiling.enabled()
+
+def test_relative_profile_dir_does_not_depend_on_the_cwd(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "profiling_dir", "profiles")
+    monkeypatch.chdir(tmp_path)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(profiling.__file__)))
+    assert profiling.profile_dir() == os.path.join(backend_dir, "profiles")
+
+def test_sync_endpoint_profile(profiled_app):
+    client = TestClient(profiled_app)
+    assert "x-profile-id" not in client.get("/sync").headers
+
+    response = client.get("/sync", headers={"X-Profile": TOKEN})
+    summary, stacks = read_capture(client, response.headers["x-profile-id"])
+    assert summary["sql_count"] == 1
+    assert "spin (" in stacks and "sync_endpoint" in stacks
+    assert client.get("/api/debug/profiles/").status_code == 404  # No token
+
+def test_async_profile_leaves_out_other_requests(profiled_app):
+    async def run():
+        transport = httpx.ASGITransport(app=profiled_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            profiled, _ = await asyncio.gather(
+                client.get("/waits", headers={"X-Profile": TOKEN}),
+                client.get("/busy"),
+            )
+        return profiled.headers["x-profile-id"]
+
+    profile_id = asyncio.run(run())
+    _, stacks = read_capture(TestClient(profiled_app), profile_id)
+    assert "spin" not in stacks and "busy_endpoint" not in stacks
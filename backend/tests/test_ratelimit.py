@@ -0,0 +1,90 @@
+import pytest
+from app import ratelimit
+from app.config import settings
+from app.main import app
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Turn rate limiting on with a fresh in-memory backend"""
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(ratelimit, "_backend", ratelimit.InMemoryBackend())
+    return settings.rate_limits
+
+def test_bucket_refills_over_time(clock):
+    backend = ratelimit.InMemoryBackend()
+    capacity, rate = ratelimit.parse_budget("2/minute")
+
+    assert backend.acquire("k", capacity, rate)[0]
+    assert backend.acquire("k", capacity, rate)[0]
+    allowed, retry_after = backend.acquire("k", capacity, rate)
+    assert not allowed and retry_after == pytest.approx(30)
+
+    clock.now += 30
+    assert backend.acquire("k", capacity, rate)[0]
+
+def test_sweep_keeps_buckets_of_slower_budgets(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit.InMemoryBackend, "SWEEP_SIZE", 50)
+    backend = ratelimit.InMemoryBackend()
+    register = ratelimit.parse_budget("5/hour")
+    like = ratelimit.parse_budget("60/minute")
+
+    for _ in range(5):
+        assert backend.acquire("register:ip:1", *register)[0]
+
+    # Lots of short-lived "like" buckets force sweeps a minute later
+    clock.now += 120
+    for i in range(200):
+        backend.acquire(f"like:ip:{i}", *like)
+
+    # The register bucket was not full yet, so it must not have been reset
+    assert not backend.acquire("register:ip:1", *register)[0]
+
+def test_sweep_forgets_full_buckets(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit.InMemoryBackend, "SWEEP_SIZE", 10)
+    backend = ratelimit.InMemoryBackend()
+    like = ratelimit.parse_budget("60/minute")
+
+    for i in range(5):
+        backend.acquire(f"like:ip:old{i}", *like)
+    clock.now += 2  # The old buckets are full again by now
+    for i in range(6):
+        backend.acquire(f"like:ip:new{i}", *like)
+    assert sorted(backend._buckets) == [f"like:ip:new{i}" for i in range(6)]
+
+def test_route_returns_429_with_retry_after(client, make_user, limits, monkeypatch):
+    make_user("alice")
+    monkeypatch.setitem(limits, "login", "2/minute")
+
+    form = {"username": "alice", "password": "secret1"}
+    assert client.post("/api/auth/login", data=form).status_code == 200
+    assert client.post("/api/auth/login", data=form).status_code == 200
+    response = client.post("/api/auth/login", data=form)
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+def admission_middleware():
+    layer = app.middleware_stack
+    while not isinstance(layer, ratelimit.AdmissionControlMiddleware):
+        layer = layer.app
+    return layer
+
+def test_busy_response_has_cors_headers(client, monkeypatch):
+    monkeypatch.setattr(admission_middleware(), "max_concurrent", 0)
+
+    response = client.get("/api/pieces/", headers={"Origin": "http://localhost:3000"})
+    assert response.status_code == 503
+    assert response.headers["access-control-allow-origin"]
+    assert client.get("/health").status_code == 200
@@ -0,0 +1,65 @@
+import random
+from app import database, models, recommend
+from app.config import settings
+
+def stored_neighbours(db):
+    db.expire_all()
+    return sorted(
+        (row.piece_id, row.neighbor_id, round(row.score, 6), row.co_likes)
+        for row in db.query(models.PieceNeighbor)
+    )
+
+def test_related_pieces_come_from_co_likes(client, make_user, make_piece, monkeypatch):
+    monkeypatch.setattr(settings, "recommend_min_co_likes", 1)
+    alice, bob = make_user("alice"), make_user("bobby")
+    first, second, third = (make_piece(alice, title) for title in ("One", "Two", "Three"))
+    for piece in (first, second):
+        client.post(f"/api/pieces/{piece['id']}/like", headers=bob)
+    recommend.get_updater().flush()
+
+    related = client.get(f"/api/pieces/{first['id']}/related").json()
+    assert [p["id"] for p in related] == [second["id"]]
+    assert client.get(f"/api/pieces/{third['id']}/related").json() == []
+
+def test_incremental_updates_match_a_rebuild(client, make_user, make_piece, db, monkeypatch):
+    monkeypatch.setattr(settings, "recommend_neighbors", 2)  # Small, so rows get cut off
+    monkeypatch.setattr(settings, "recommend_min_co_likes", 1)
+    users = [make_user(f"user{i}") for i in range(6)]
+    pieces = [make_piece(users[0], f"Piece {i}")["id"] for i in range(8)]
+    liked = set()
+
+    rng = random.Random(38)
+    for _ in range(12):
+        for _ in range(4):
+            user, piece = rng.randrange(len(users)), rng.choice(pieces)
+            if (user, piece) in liked:
+                client.delete(f"/api/pieces/{piece}/like", headers=users[user])
+                liked.discard((user, piece))
+            else:
+                client.post(f"/api/pieces/{piece}/like", headers=users[user])
+                liked.add((user, piece))
+        recommend.get_updater().flush()
+
+        incremental = stored_neighbours(db)
+        recommend.rebuild(database.engine)
+        assert incremental == stored_neighbours(db)
+
+def test_unlike_refreshes_a_bounded_set(client, make_user, make_piece, db, monkeypatch):
+    monkeypatch.setattr(settings, "recommend_min_co_likes", 1)
+    alice, bob, carol = make_user("alice"), make_user("bobby"), make_user("carol")
+    popular = make_piece(alice, "Popular")["id"]
+    others = [make_piece(alice, f"Piece {i}")["id"] for i in range(6)]
+    for piece in [popular] + others:
+        client.post(f"/api/pieces/{piece}/like", headers=bob)
+    client.post(f"/api/pieces/{others[0]}/like", headers=carol)
+    client.post(f"/api/pieces/{popular}/like", headers=carol)
+    client.delete(f"/api/pieces/{popular}/like", headers=carol)
+
+    refreshed = []
+    monkeypatch.setattr(recommend, "refresh", lambda engine, piece_ids: refreshed.append(set(piece_ids)))
+    updater = recommend.RecommendationUpdater(database.engine, interval=3600, fanout=2)
+    updater.add(db.query(models.User.id).filter(models.User.username == "carol").scalar(), popular)
+    updater.flush()
+
+    # The piece, Carol's other like, and only the two pieces most co-liked with it
+    assert refreshed == [{popular, others[0], others[1]}]
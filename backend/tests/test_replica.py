@@ -0,0 +1,96 @@
+import sqlite3
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+from app import database
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """A SQLite replica that only changes when copy() is called"""
+    path = tmp_path / "replica.db"
+    primary_path = database.engine.url.database
+
+    def copy():
+        with sqlite3.connect(primary_path) as source, sqlite3.connect(path) as target:
+            source.backup(target)
+
+    copy()
+    engine = create_engine(f"sqlite:///{path}")
+    monkeypatch.setattr(database, "replica_engine", engine)
+    yield copy
+    engine.dispose()
+
+def test_lag_compares_primary_and_replica_heartbeats(replica, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(database.time, "time", clock)
+    monitor = database.ReplicaMonitor(interval=2)
+
+    monitor.check()
+    assert monitor.lag is None  # Nothing replicated yet
+    assert not monitor.healthy()
+
+    replica()
+    clock.now += 2
+    monitor.check()
+    assert monitor.lag == 0.0
+    assert monitor.healthy()
+
+    # Replication stalls: the replica falls one stamp further behind per check
+    for _ in range(4):
+        clock.now += 2
+        monitor.check()
+    assert monitor.lag == 8.0
+    assert not monitor.healthy()
+
+    replica()
+    clock.now += 2
+    monitor.check()
+    assert monitor.lag == 0.0
+
+def test_lag_does_not_depend_on_how_often_it_is_checked(replica, monkeypatch):
+    """A quiet period between checks is not replication lag"""
+    clock = Clock()
+    monkeypatch.setattr(database.time, "time", clock)
+    monitor = database.ReplicaMonitor(interval=2)
+
+    monitor.check()
+    replica()
+    clock.now += 600
+    monitor.check()
+    assert monitor.lag == 0.0
+
+def test_writes_pin_the_client_to_the_primary(client, make_user, replica):
+    headers = make_user("alice")
+    response = client.put("/api/auth/me", json={"crew": "KTS"}, headers=headers)
+    pinned_until = response.headers[database.PRIMARY_PIN_HEADER]
+    assert float(pinned_until) > time.time()
+
+    request = Request({
+        "type": "http", "method": "GET", "path": "/",
+        "headers": [(database.PRIMARY_PIN_HEADER.lower().encode(), pinned_until.encode())],
+    })
+    assert database.is_pinned_to_primary(request)
+    assert not database.is_pinned_to_primary(Request({"type": "http", "method": "GET", "path": "/", "headers": []}))
+
+def test_feed_refetch_with_the_echoed_pin_reads_the_primary(client, make_user, make_piece, replica, monkeypatch):
+    """What the frontend does after an upload: reload the feed, echoing the pin header"""
+    monkeypatch.setattr(database, "ReplicaSessionLocal", sessionmaker(bind=database.replica_engine))
+    monkeypatch.setattr(database.replica_monitor, "healthy", lambda: True)
+    alice = make_user("alice")
+    replica()
+
+    make_piece(alice, "Fresh")
+    pin = {database.PRIMARY_PIN_HEADER: client.cookies[database.PRIMARY_PIN_COOKIE]}
+    client.cookies.clear()  # Cross-origin, so the cookie isn't sent; the header is
+
+    assert client.get("/api/pieces/").json() == []  # The replica hasn't caught up
+    assert [p["title"] for p in client.get("/api/pieces/", headers=pin).json()] == ["Fresh"]
@@ -0,0 +1,61 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import database, models, ratelimit, revocation
+from app.config import settings
+
+def login(client, username="alice"):
+    response = client.post("/api/auth/login", data={"username": username, "password": "secret1"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def revoke_row(row_id: int) -> str:
+    jti = str(uuid.uuid4())
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.RevokedToken.__table__).values(
+            id=row_id, jti=jti, token_type="access", expires_at=datetime.utcnow() + timedelta(minutes=5)
+        ))
+    return jti
+
+def test_sync_picks_up_revocations_committed_out_of_order():
+    denylist = revocation.TokenDenylist(database.engine, sync_interval=60)
+    later = revoke_row(20)
+    denylist.sync()
+    earlier = revoke_row(10)  # Got the lower id but committed after the last sync
+    denylist.sync()
+    assert later in denylist and earlier in denylist
+
+def test_sync_keeps_local_revocations_and_drops_expired_ones():
+    denylist = revocation.TokenDenylist(database.engine, sync_interval=60)
+    denylist.add("uncommitted", time.time() + 60)
+    denylist.add("expired", time.time() - 1)
+    denylist.sync()
+    assert "uncommitted" in denylist and "expired" not in denylist
+
+def test_logout_revokes_the_access_token(client, make_user):
+    make_user("alice")
+    tokens = login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    client.post("/api/auth/logout", headers=headers)
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_refresh_tokens_work_once(client, make_user):
+    make_user("alice")
+    refresh_token = login(client)["refresh_token"]
+    assert client.post("/api/auth/refresh", json={"refresh_token": refresh_token}).status_code == 200
+    assert client.post("/api/auth/refresh", json={"refresh_token": refresh_token}).status_code == 401
+
+def test_refresh_has_its_own_budget(client, make_user, monkeypatch):
+    make_user("alice")
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(ratelimit, "_backend", ratelimit.InMemoryBackend())
+    monkeypatch.setitem(settings.rate_limits, "login", "1/minute")
+
+    refresh_token = login(client)["refresh_token"]
+    for _ in range(3):
+        response = client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+        assert response.status_code == 200
+        refresh_token = response.json()["refresh_token"]
@@ -0,0 +1,92 @@
+import json
+from datetime import datetime
+from typing import List
+from pydantic import TypeAdapter
+from app import models, schemas, serialization
+
+def validated_json(schema_type, items) -> list:
+    """What FastAPI would send for a returned model list and a response_model"""
+    adapter = TypeAdapter(schema_type)
+    validated = adapter.validate_python([item.model_dump() for item in items])
+    return json.loads(json.dumps(adapter.dump_python(validated, mode="json")))
+
+def fast_json(schema_type, items) -> list:
+    return json.loads(serialization.json_response(schema_type, items).body)
+
+def revalidated(schema_type, data):
+    adapter = TypeAdapter(schema_type)
+    return adapter.dump_python(adapter.validate_python(data), mode="json")
+
+def make_artist(**fields):
+    return models.User(
+        id=1, username="alice", email="alice@example.com", hashed_password="x",
+        tag_name=None, crew=None, is_active=True, is_premium=False, created_at=datetime(2024, 1, 1), **fields
+    )
+
+def test_piece_fast_path_matches_validated_path():
+    artist = make_artist()
+    tagged = models.Piece(
+        id=1, title="Burner", description="North wall", piece_type=models.PieceType.WILDSTYLE,
+        surface=models.Surface.TRAIN, location="Bushwick", latitude=40.69, longitude=-73.92,
+        is_public=True, image_url="/uploads/1.jpg", thumbnail_url=None, artist_id=1, artist=artist,
+        created_at=datetime(2024, 1, 1, 12, 30), tags=[models.Tag(id=1, name="nyc"), models.Tag(id=2, name="red")],
+    )
+    bare = models.Piece(
+        id=2, title="Tag", description=None, piece_type=models.PieceType.TAG, surface=models.Surface.WALL,
+        location=None, latitude=None, longitude=None, is_public=False, image_url="/uploads/2.jpg",
+        thumbnail_url=None, artist_id=1, artist=artist, created_at=datetime(2024, 1, 2), tags=[],
+    )
+
+    fast = [
+        serialization.piece_with_stats(tagged, likes_count=3, comments_count=1, is_liked_by_user=True),
+        serialization.piece_with_stats(bare),
+    ]
+    slow = [
+        schemas.PieceWithStats(**{
+            **piece.__dict__, "artist": piece.artist, "tag_names": list(piece.tag_names),
+            "likes_count": likes, "comments_count": comments, "is_liked_by_user": liked,
+        })
+        for piece, likes, comments, liked in ((tagged, 3, 1, True), (bare, 0, 0, False))
+    ]
+    assert fast_json(List[schemas.PieceWithStats], fast) == validated_json(List[schemas.PieceWithStats], slow)
+
+def test_comment_fast_path_matches_validated_path():
+    author = make_artist()
+    root = models.Comment(
+        id=1, content="Clean lines", author_id=1, author=author, piece_id=1, parent_id=None,
+        depth=0, reply_count=1, created_at=datetime(2024, 1, 1),
+    )
+    reply = models.Comment(
+        id=2, content="Thanks", author_id=1, author=author, piece_id=1, parent_id=1,
+        depth=1, reply_count=0, created_at=datetime(2024, 1, 2),
+    )
+
+    fast = [serialization.comment_thread(root, [reply])]
+    slow = [schemas.CommentThread.model_validate({
+        **schemas.Comment.model_validate(root).model_dump(),
+        "replies": [schemas.Comment.model_validate(reply)],
+    })]
+    assert fast_json(List[schemas.CommentThread], fast) == validated_json(List[schemas.CommentThread], slow)
+
+def test_placeholder_comment_is_valid_output():
+    gone = models.Comment(
+        id=1, content="Deleted later", author_id=None, author=None, piece_id=1, parent_id=None,
+        depth=0, reply_count=2, created_at=datetime(2024, 1, 1),
+    )
+    [item] = fast_json(List[schemas.Comment], [serialization.comment_out(gone)])
+    assert item["content"] == "" and item["author"] is None
+    assert schemas.Comment.model_validate(item).model_dump(mode="json") == item
+
+def test_feed_responses_validate_against_their_schemas(client, make_user, make_piece):
+    alice = make_user("alice")
+    piece = make_piece(alice, "Piece", tags="nyc", latitude=40.7, longitude=-73.9)
+    client.post("/api/comments/", json={"content": "Nice", "piece_id": piece["id"]}, headers=alice)
+
+    feed = client.get("/api/pieces/").json()
+    nearby = client.get("/api/pieces/near", params={"lat": 40.7, "lng": -73.9}).json()
+    comments = client.get(f"/api/comments/piece/{piece['id']}").json()
+    assert revalidated(List[schemas.PieceWithStats], feed) == feed
+    assert revalidated(List[schemas.PieceNearby], nearby) == nearby
+    assert revalidated(List[schemas.CommentThread], comments) == comments
+    assert feed[0]["comments_count"] == 1 and feed[0]["tags"] == ["nyc"]
+    assert nearby[0]["distance_km"] == 0 and nearby[0]["tags"] == ["nyc"]
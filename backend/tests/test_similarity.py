@@ -0,0 +1,55 @@
+import io
+import struct
+import zlib
+from PIL import Image
+from app import similarity
+
+def png(width: int, height: int, shift: int = 0) -> bytes:
+    """A diagonal gradient; shift brightens it slightly"""
+    image = Image.new("L", (width, height))
+    image.putdata([min(255, (x * 7 + y * 3) % 256 + shift) for y in range(height) for x in range(width)])
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+def png_header_only(width: int, height: int) -> bytes:
+    """A tiny PNG that claims huge dimensions (a decompression bomb)"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"\0" * 64)) + chunk(b"IEND", b"")
+
+def test_similar_images_have_close_hashes():
+    original = similarity.compute_dhash(png(64, 64))
+    brighter = similarity.compute_dhash(png(64, 64, shift=3))
+    different = similarity.compute_dhash(png(32, 80))
+
+    assert similarity.hamming_distance(original, brighter) <= 4
+    assert similarity.hamming_distance(original, different) > 4
+
+def test_undecodable_images_have_no_hash():
+    assert similarity.compute_dhash(b"not an image") is None
+
+def test_oversized_images_are_not_decoded():
+    assert similarity.compute_dhash(png_header_only(100_000, 100_000)) is None
+
+def test_pillow_bomb_errors_are_caught(monkeypatch):
+    monkeypatch.setattr(similarity, "MAX_HASH_PIXELS", 10 ** 12)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    assert similarity.compute_dhash(png(40, 40)) is None  # Warning range (1x-2x the limit)
+    assert similarity.compute_dhash(png(64, 64)) is None  # Error range
+
+def test_near_duplicate_uploads_are_flagged(client, make_user, make_piece):
+    alice, bob = make_user("alice"), make_user("bobby")
+    original = make_piece(alice, "Original", image=png(64, 64))
+    copy = make_piece(bob, "Copy", image=png(64, 64, shift=3))
+    unrelated = make_piece(bob, "Unrelated", image=png(32, 80))
+
+    assert copy["possible_duplicate"]
+    assert [p["id"] for p in copy["similar_pieces"]] == [original["id"]]
+    assert not unrelated["possible_duplicate"]
+
+def test_bomb_upload_is_stored_without_a_hash(client, make_user, make_piece):
+    alice = make_user("alice")
+    piece = make_piece(alice, "Huge", image=png_header_only(100_000, 100_000))
+    assert not piece["possible_duplicate"]
@@ -0,0 +1,83 @@
+import base64
+import io
+import json
+import pytest
+from app import ratelimit, storage
+from app.config import settings
+
+class DirectStorage(storage.LocalStorage):
+    """Local files, but pretending to hand out presigned uploads"""
+
+    supports_direct_upload = True
+
+    def presigned_upload(self, key, max_size, expires_in):
+        return {"url": "http://storage.test/", "fields": {"key": key}}
+
+@pytest.fixture
+def direct_storage(monkeypatch, tmp_path):
+    backend = DirectStorage(str(tmp_path), "/uploads")
+    backend.prepare()
+    monkeypatch.setattr(storage, "_storage", backend)
+    return backend
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(ratelimit, "_backend", ratelimit.InMemoryBackend())
+    return settings.rate_limits
+
+def presign(client, headers, filename="wall.png"):
+    return client.post("/api/pieces/uploads", json={"filename": filename}, headers=headers)
+
+def test_local_storage_round_trip(tmp_path):
+    backend = storage.LocalStorage(str(tmp_path), "/uploads/")
+    backend.prepare()
+    backend.save("1-abc.png", io.BytesIO(b"image bytes"))
+
+    assert backend.url("1-abc.png") == "/uploads/1-abc.png"
+    assert backend.size("1-abc.png") == 11
+    assert backend.read("1-abc.png", 5) == b"image"
+    backend.delete("1-abc.png")
+    backend.delete("1-abc.png")  # Already gone is fine
+    assert backend.size("1-abc.png") is None
+
+def test_content_type_comes_from_the_extension():
+    assert storage.content_type_for("1-abc.JPG") == "image/jpeg"
+    assert storage.content_type_for("1-abc.webp") == "image/webp"
+    assert storage.content_type_for("1-abc.html") == "application/octet-stream"
+
+def test_presigned_post_pins_the_content_type(monkeypatch):
+    pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    backend = storage.S3Storage("bucket", region="us-east-1")
+
+    presigned = backend.presigned_upload("1-abc.png", 1000, 60)
+    policy = json.loads(base64.b64decode(presigned["fields"]["policy"]))
+    assert presigned["fields"]["Content-Type"] == "image/png"
+    assert {"Content-Type": "image/png"} in policy["conditions"]
+    assert ["content-length-range", 1, 1000] in policy["conditions"]
+
+def test_no_direct_upload_support_costs_no_tokens(client, make_user, limits, monkeypatch):
+    alice = make_user("alice")
+    monkeypatch.setitem(limits, "direct_upload", "1/hour")
+    for _ in range(3):
+        assert presign(client, alice).status_code == 501
+
+def test_direct_uploads_have_their_own_budget(client, make_user, make_piece, direct_storage, limits, monkeypatch):
+    alice = make_user("alice")
+    monkeypatch.setitem(limits, "create_piece", "2/hour")
+    monkeypatch.setitem(limits, "direct_upload", "2/hour")
+
+    keys = [presign(client, alice).json()["key"] for _ in range(2)]
+    assert presign(client, alice).status_code == 429
+    for key in keys:
+        direct_storage.save(key, io.BytesIO(b"not really a png"))
+        response = client.post("/api/pieces/", data={
+            "title": "Direct", "piece_type": "tag", "surface": "wall", "image_key": key
+        }, headers=alice)
+        assert response.status_code == 200, response.text
+
+def test_presign_rejects_other_file_types(client, make_user, direct_storage):
+    alice = make_user("alice")
+    assert presign(client, alice, "page.html").status_code == 400
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from sqlalchemy import event, insert
+from app import database, models
+
+@contextmanager
+def before_statement(prefix, action):
+    """Run action once, from another connection, just before the first statement starting with prefix"""
+    done = []
+    def hook(conn, cursor, statement, *args):
+        if statement.startswith(prefix) and not done:
+            done.append(True)
+            with database.engine.begin() as other:
+                action(other)
+    event.listen(database.engine, "before_cursor_execute", hook)
+    try:
+        yield done
+    finally:
+        event.remove(database.engine, "before_cursor_execute", hook)
+
+def feed_ids(client, **params):
+    return {p["id"] for p in client.get("/api/pieces/", params=params).json()}
+
+def facets(client, facet):
+    return {f["value"]: f["count"] for f in client.get("/api/pieces/facets").json()[facet]}
+
+def test_filter_by_all_or_any_tags(client, make_user, make_piece):
+    alice = make_user("alice")
+    both = make_piece(alice, "Both", tags="#NYC, red")
+    nyc = make_piece(alice, "NYC", tags="nyc")
+    make_piece(alice, "Untagged")
+
+    assert feed_ids(client, tags="nyc,red") == {both["id"]}
+    assert feed_ids(client, tags="nyc,red", tag_mode="any") == {both["id"], nyc["id"]}
+    assert feed_ids(client, tags="nyc,nope") == set()
+
+def test_facet_counts_follow_public_pieces(client, make_user, make_piece):
+    alice = make_user("alice")
+    first = make_piece(alice, "One", tags="nyc")
+    make_piece(alice, "Two", tags="nyc red")
+    make_piece(alice, "Private", tags="nyc", is_public="false")
+    assert facets(client, "tag") == {"nyc": 2, "red": 1}
+
+    client.delete(f"/api/pieces/{first['id']}", headers=alice)
+    assert facets(client, "tag") == {"nyc": 1, "red": 1}
+
+def test_tag_created_concurrently_is_reused(client, make_user, make_piece, db):
+    alice = make_user("alice")
+    create_tag = lambda conn: conn.execute(insert(models.Tag.__table__).values(name="nyc"))
+    with before_statement("INSERT INTO tags", create_tag) as done:
+        piece = make_piece(alice, "One", tags="nyc red")
+    assert done
+
+    assert sorted(piece["tags"]) == ["nyc", "red"]
+    assert db.query(models.Tag).count() == 2
+
+def test_facet_row_created_concurrently_is_added_to(client, make_user, make_piece):
+    alice = make_user("alice")
+    make_piece(alice, "Private", tags="nyc", is_public="false")  # The tag exists; only the count is new
+    facet_counts = models.FacetCount.__table__
+    create_row = lambda conn: conn.execute(insert(facet_counts).values(facet="tag", value="nyc", count=1))
+    with before_statement("INSERT INTO facet_counts", create_row) as done:
+        make_piece(alice, "One", tags="nyc")
+    assert done
+
+    assert facets(client, "tag") == {"nyc": 2}
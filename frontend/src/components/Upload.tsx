@@ -1,4 +1,5 @@
 import { useState } from 'react';
+import { piecesApi } from '../services/api';
 
 interface UploadProps {
   onSuccess: () => void;
@@ -73,6 +74,32 @@ export default function Upload({ onSuccess, onClose }: UploadProps) {
     }
   };
 
+  // Returns the storage key, or null if direct uploads are not available
+  const uploadDirect = async (image: File): Promise<string | null> => {
+    let presigned: { key: string; url: string; fields: Record<string, string> };
+    try {
+      presigned = await piecesApi.createUpload(image.name);
+    } catch (err: any) {
+      if (err.response?.status === 501) {
+        return null;
+      }
+      throw err;
+    }
+
+    const { key, url, fields } = presigned;
+    const storageData = new FormData();
+    Object.entries(fields).forEach(([name, value]) => {
+      storageData.append(name, value);
+    });
+    storageData.append('file', image);  // Must come after the policy fields
+
+    const stored = await fetch(url, { method: 'POST', body: storageData });
+    if (!stored.ok) {
+      throw new Error('Image upload failed (is it under 5MB?)');
+    }
+    return key;
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     
@@ -97,26 +124,23 @@ export default function Upload({ onSuccess, onClose }: UploadProps) {
       uploadData.append('surface', formData.surface);
       uploadData.append('location', formData.location);
       uploadData.append('is_public', formData.is_public.toString());
-      uploadData.append('image', file);
 
-      const response = await fetch('http://localhost:8000/api/pieces/', {
-        method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${token}`,
-        },
-        body: uploadData,
-      });
-
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.detail || 'Upload failed');
+      // Send the image straight to storage when the server supports it,
+      // otherwise include it in the form
+      const imageKey = await uploadDirect(file);
+      if (imageKey) {
+        uploadData.append('image_key', imageKey);
+      } else {
+        uploadData.append('image', file);
       }
 
+      await piecesApi.create(uploadData);
+
       // Success!
       onSuccess();
       onClose();
     } catch (err: any) {
-      setError(err.message || 'Failed to upload piece');
+      setError(err.response?.data?.detail || err.message || 'Failed to upload piece');
     } finally {
       setLoading(false);
     }
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import ReactDOM from 'react-dom';
+import { authApi, piecesApi, subscribeToPieces } from '../services/api';
 
 const pieceTypes = [
   { value: 'tag', label: 'Tag' },
@@ -114,17 +115,37 @@ export default function Home() {
     loadPieces();
   }, []);
 
+  // Live like/comment counts for the pieces on screen, instead of refetching
+  const pieceIds = pieces.map((piece) => piece.id).join(',');
+  useEffect(() => {
+    if (!pieceIds) return;
+    return subscribeToPieces(pieceIds.split(',').map(Number), (event) => {
+      if (event.type === 'resync') {
+        loadPieces();
+        return;
+      }
+      setPieces((current) => current.map((piece) => {
+        if (piece.id !== event.piece_id) return piece;
+        if (event.type === 'like') {
+          return { ...piece, likes_count: (piece.likes_count || 0) + event.delta };
+        }
+        if (event.type === 'comment') {
+          return { ...piece, comments_count: (piece.comments_count || 0) + 1 };
+        }
+        if (event.type === 'comment_deleted') {
+          return { ...piece, comments_count: Math.max(0, (piece.comments_count || 0) - event.removed) };
+        }
+        return piece;
+      }));
+    });
+  }, [pieceIds]);
+
   const loadPieces = async () => {
     try {
       setLoading(true);
       setError('');
-      const response = await fetch('http://localhost:8000/api/pieces/');
-      
-      if (!response.ok) {
-        throw new Error(`Failed to load pieces: ${response.status}`);
-      }
-      
-      const data = await response.json();
+      // Through the api client, so it carries the primary pin after an upload
+      const data = await piecesApi.getAll();
       setPieces(data);
     } catch (error) {
       console.error('Error loading pieces:', error);
@@ -134,8 +155,8 @@ export default function Home() {
     }
   };
 
-  const handleLogout = () => {
-    localStorage.removeItem('token');
+  const handleLogout = async () => {
+    await authApi.logout();
     setIsLoggedIn(false);
     navigate('/login');
   };
@@ -191,18 +212,7 @@ export default function Home() {
       formData.append('is_public', uploadForm.is_public.toString());
       formData.append('image', uploadFile);
 
-      const response = await fetch('http://localhost:8000/api/pieces/', {
-        method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${token}`,
-        },
-        body: formData,
-      });
-
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.detail || 'Upload failed');
-      }
+      await piecesApi.create(formData);
 
       // Success!
       alert('Piece uploaded successfully!');
@@ -220,7 +230,7 @@ export default function Home() {
       setUploadPreview('');
       loadPieces();
     } catch (err: any) {
-      setUploadError(err.message || 'Failed to upload piece');
+      setUploadError(err.response?.data?.detail || err.message || 'Failed to upload piece');
     } finally {
       setUploadLoading(false);
     }
@@ -1,5 +1,6 @@
 import { useState } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
+import { authApi } from '../services/api';
 
 export default function Login() {
   const navigate = useNavigate();
@@ -16,27 +17,14 @@ export default function Login() {
     setError('');
 
     try {
-      const formDataToSend = new FormData();
-      formDataToSend.append('username', formData.username);
-      formDataToSend.append('password', formData.password);
-
-      const response = await fetch('http://localhost:8000/api/auth/login', {
-        method: 'POST',
-        body: formDataToSend,
-      });
-
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.detail || 'Login failed');
-      }
-
-      const data = await response.json();
+      const data = await authApi.login(formData.username, formData.password);
       localStorage.setItem('token', data.access_token);
+      localStorage.setItem('refreshToken', data.refresh_token);
       
       // Redirect to home page
       navigate('/');
     } catch (err: any) {
-      setError(err.message || 'Failed to login');
+      setError(err.response?.data?.detail || err.message || 'Failed to login');
     } finally {
       setLoading(false);
     }
@@ -1,5 +1,6 @@
 import { useState } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
+import { authApi } from '../services/api';
 
 export default function Register() {
   const navigate = useNavigate();
@@ -33,45 +34,26 @@ export default function Register() {
     setError('');
 
     try {
-      const response = await fetch('http://localhost:8000/api/auth/register', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          username: formData.username,
-          email: formData.email,
-          password: formData.password,
-          tag_name: formData.tag_name || undefined,
-          crew: formData.crew || undefined,
-        }),
+      await authApi.register({
+        username: formData.username,
+        email: formData.email,
+        password: formData.password,
+        tag_name: formData.tag_name || undefined,
+        crew: formData.crew || undefined,
       });
 
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.detail || 'Registration failed');
-      }
-
       // Registration successful - now log them in
-      const loginFormData = new FormData();
-      loginFormData.append('username', formData.username);
-      loginFormData.append('password', formData.password);
-
-      const loginResponse = await fetch('http://localhost:8000/api/auth/login', {
-        method: 'POST',
-        body: loginFormData,
-      });
-
-      if (loginResponse.ok) {
-        const loginData = await loginResponse.json();
+      try {
+        const loginData = await authApi.login(formData.username, formData.password);
         localStorage.setItem('token', loginData.access_token);
+        localStorage.setItem('refreshToken', loginData.refresh_token);
         navigate('/');
-      } else {
+      } catch {
         // Registration succeeded but login failed - redirect to login page
         navigate('/login');
       }
     } catch (err: any) {
-      setError(err.message || 'Failed to register');
+      setError(err.response?.data?.detail || err.message || 'Failed to register');
     } finally {
       setLoading(false);
     }
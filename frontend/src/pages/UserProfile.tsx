@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
+import { authApi, usersApi } from '../services/api';
 
 export default function UserProfile() {
   const { username } = useParams<{ username: string }>();
@@ -24,14 +25,8 @@ export default function UserProfile() {
 
   const fetchCurrentUser = async () => {
     try {
-      const token = localStorage.getItem('token');
-      const response = await fetch('http://localhost:8000/api/auth/me', {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
-      if (response.ok) {
-        const data = await response.json();
-        setCurrentUser(data);
-      }
+      const data = await authApi.getMe();
+      setCurrentUser(data);
     } catch (error) {
       console.error('Error fetching current user:', error);
     }
@@ -41,27 +36,19 @@ export default function UserProfile() {
     try {
       setLoading(true);
       setError('');
-      const token = localStorage.getItem('token');
       
       // Fetch user info
-      const userResponse = await fetch(`http://localhost:8000/api/users/${username}`, {
-        headers: token ? { 'Authorization': `Bearer ${token}` } : {}
-      });
-      
-      if (!userResponse.ok) {
+      try {
+        setUser(await usersApi.getOne(username!));
+      } catch {
         throw new Error('User not found');
       }
-      const userData = await userResponse.json();
-      setUser(userData);
 
       // Fetch user's pieces
-      const piecesResponse = await fetch(`http://localhost:8000/api/users/${username}/pieces`, {
-        headers: token ? { 'Authorization': `Bearer ${token}` } : {}
-      });
-      
-      if (piecesResponse.ok) {
-        const piecesData = await piecesResponse.json();
-        setPieces(piecesData);
+      try {
+        setPieces(await usersApi.getUserPieces(username!));
+      } catch (err) {
+        console.error('Error loading pieces:', err);
       }
     } catch (err: any) {
       setError(err.message || 'Failed to load user data');
@@ -70,8 +57,8 @@ export default function UserProfile() {
     }
   };
 
-  const handleLogout = () => {
-    localStorage.removeItem('token');
+  const handleLogout = async () => {
+    await authApi.logout();
     navigate('/login');
   };
 
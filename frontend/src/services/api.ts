@@ -8,6 +8,18 @@ const api = axios.create({
   baseURL: API_URL,
 });
 
+// After a write the API tells us (X-DB-Primary-Until) how long to read from
+// the primary database, so we see our own changes; we echo it back until then.
+// The cookie it also sets isn't sent cross-origin, so this header is what works.
+const PRIMARY_PIN_HEADER = 'X-DB-Primary-Until';
+let primaryPinnedUntil: string | null = null;
+
+const rememberPrimaryPin = (value: string | null | undefined) => {
+  if (value) {
+    primaryPinnedUntil = value;
+  }
+};
+
 // Add auth token to requests if it exists
 api.interceptors.request.use(
   (config) => {
@@ -15,6 +27,9 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (primaryPinnedUntil && parseFloat(primaryPinnedUntil) * 1000 > Date.now()) {
+      config.headers[PRIMARY_PIN_HEADER] = primaryPinnedUntil;
+    }
     return config;
   },
   (error) => {
@@ -22,6 +37,49 @@ api.interceptors.request.use(
   }
 );
 
+// Access tokens are short-lived: on a 401, swap the refresh token for a
+// new pair once and retry the request
+let refreshing: Promise<string | null> | null = null;
+
+const refreshAccessToken = async (): Promise<string | null> => {
+  const refreshToken = localStorage.getItem('refreshToken');
+  if (!refreshToken) {
+    return null;
+  }
+  try {
+    const response = await axios.post(`${API_URL}/auth/refresh`, { refresh_token: refreshToken });
+    localStorage.setItem('token', response.data.access_token);
+    localStorage.setItem('refreshToken', response.data.refresh_token);
+    return response.data.access_token;
+  } catch {
+    localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
+    return null;
+  }
+};
+
+api.interceptors.response.use(
+  (response) => {
+    rememberPrimaryPin(response.headers[PRIMARY_PIN_HEADER.toLowerCase()]);
+    return response;
+  },
+  async (error) => {
+    const original = error.config;
+    if (error.response?.status !== 401 || original._retried) {
+      return Promise.reject(error);
+    }
+    // Several requests can fail at once; they share a single refresh
+    refreshing = refreshing || refreshAccessToken().finally(() => { refreshing = null; });
+    const token = await refreshing;
+    if (!token) {
+      return Promise.reject(error);
+    }
+    original._retried = true;
+    original.headers.Authorization = `Bearer ${token}`;
+    return api(original);
+  }
+);
+
 // Auth endpoints
 export const authApi = {
   register: async (userData: {
@@ -43,6 +101,16 @@ export const authApi = {
     return response.data;
   },
 
+  logout: async () => {
+    try {
+      await api.post('/auth/logout', { refresh_token: localStorage.getItem('refreshToken') });
+    } catch {
+      // Already expired or revoked - clearing local state is enough
+    }
+    localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
+  },
+
   getMe: async () => {
     const response = await api.get('/auth/me');
     return response.data;
@@ -65,6 +133,12 @@ export const piecesApi = {
     return response.data;
   },
 
+  // Presigned upload straight to storage; 501 when the server stores images itself
+  createUpload: async (filename: string) => {
+    const response = await api.post('/pieces/uploads', { filename });
+    return response.data;
+  },
+
   getAll: async (params?: {
     skip?: number;
     limit?: number;
@@ -117,20 +191,52 @@ export const usersApi = {
 
 // Comments endpoints
 export const commentsApi = {
-  create: async (content: string, piece_id: number) => {
-    const response = await api.post('/comments/', { content, piece_id });
+  create: async (content: string, piece_id: number, parent_id?: number) => {
+    const response = await api.post('/comments/', { content, piece_id, parent_id });
     return response.data;
   },
 
-  getForPiece: async (piece_id: number, params?: { skip?: number; limit?: number }) => {
+  getForPiece: async (piece_id: number, params?: { skip?: number; limit?: number; replies_limit?: number }) => {
     const response = await api.get(`/comments/piece/${piece_id}`, { params });
     return response.data;
   },
 
+  getThread: async (comment_id: number) => {
+    const response = await api.get(`/comments/${comment_id}/thread`);
+    return response.data;
+  },
+
   delete: async (id: number) => {
     const response = await api.delete(`/comments/${id}`);
     return response.data;
   },
 };
 
+// Notifications endpoints
+export const notificationsApi = {
+  getAll: async (params?: { limit?: number; before_id?: number }) => {
+    const response = await api.get('/notifications/', { params });
+    return response.data;
+  },
+
+  getUnreadCount: async () => {
+    const response = await api.get('/notifications/unread-count');
+    return response.data;
+  },
+
+  markRead: async () => {
+    const response = await api.post('/notifications/read');
+    return response.data;
+  },
+};
+
+// Live like/comment updates (server-sent events). Returns a function that closes the stream.
+export const subscribeToPieces = (pieceIds: number[], onEvent: (event: any) => void) => {
+  const source = new EventSource(`${API_URL}/live/pieces?ids=${pieceIds.join(',')}`);
+  ['like', 'comment', 'comment_deleted', 'resync'].forEach((type) => {
+    source.addEventListener(type, (message) => onEvent(JSON.parse((message as MessageEvent).data)));
+  });
+  return () => source.close();
+};
+
 export default api;
\ No newline at end of file
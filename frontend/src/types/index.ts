@@ -11,6 +11,15 @@ export interface User {
   created_at: string;
 }
 
+// Public view of a user embedded in pieces and comments
+export interface UserSummary {
+  id: number;
+  username: string;
+  tag_name?: string;
+  crew?: string;
+  is_premium: boolean;
+}
+
 export interface Piece {
   id: number;
   title: string;
@@ -18,12 +27,15 @@ export interface Piece {
   piece_type: PieceType;
   surface: Surface;
   location?: string;
+  latitude?: number;
+  longitude?: number;
   is_public: boolean;
   image_url: string;
   thumbnail_url?: string;
   artist_id: number;
   created_at: string;
-  artist: User;
+  artist: UserSummary;
+  tags: string[];
 }
 
 export interface PieceWithStats extends Piece {
@@ -34,11 +46,18 @@ export interface PieceWithStats extends Piece {
 
 export interface Comment {
   id: number;
-  content: string;
-  author_id: number;
+  content: string;  // Empty, with no author, when the author deleted their account
+  author_id: number | null;
   piece_id: number;
+  parent_id?: number;
+  depth: number;
+  reply_count: number;
   created_at: string;
-  author: User;
+  author: UserSummary | null;
+}
+
+export interface CommentThread extends Comment {
+  replies: Comment[];
 }
 
 export type PieceType = 
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: cost per feed item of building and encoding the response.
+
+Compares the old path (copy piece.__dict__, build PieceWithStats(**dict),
+let FastAPI dump and re-validate it against response_model, then
+json.dumps) with the fast path in app/serialization.py (model_construct +
+pydantic-core dump_json). Uses in-memory ORM objects, so no database is
+needed:
+
+    cd backend
+    python ../scripts/bench_serialization.py --items 100 --rounds 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from pydantic import TypeAdapter  # noqa: E402
+from app import models, schemas, serialization  # noqa: E402
+
+def make_pieces(count: int) -> List[models.Piece]:
+    artists = [
+        models.User(
+            id=i, username=f"artist{i}", email=f"artist{i}@example.com", hashed_password="x",
+            tag_name=f"TAG{i}", crew="KTS", is_active=True, is_premium=False,
+            created_at=datetime(2024, 1, 1),
+        )
+        for i in range(10)
+    ]
+    tags = [models.Tag(id=i, name=name) for i, name in enumerate(["wildstyle", "nyc", "red"])]
+    return [
+        models.Piece(
+            id=i, title=f"Piece {i}", description="Burner on the north wall",
+            piece_type=models.PieceType.WILDSTYLE, surface=models.Surface.WALL,
+            location="Bushwick", latitude=40.69, longitude=-73.92, is_public=True,
+            image_url=f"/uploads/{i}.jpg", thumbnail_url=None,
+            artist_id=artists[i % 10].id, artist=artists[i % 10],
+            created_at=datetime(2024, 1, 1), tags=tags,
+        )
+        for i in range(count)
+    ]
+
+def old_path(pieces, adapter: TypeAdapter) -> bytes:
+    items = []
+    for piece in pieces:
+        piece_dict = piece.__dict__.copy()
+        piece_dict['likes_count'] = 12
+        piece_dict['comments_count'] = 3
+        piece_dict['is_liked_by_user'] = False
+        piece_dict['artist'] = piece.artist
+        piece_dict['tag_names'] = list(piece.tag_names)
+        items.append(schemas.PieceWithStats(**piece_dict))
+    # What FastAPI does with a returned model list and a response_model
+    validated = adapter.validate_python([item.model_dump() for item in items])
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+def fast_path(pieces) -> bytes:
+    artists = {}
+    items = []
+    for piece in pieces:
+        if piece.artist_id not in artists:
+            artists[piece.artist_id] = serialization.user_summary(piece.artist)
+        items.append(serialization.piece_with_stats(
+            piece, likes_count=12, comments_count=3, artist=artists[piece.artist_id]
+        ))
+    return serialization.json_response(List[schemas.PieceWithStats], items).body
+
+def measure(label: str, run, items: int, rounds: int) -> float:
+    run()  # Warm up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        run()
+    per_item_us = (time.perf_counter() - started) / (rounds * items) * 1e6
+    print(f"{label:<10} {per_item_us:8.1f} us/item")
+    return per_item_us
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100, help="Pieces per page")
+    parser.add_argument("--rounds", type=int, default=200, help="Pages to encode per measurement")
+    args = parser.parse_args()
+
+    pieces = make_pieces(args.items)
+    adapter = TypeAdapter(List[schemas.PieceWithStats])
+    assert json.loads(old_path(pieces, adapter)) == json.loads(fast_path(pieces)), "Paths disagree"
+
+    old = measure("old path", lambda: old_path(pieces, adapter), args.items, args.rounds)
+    fast = measure("fast path", lambda: fast_path(pieces), args.items, args.rounds)
+    print(f"{old / fast:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Local stand-in for database replication when developing with SQLite.
+
+Copies the primary SQLite file onto the replica file, once or on a loop,
+so DATABASE_REPLICA_URL routing and the lag check can be tried without a
+real replicated database:
+
+    DATABASE_URL=sqlite:///./primary.db DATABASE_REPLICA_URL=sqlite:///./replica.db \\
+        uvicorn app.main:app
+    python ../scripts/sync_sqlite_replica.py primary.db replica.db --interval 3
+
+A longer --interval than REPLICA_MAX_LAG_SECONDS makes the app fall back
+to the primary, which is an easy way to see the lag check at work.
+"""
+import argparse
+import sqlite3
+import time
+
+def sync(primary_path: str, replica_path: str):
+    """Copy the primary database onto the replica using SQLite's backup API"""
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("primary", help="Path to the primary SQLite file")
+    parser.add_argument("replica", help="Path to the replica SQLite file")
+    parser.add_argument("--interval", type=float, help="Keep syncing every N seconds")
+    args = parser.parse_args()
+
+    sync(args.primary, args.replica)
+    while args.interval:
+        time.sleep(args.interval)
+        sync(args.primary, args.replica)
+
+if __name__ == "__main__":
+    main()